@@ -3,7 +3,7 @@ from database.datasets.setup import SetupDatasetsDatabase
 from database.output.setup import SetupOutputDatabase
 from database.project.setup import SetupProjectDatabase
 from database.project.config import Project_config
-from database import soils
+from database import soils, lib as db_lib
 
 import sys
 import argparse
@@ -87,6 +87,6 @@ if __name__ == '__main__':
 		api = CreateProjectDb(args.db_file, args.db_file2, project_name, editor_version)
 		api.create()
 	elif args.db_type == "ssurgo_soils":
-		soils.db.init(args.db_file)
+		db_lib.init_db(soils.db, args.db_file, db_lib.REFERENCE_PROFILE)
 		api = soils.ImportSoils()
 		api.ssurgo(args.db_file2)
@@ -11,6 +11,8 @@ from database.datasets.setup import SetupDatasetsDatabase
 from database.datasets import init as ds_init, lum as ds_lum, base as ds_base, hru_parm_db as ds_hru_parm_db
 from database.datasets import definitions
 from helpers import utils
+from helpers.routing import RoutingGraph
+from helpers.element_runs import ElementRuns
 from .import_weather import WeatherImport
 from .import_gis_legacy import GisImport as GisImportLegacy
 
@@ -84,10 +86,12 @@ class GisImport(ExecutableApi):
 		self.gis_to_hru_ids = {}
 		self.gis_to_aqu_ids = {}
 		self.gis_to_deep_aqu_ids = {}
+		self.routing = None
 
 		if delete_existing and not self.config.imported_gis:
 			self.delete_existing()
 
+	@db_lib.timed('Importing GIS data')
 	def insert_default(self):
 		if not is_supported_version(self.config.gis_version):
 			legacy_api = GisImportLegacy(self.project_db_file, False, self.constant_ps, self.rollback_db)
@@ -138,6 +142,8 @@ class GisImport(ExecutableApi):
 							w_api = WeatherImport(self.project_db_file, False, False)
 							w_api.match_stations(70)
 
+					gis.Gis_fingerprint.save_all()
+
 					config = Project_config.get()
 					config.imported_gis = True
 					config.save()
@@ -355,19 +361,23 @@ class GisImport(ExecutableApi):
 				return curr_table.id
 		return None
 
-	def insert_routing_units(self):
+	def insert_routing_units(self, only=None, first_id=1):
 		"""
 		Insert routing unit SWAT+ tables from GIS database.
+		Pass only, a set of gis_lsus ids, to add just those routing units with ids from first_id.
 		"""
 		cnt = get_max_id(gis.Gis_lsus)
-		if routing_unit.Rout_unit_rtu.select().count() == 0:
+		if only is not None or routing_unit.Rout_unit_rtu.select().count() == 0:
 			topography = []
 			fields = []
 			rout_units = []
 			rout_unit_cons = []
 
-			i = 1
+			i = first_id
 			for row in gis.Gis_lsus.select().order_by(gis.Gis_lsus.id):
+				if only is not None and row.id not in only:
+					continue
+
 				self.gis_to_rtu_ids[row.id] = i
 
 				rtu_name = get_name('rtu', row.id, cnt)
@@ -429,65 +439,73 @@ class GisImport(ExecutableApi):
 	def insert_om_water(self):
 		db_lib.bulk_insert(self.project_db, init.Om_water_ini, init.Om_water_ini.get_default_data())
 
-	def insert_channels_lte(self):
+	def insert_channels_lte(self, only=None, first_id=1):
 		"""
 		Insert channel lte SWAT+ tables from GIS database.
+		Pass only, a set of gis_channels ids, to add just those channels with ids from first_id.
 		"""
 		cnt = get_max_id(gis.Gis_channels)
-		if channel.Channel_lte_cha.select().count() == 0:
-			init = channel.Initial_cha.create(
-				name='initcha1',
-				org_min=1
-			)
+		if only is not None or channel.Channel_lte_cha.select().count() == 0:
+			init = channel.Initial_cha.get_or_none(channel.Initial_cha.name == 'initcha1') if only is not None else None
+			if init is None:
+				init = channel.Initial_cha.create(
+					name='initcha1',
+					org_min=1
+				)
 
-			nut = channel.Nutrients_cha.create(
-				name='nutcha1',
-				plt_n=0,
-				ptl_p=0,
-				alg_stl=1,
-				ben_disp=0.05,
-				ben_nh3n=0.5,
-				ptln_stl=0.05,
-				ptlp_stl=0.05,
-				cst_stl=2.5,
-				ben_cst=2.5,
-				cbn_bod_co=1.71,
-				air_rt=50,
-				cbn_bod_stl=0.36,
-				ben_bod=2,
-				bact_die=2,
-				cst_decay=1.71,
-				nh3n_no2n=0.55,
-				no2n_no3n=1.1,
-				ptln_nh3n=0.21,
-				ptlp_solp=0.35,
-				q2e_lt=2,
-				q2e_alg=2,
-				chla_alg=50,
-				alg_n=0.08,
-				alg_p=0.015,
-				alg_o2_prod=1.6,
-				alg_o2_resp=2,
-				o2_nh3n=3.5,
-				o2_no2n=1.07,
-				alg_grow=2,
-				alg_resp=2.5,
-				slr_act=0.3,
-				lt_co=0.75,
-				const_n=0.02,
-				const_p=0.025,
-				lt_nonalg=1,
-				alg_shd_l=0.03,
-				alg_shd_nl=0.054,
-				nh3_pref=0.5
-			)
+			nut = channel.Nutrients_cha.get_or_none(channel.Nutrients_cha.name == 'nutcha1') if only is not None else None
+			if nut is None:
+				nut = channel.Nutrients_cha.create(
+					name='nutcha1',
+					plt_n=0,
+					ptl_p=0,
+					alg_stl=1,
+					ben_disp=0.05,
+					ben_nh3n=0.5,
+					ptln_stl=0.05,
+					ptlp_stl=0.05,
+					cst_stl=2.5,
+					ben_cst=2.5,
+					cbn_bod_co=1.71,
+					air_rt=50,
+					cbn_bod_stl=0.36,
+					ben_bod=2,
+					bact_die=2,
+					cst_decay=1.71,
+					nh3n_no2n=0.55,
+					no2n_no3n=1.1,
+					ptln_nh3n=0.21,
+					ptlp_solp=0.35,
+					q2e_lt=2,
+					q2e_alg=2,
+					chla_alg=50,
+					alg_n=0.08,
+					alg_p=0.015,
+					alg_o2_prod=1.6,
+					alg_o2_resp=2,
+					o2_nh3n=3.5,
+					o2_no2n=1.07,
+					alg_grow=2,
+					alg_resp=2.5,
+					slr_act=0.3,
+					lt_co=0.75,
+					const_n=0.02,
+					const_p=0.025,
+					lt_nonalg=1,
+					alg_shd_l=0.03,
+					alg_shd_nl=0.054,
+					nh3_pref=0.5
+				)
 
 			hydrology_chas = []
 			channel_chas = []
 			channel_cons = []
 
-			i = 1
+			i = first_id
 			for row in gis.Gis_channels.select().order_by(gis.Gis_channels.id):
+				if only is not None and row.id not in only:
+					continue
+
 				self.gis_to_cha_ids[row.id] = i
 
 				cha_name = get_name('cha', row.id, cnt)
@@ -761,7 +779,11 @@ class GisImport(ExecutableApi):
 
 		distinct_lu = gis.Gis_hrus.select(gis.Gis_hrus.landuse).where((gis.Gis_hrus.landuse.is_null(False)) & (gis.Gis_hrus.landuse != 'NULL')).distinct()
 		lus = [item.landuse.lower() for item in distinct_lu]
+		existing_lums = set(l.name for l in lum.Landuse_lum.select(lum.Landuse_lum.name))
 		for lu in lus:
+			if '{name}_lum'.format(name=lu) in existing_lums:
+				continue
+
 			try:
 				plant = hru_parm_db.Plants_plt.get(hru_parm_db.Plants_plt.name ** lu)
 				p_id = plant.id
@@ -889,33 +911,36 @@ class GisImport(ExecutableApi):
 
 		return lum_dict
 
-	def insert_hrus(self):
+	def insert_hrus(self, only=None, first_id=1):
 		"""
 		Insert hru_data.hru SWAT+ data from GIS database.
+		Pass only, a set of gis_hrus ids, to add just those HRUs with ids from first_id.
 		"""
 		lum_dict = self.insert_landuse()
 
-		# Create default nutrients.sol
-		nut = soils.Nutrients_sol.create(
-			name = 'soilnut1',
-			exp_co = 0.0005,
-			lab_p = 5,
-			nitrate = 7,
-			fr_hum_act = 0.02,
-			hum_c_n = 10,
-			hum_c_p = 80,
-			inorgp = 3.5,
-			watersol_p = 0.15,
-			h3a_p = 0.25,
-			mehlich_p = 1.2,
-			bray_strong_p = 0.85
-		)
-
-		sp = init.Soil_plant_ini.create(
-			name='soilplant1',
-			sw_frac=0,
-			nutrients=nut.id
-		)
+		sp = init.Soil_plant_ini.get_or_none(init.Soil_plant_ini.name == 'soilplant1') if only is not None else None
+		if sp is None:
+			# Create default nutrients.sol
+			nut = soils.Nutrients_sol.create(
+				name = 'soilnut1',
+				exp_co = 0.0005,
+				lab_p = 5,
+				nitrate = 7,
+				fr_hum_act = 0.02,
+				hum_c_n = 10,
+				hum_c_p = 80,
+				inorgp = 3.5,
+				watersol_p = 0.15,
+				h3a_p = 0.25,
+				mehlich_p = 1.2,
+				bray_strong_p = 0.85
+			)
+
+			sp = init.Soil_plant_ini.create(
+				name='soilplant1',
+				sw_frac=0,
+				nutrients=nut.id
+			)
 
 		hyds = []
 		hrus = []
@@ -927,187 +952,134 @@ class GisImport(ExecutableApi):
 		wetlands = []
 		hyd_wets = []
 
+		hru_soils = self.get_hru_soils()
+		hyd_calcs = {}
+		slope_lens = {}
+		wetland_lu = ['wehb', 'wetf', 'wetl', 'wetn', 'wewo', 'watr', 'playa', 'wetw', 'wetm']
+
 		bsn_area = gis.Gis_subbasins.select(fn.Sum(gis.Gis_subbasins.area)).scalar()
 
 		cnt = get_max_id(gis.Gis_hrus)
-		topo_id = hydrology.Topography_hyd.select().count() + 1
-		i = 1
-		wi = 1
-		for row in gis.Gis_hrus.select():
-			hru_name = get_name('hru', row.id, cnt)
-
-			soil = soils.Soils_sol.get_or_none(soils.Soils_sol.name == row.soil)
-			if soil is None:
-				raise ValueError('Soil "{s}" does not exist in your soils_sol table. Check your project in GIS and make '
-								 'sure all soils from the gis_hrus table exist in soils_sol.'.format(s=row.soil))
-
-			hyd_calc = hydrology.Hydrology_hyd.get_perco_cn3_swf_latq_co(soil.hyd_grp, row.slope / 100)
-
-			hyd = {
-				'id': i,
-				'name': get_name('hyd', row.id, cnt),
-				'lat_ttime': 0.00,
-				'lat_sed': 0.00,
-				'can_max': 1.00,
-				'esco': 0.95,
-				'epco': 1.00,
-				'orgn_enrich': 0.00,
-				'orgp_enrich': 0.00,
-				'cn3_swf': hyd_calc['cn3_swf'],
-				'bio_mix': 0.20,
-				'perco': hyd_calc['perco'],
-				'lat_orgn': 0.00,
-				'lat_orgp': 0.00,
-				'harg_pet': 0.00,
-				'latq_co': hyd_calc['latq_co']
-			}
-			hyds.append(hyd)
-
-			slp_len = self.get_slope_len(row.slope)
-
-			topo = {
-				'id': topo_id,
-				'name': get_name('topohru', row.id, cnt),
-				'slp': row.slope / 100,
-				'slp_len': slp_len,
-				'lat_len': slp_len,
-				'dist_cha': 121.0,
-				'depos': 0,
-				'type': 'hru'
-			}
-			topos.append(topo)
-
-			wetland_lu = ['wehb', 'wetf', 'wetl', 'wetn', 'wewo', 'watr', 'playa', 'wetw', 'wetm']
-
-			lowercase_landuse = None if row.landuse is None else row.landuse.lower()
-
-			if lowercase_landuse in wetland_lu:
-				if wi == 1:
+		topo_id = (get_max_id(hydrology.Topography_hyd) or 0) + 1
+		i = first_id
+		wi = 1 if only is None else max(get_max_id(reservoir.Wetland_wet) or 0, get_max_id(reservoir.Hydrology_wet) or 0) + 1
+		winit = wnut = wsed = None
+		res_rel_id = None
+		query = gis.Gis_hrus.select(gis.Gis_hrus.id, gis.Gis_hrus.lsu, gis.Gis_hrus.arlsu, gis.Gis_hrus.landuse, gis.Gis_hrus.soil,
+			gis.Gis_hrus.arslp, gis.Gis_hrus.slope, gis.Gis_hrus.lat, gis.Gis_hrus.lon, gis.Gis_hrus.elev).tuples()
+		for gis_id, lsu, arlsu, landuse, soil, arslp, slope, lat, lon, elev in query:
+			if only is not None and gis_id not in only:
+				continue
+
+			hru_name = get_name('hru', gis_id, cnt)
+			soil_id, hyd_grp = hru_soils[soil]
+
+			# HRUs only differ in hydrology by soil group and slope, so each combination is calculated once
+			hyd_key = (hyd_grp, slope)
+			hyd_calc = hyd_calcs.get(hyd_key)
+			if hyd_calc is None:
+				hyd_calc = hydrology.Hydrology_hyd.get_perco_cn3_swf_latq_co(hyd_grp, slope / 100)
+				hyd_calcs[hyd_key] = hyd_calc
+
+			hyds.append((i, get_name('hyd', gis_id, cnt), 0.00, 0.00, 1.00, 0.95, 1.00, 0.00, 0.00,
+				hyd_calc['cn3_swf'], 0.20, hyd_calc['perco'], 0.00, 0.00, 0.00, hyd_calc['latq_co']))
+
+			slp_len = slope_lens.get(slope)
+			if slp_len is None:
+				slp_len = self.get_slope_len(slope)
+				slope_lens[slope] = slp_len
+
+			topos.append((topo_id, get_name('topohru', gis_id, cnt), slope / 100, slp_len, slp_len, 121.0, 0, 'hru'))
+
+			lowercase_landuse = None if landuse is None else landuse.lower()
+			is_wetland = lowercase_landuse in wetland_lu
+
+			if is_wetland:
+				if winit is None:
 					res_rel = decision_table.D_table_dtl.get_or_none(decision_table.D_table_dtl.name == 'wetland')
-					res_rel_id = None
 					if res_rel is not None:
 						res_rel_id = res_rel.id
 
-					winit = reservoir.Initial_res.create(
-						name='initwet1',
-						org_min=1
-					)
+					if only is not None:
+						winit = reservoir.Initial_res.get_or_none(reservoir.Initial_res.name == 'initwet1')
+						wnut = reservoir.Nutrients_res.get_or_none(reservoir.Nutrients_res.name == 'nutwet1')
+						wsed = reservoir.Sediment_res.get_or_none(reservoir.Sediment_res.name == 'sedwet1')
 
-					wnut = reservoir.Nutrients_res.create(
-						name='nutwet1',
-						mid_start=5,
-						mid_end=10,
-						mid_n_stl=5.5,
-						n_stl=5.5,
-						mid_p_stl=10,
-						p_stl=10,
-						chla_co=1,
-						secchi_co=1,
-						theta_n=1,
-						theta_p=1,
-						n_min_stl=0.1,
-						p_min_stl=0.01
-					)
+					if winit is None:
+						winit = reservoir.Initial_res.create(
+							name='initwet1',
+							org_min=1
+						)
 
-					wsed = reservoir.Sediment_res.create(
-						name='sedwet1',
-						sed_amt=1,
-						d50=10,
-						carbon=0,
-						bd=0,
-						sed_stl=1,
-						stl_vel=1
-					)
-				
-				hyd_wet = {
-					'id': wi,
-					'name': get_name('hydwet', row.id, cnt),
-					'hru_ps': 0.1,
-					'dp_ps': 20,
-					'hru_es': 0.25,
-					'dp_es': 100,
-					'k': 0.01,
-					'evap': 0.7,
-					'vol_area_co': 1,
-					'vol_dp_a': 1,
-					'vol_dp_b': 1,
-					'hru_frac': 0.5
-				}
-				hyd_wets.append(hyd_wet)
-
-				wet = {
-					'id': wi,
-					'name': get_name('wet', row.id, cnt),
-					'init': winit.id,
-					'hyd': wi,
-					'rel': res_rel_id,
-					'sed': wsed.id,
-					'nut': wnut.id
-				}
-				wetlands.append(wet)
-				wi += 1
+					if wnut is None:
+						wnut = reservoir.Nutrients_res.create(
+							name='nutwet1',
+							mid_start=5,
+							mid_end=10,
+							mid_n_stl=5.5,
+							n_stl=5.5,
+							mid_p_stl=10,
+							p_stl=10,
+							chla_co=1,
+							secchi_co=1,
+							theta_n=1,
+							theta_p=1,
+							n_min_stl=0.1,
+							p_min_stl=0.01
+						)
 
-			hru_data = {
-				'id': i,
-				'name': hru_name,
-				'topo': topo_id,
-				'hydro': i,
-				'lu_mgt': lum_dict.get(lowercase_landuse, None),
-				'soil_plant_init': sp.id,
-				'snow': 1,
-				'surf_stor': wi-1 if lowercase_landuse in wetland_lu else None,
-				'soil': soil.id
-			}
+					if wsed is None:
+						wsed = reservoir.Sediment_res.create(
+							name='sedwet1',
+							sed_amt=1,
+							d50=10,
+							carbon=0,
+							bd=0,
+							sed_stl=1,
+							stl_vel=1
+						)
 
-			hrus.append(hru_data)
-			topo_id += 1
+				hyd_wets.append((wi, get_name('hydwet', gis_id, cnt), 0.1, 20, 0.25, 100, 0.01, 0.7, 1, 1, 1, 0.5))
+				wetlands.append((wi, get_name('wet', gis_id, cnt), winit.id, wi, res_rel_id, wsed.id, wnut.id))
+				wi += 1
 
-			con = {
-				'id': i,
-				'hru': i,
-				'name': hru_name,
-				'gis_id': row.id,
-				'elev': row.elev,
-				'lat': row.lat,
-				'lon': row.lon,
-				'area': row.arslp,
-				'ovfl': 0,
-				'rule': 0
-			}
-			hru_cons.append(con)
+			hrus.append((i, hru_name, topo_id, i, lum_dict.get(lowercase_landuse, None), sp.id, 1, wi-1 if is_wetland else None, soil_id))
+			topo_id += 1
 
-			elem_sub = {
-				'id': i,
-				'name': hru_name,
-				'rtu': self.gis_to_rtu_ids[row.lsu],
-				'obj_typ': 'hru',
-				'obj_id': i,
-				'frac': row.arslp / row.arlsu
-			}
-			elem_subs.append(elem_sub)
+			hru_cons.append((i, i, hru_name, gis_id, elev, lat, lon, arslp, 0, 0))
 
-			lsu_ele = {
-				'id': i,
-				'name': hru_name,
-				'obj_typ': 'hru',
-				'obj_typ_no': i,
-				'bsn_frac': row.arslp / bsn_area,
-				'sub_frac': row.arslp / row.arlsu,
-				'reg_frac': 0,
-				'ls_unit_def': self.gis_to_rtu_ids[row.lsu]
-			}
-			lsu_eles.append(lsu_ele)
+			rtu_id = self.gis_to_rtu_ids[lsu]
+			elem_subs.append((i, hru_name, rtu_id, 'hru', i, arslp / arlsu))
+			lsu_eles.append((i, hru_name, 'hru', i, arslp / bsn_area, arslp / arlsu, 0, rtu_id))
 
 			i += 1
 
-		db_lib.bulk_insert(self.project_db, hydrology.Hydrology_hyd, hyds)
-		db_lib.bulk_insert(self.project_db, hydrology.Topography_hyd, topos)
-		db_lib.bulk_insert(self.project_db, hru.Hru_data_hru, hrus)
-		db_lib.bulk_insert(self.project_db, connect.Hru_con, hru_cons)
-		db_lib.bulk_insert(self.project_db, connect.Rout_unit_ele, elem_subs)
-		db_lib.bulk_insert(self.project_db, regions.Ls_unit_ele, lsu_eles)
-		db_lib.bulk_insert(self.project_db, reservoir.Hydrology_wet, hyd_wets)
-		db_lib.bulk_insert(self.project_db, reservoir.Wetland_wet, wetlands)
+		db_lib.bulk_load(self.project_db, hydrology.Hydrology_hyd, ['id', 'name', 'lat_ttime', 'lat_sed', 'can_max', 'esco', 'epco', 'orgn_enrich', 'orgp_enrich',
+			'cn3_swf', 'bio_mix', 'perco', 'lat_orgn', 'lat_orgp', 'harg_pet', 'latq_co'], hyds)
+		db_lib.bulk_load(self.project_db, hydrology.Topography_hyd, ['id', 'name', 'slp', 'slp_len', 'lat_len', 'dist_cha', 'depos', 'type'], topos)
+		db_lib.bulk_load(self.project_db, hru.Hru_data_hru, ['id', 'name', 'topo_id', 'hydro_id', 'lu_mgt_id', 'soil_plant_init_id', 'snow_id', 'surf_stor_id', 'soil_id'], hrus)
+		db_lib.bulk_load(self.project_db, connect.Hru_con, ['id', 'hru_id', 'name', 'gis_id', 'elev', 'lat', 'lon', 'area', 'ovfl', 'rule'], hru_cons)
+		db_lib.bulk_load(self.project_db, connect.Rout_unit_ele, ['id', 'name', 'rtu_id', 'obj_typ', 'obj_id', 'frac'], elem_subs)
+		db_lib.bulk_load(self.project_db, regions.Ls_unit_ele, ['id', 'name', 'obj_typ', 'obj_typ_no', 'bsn_frac', 'sub_frac', 'reg_frac', 'ls_unit_def_id'], lsu_eles)
+		db_lib.bulk_load(self.project_db, reservoir.Hydrology_wet, ['id', 'name', 'hru_ps', 'dp_ps', 'hru_es', 'dp_es', 'k', 'evap', 'vol_area_co', 'vol_dp_a', 'vol_dp_b', 'hru_frac'], hyd_wets)
+		db_lib.bulk_load(self.project_db, reservoir.Wetland_wet, ['id', 'name', 'init_id', 'hyd_id', 'rel_id', 'sed_id', 'nut_id'], wetlands)
+
+	def get_hru_soils(self):
+		"""
+		Id and hydrologic group of each soil used in gis_hrus, keyed by soil name.
+		"""
+		all_soils = {}
+		for id, name, hyd_grp in soils.Soils_sol.select(soils.Soils_sol.id, soils.Soils_sol.name, soils.Soils_sol.hyd_grp).tuples():
+			all_soils[name] = (id, hyd_grp)
+
+		hru_soils = {}
+		for (name,) in gis.Gis_hrus.select(gis.Gis_hrus.soil).distinct().tuples():
+			if name not in all_soils:
+				raise ValueError('Soil "{s}" does not exist in your soils_sol table. Check your project in GIS and make '
+								 'sure all soils from the gis_hrus table exist in soils_sol.'.format(s=name))
+			hru_soils[name] = all_soils[name]
+
+		return hru_soils
 
 	def insert_hru_ltes(self):
 		distinct_lu = gis.Gis_hrus.select(gis.Gis_hrus.landuse).where((gis.Gis_hrus.landuse.is_null(False)) & (gis.Gis_hrus.landuse != 'NULL')).distinct()
@@ -1262,20 +1234,29 @@ class GisImport(ExecutableApi):
 		db_lib.bulk_insert(self.project_db, connect.Hru_lte_con, hru_cons)
 		db_lib.bulk_insert(self.project_db, regions.Ls_unit_ele, lsu_eles)
 
-	def insert_aquifers(self):
+	def insert_aquifers(self, only=None, only_deep=None, first_id=1):
+		"""
+		Insert aquifer SWAT+ tables from GIS database.
+		Pass only and only_deep, sets of gis_aquifers and gis_deep_aquifers ids, to add just those aquifers with ids from first_id.
+		"""
 		cnt = get_max_id(gis.Gis_aquifers)
 		cnt_dp = get_max_id(gis.Gis_deep_aquifers)
-		if aquifer.Aquifer_aqu.select().count() == 0:
-			init_aqu = aquifer.Initial_aqu.create(
-				name='initaqu1',
-				org_min=1
-			)
+		if only is not None or aquifer.Aquifer_aqu.select().count() == 0:
+			init_aqu = aquifer.Initial_aqu.get_or_none(aquifer.Initial_aqu.name == 'initaqu1') if only is not None else None
+			if init_aqu is None:
+				init_aqu = aquifer.Initial_aqu.create(
+					name='initaqu1',
+					org_min=1
+				)
 
 			aquifer_aqus = []
 			aquifer_cons = []
 
-			i = 1
+			i = first_id
 			for row in gis.Gis_aquifers.select().order_by(gis.Gis_aquifers.id):
+				if only is not None and row.id not in only:
+					continue
+
 				self.gis_to_aqu_ids[row.id] = i
 
 				aqu_name = get_name('aqu', row.id, cnt)
@@ -1296,6 +1277,9 @@ class GisImport(ExecutableApi):
 				i += 1
 
 			for row in gis.Gis_deep_aquifers.select().order_by(gis.Gis_deep_aquifers.id):
+				if only_deep is not None and row.id not in only_deep:
+					continue
+
 				self.gis_to_deep_aqu_ids[row.id] = i
 
 				aqu_name = get_name('aqu_deep', row.id, cnt)
@@ -1337,10 +1321,10 @@ class GisImport(ExecutableApi):
 
 		# Send 100% HRU to channel
 		hru_con_outs = []
-		rows = gis.Gis_routing.select().where((gis.Gis_routing.sourcecat == RouteCat.HRU) 
-				& (gis.Gis_routing.percent > 0) 
-				& (gis.Gis_routing.sinkcat == RouteCat.CH)).order_by(gis.Gis_routing.sourceid)
+		rows = self.get_routing().routes_by_source([RouteCat.HRU])
 		for row in rows:
+			if row.sinkcat != RouteCat.CH:
+				continue
 			hru_con_outs.append({
 				'hru_lte_con': self.gis_to_hru_ids[row.sourceid],
 				'order': 1,
@@ -1351,7 +1335,18 @@ class GisImport(ExecutableApi):
 			})
 		db_lib.bulk_insert(self.project_db, connect.Hru_lte_con_out, hru_con_outs)
 
-	def get_connections(self, sourcecats, attach_key, id_list, is_lte=False):
+	def get_routing(self):
+		"""
+		gis_routing loaded once for all connection tables.
+		"""
+		if self.routing is None:
+			self.routing = RoutingGraph.load(gis.Gis_routing, RouteCat.PT)
+		return self.routing
+
+	def get_connections(self, sourcecats, attach_key, id_list, is_lte=False, source_ids=None):
+		"""
+		Connection rows of all objects of the given routing categories, or only those in source_ids (gis ids) when given.
+		"""
 		con_outs = []
 
 		cats_to_obj_typ = {
@@ -1389,16 +1384,13 @@ class GisImport(ExecutableApi):
 				RouteCat.CH
 			]
 
-		rows = gis.Gis_routing.select().where((gis.Gis_routing.sourcecat << sourcecats) 
-				& (gis.Gis_routing.percent > 0) 
-				& (gis.Gis_routing.sinkcat != RouteCat.OUTLET)).order_by(gis.Gis_routing.sourceid)
-
+		routing = self.get_routing()
 		orders = dict()
-		for row in rows:
-			con_row = row
-			while con_row.sinkcat == RouteCat.PT:
-				con_row = gis.Gis_routing.get_or_none((gis.Gis_routing.sourcecat == RouteCat.PT) & (gis.Gis_routing.sourceid == con_row.sinkid))
-			
+		for row in routing.routes_by_source(sourcecats):
+			if row.sinkcat == RouteCat.OUTLET or (source_ids is not None and row.sourceid not in source_ids):
+				continue
+
+			con_row = routing.end_of(row)
 			if con_row is not None and con_row.sinkcat in supported_sinkcats:
 				id = id_list[row.sourceid]
 				if id in orders:
@@ -1429,10 +1421,11 @@ class GisImport(ExecutableApi):
 			if bsn_area <= 0:
 				raise ValueError('Project watershed area cannot be zero. Error summing HRU areas.')
 
+			with_elements = ElementRuns.load(connect.Rout_unit_ele, 'rtu_id', 'obj_id').def_ids()
 			for row in connect.Rout_unit_con.select().order_by(connect.Rout_unit_con.id):
-				if connect.Rout_unit_ele.select().where(connect.Rout_unit_ele.rtu_id == row.rtu.id).count() > 0:
+				if row.rtu_id in with_elements:
 					lsu_def = {
-						'id': row.rtu.id,
+						'id': row.rtu_id,
 						'name': row.name,
 						'area': row.area
 					}
@@ -1446,10 +1439,11 @@ class GisImport(ExecutableApi):
 			lsu_defs = []
 
 			cnt = get_max_id(gis.Gis_lsus)
+			with_hrus = ElementRuns.load(gis.Gis_hrus, 'lsu', 'id').def_ids()
 			i = 1
 			for row in gis.Gis_lsus.select().order_by(gis.Gis_lsus.id):
 				self.gis_to_rtu_ids[row.id] = i
-				if gis.Gis_hrus.select().where(gis.Gis_hrus.lsu == row.id).count() > 0:
+				if row.id in with_hrus:
 					lsu_def = {
 						'id': i,
 						'name': get_name('lsu', row.id, cnt),
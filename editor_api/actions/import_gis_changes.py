@@ -0,0 +1,362 @@
+from helpers.executable_api import Unbuffered
+from helpers.element_runs import ElementRuns
+from database import lib as db_lib
+from database.project import gis, routing_unit, channel, connect, aquifer, hydrology, hru, reservoir, regions, climate
+from database.project.setup import SetupProjectDatabase
+from .import_gis import GisImport, RouteCat, is_supported_version, min_gis_version, get_max_id
+from .import_weather import get_station_index, update_closest_lat_lon
+
+from peewee import *
+from collections import namedtuple
+
+import sys, traceback
+import argparse
+
+Changes = namedtuple('Changes', ['inserted', 'updated', 'deleted'])
+NO_CHANGES = Changes(set(), set(), set())
+
+# Changes to these tables are not applied in place; they re-import all GIS data
+FULL_IMPORT_TABLES = ['gis_water', 'gis_points']
+
+CON_OUT_TABLES = [
+	connect.Hru_con_out, connect.Hru_lte_con_out, connect.Rout_unit_con_out, connect.Modflow_con_out,
+	connect.Aquifer_con_out, connect.Aquifer2d_con_out, connect.Channel_con_out, connect.Reservoir_con_out,
+	connect.Recall_con_out, connect.Exco_con_out, connect.Delratio_con_out, connect.Outlet_con_out, connect.Chandeg_con_out
+]
+
+
+def get_changes(old, new):
+	"""
+	Inserted, updated and deleted gis ids of each table, from the fingerprints of the last import and the current ones.
+	"""
+	changes = {}
+	for table_name in set(old) | set(new):
+		old_rows = old.get(table_name, {})
+		new_rows = new.get(table_name, {})
+		changes[table_name] = Changes(
+			set(id for id in new_rows if id not in old_rows),
+			set(id for id, fingerprint in new_rows.items() if id in old_rows and old_rows[id] != fingerprint),
+			set(id for id in old_rows if id not in new_rows))
+	return changes
+
+
+def get_next_id(*tables):
+	return max(get_max_id(t) or 0 for t in tables) + 1
+
+
+class GisChangesImport(GisImport):
+	"""
+	Re-import a project from GIS by applying only the gis_* rows QSWAT+ added, changed or removed since the last import.
+
+	Editor rows of unchanged objects are left as they are, so user edits to them are kept. Changed objects are
+	removed and imported again with new ids, and references to them from unchanged objects follow the new ids.
+	Connections are only rebuilt for objects whose routing changed. Projects that cannot be updated in place are
+	re-imported in full.
+	"""
+	def __init__(self, project_db_file, constant_ps=True, rollback_db=None):
+		super().__init__(project_db_file, False, constant_ps, rollback_db)
+
+	def reimport(self):
+		new = gis.Gis_fingerprint.compute()
+		old = gis.Gis_fingerprint.load()
+		changes = get_changes(old, new)
+
+		reason = self.get_full_import_reason(old, changes)
+		if reason is not None:
+			self.emit_progress(10, '{}, re-importing all GIS data...'.format(reason))
+			self.delete_existing()
+			self.config.imported_gis = False
+			self.insert_default()
+			return
+
+		self.emit_progress(10, 'Re-importing changed GIS data...')
+		try:
+			with self.project_db.atomic():
+				self.apply_changes(changes)
+				gis.Gis_fingerprint.save_all(new)
+		except Exception:
+			if self.rollback_db is not None:
+				SetupProjectDatabase.rollback(self.project_db_file, self.rollback_db)
+			sys.exit(traceback.format_exc())
+
+	def get_full_import_reason(self, old, changes):
+		if not self.config.imported_gis:
+			return 'GIS data has not been imported yet'
+		if not is_supported_version(self.config.gis_version):
+			return 'Changes can only be re-imported from QSWAT+ {}.{} or later'.format(min_gis_version // 10, min_gis_version % 10)
+		if self.is_lte or hru.Hru_lte_hru.select().count() > 0:
+			return 'Changes cannot be re-imported in SWAT+ lte projects'
+		if len(old) == 0:
+			return 'The last GIS import was not recorded'
+		for table_name in FULL_IMPORT_TABLES:
+			if any(changes.get(table_name, NO_CHANGES)):
+				return '{} changed'.format(table_name)
+		return None
+
+	def apply_changes(self, changes):
+		lsus = changes.get('gis_lsus', NO_CHANGES)
+		chas = changes.get('gis_channels', NO_CHANGES)
+		aqus = changes.get('gis_aquifers', NO_CHANGES)
+		deep_aqus = changes.get('gis_deep_aquifers', NO_CHANGES)
+		hrus = changes.get('gis_hrus', NO_CHANGES)
+		self.load_id_maps()
+
+		self.remove_hrus(hrus.updated | hrus.deleted)
+		old_rtu_ids = self.remove_routing_units(lsus)
+		old_cha_ids = self.remove_channels(chas)
+		old_aqu_ids = self.remove_aquifers(aqus, self.gis_to_aqu_ids)
+		old_aqu_ids.update(self.remove_aquifers(deep_aqus, self.gis_to_deep_aqu_ids))
+
+		if any(lsus):
+			self.insert_routing_units(lsus.inserted | lsus.updated, get_next_id(hydrology.Topography_hyd, hydrology.Field_fld, routing_unit.Rout_unit_rtu, connect.Rout_unit_con))
+		if any(chas):
+			self.insert_channels_lte(chas.inserted | chas.updated, get_next_id(channel.Hyd_sed_lte_cha, channel.Channel_lte_cha, connect.Chandeg_con))
+		if any(aqus) or any(deep_aqus):
+			self.insert_aquifers(aqus.inserted | aqus.updated, deep_aqus.inserted | deep_aqus.updated, get_next_id(aquifer.Aquifer_aqu, connect.Aquifer_con))
+
+		new_rtu_ids = {g: self.gis_to_rtu_ids[g] for g in lsus.updated}
+		rtu_pairs = [(old_rtu_ids[g], new_rtu_ids[g]) for g in lsus.updated]
+		db_lib.bulk_replace(self.project_db, connect.Rout_unit_ele, 'rtu_id', rtu_pairs)
+		db_lib.bulk_replace(self.project_db, regions.Ls_unit_ele, 'ls_unit_def_id', rtu_pairs)
+		db_lib.bulk_replace(self.project_db, regions.Ls_unit_def, 'id', rtu_pairs)
+		self.remap_con_outs('ru', rtu_pairs)
+		self.remap_con_outs('sdc', [(old_cha_ids[g], self.gis_to_cha_ids[g]) for g in chas.updated])
+		self.remap_con_outs('aqu', [(old_aqu_ids[('gis_aquifers', g)], self.gis_to_aqu_ids[g]) for g in aqus.updated] +
+			[(old_aqu_ids[('gis_deep_aquifers', g)], self.gis_to_deep_aqu_ids[g]) for g in deep_aqus.updated])
+
+		if any(hrus):
+			self.insert_hrus(hrus.inserted | hrus.updated, get_next_id(hydrology.Hydrology_hyd, hru.Hru_data_hru, connect.Hru_con, connect.Rout_unit_ele, regions.Ls_unit_ele))
+
+		self.update_connections(changes)
+		self.update_lsu_definitions(set(self.gis_to_rtu_ids[g] for g in lsus.inserted | lsus.updated))
+		if any(changes.get('gis_subbasins', NO_CHANGES)):
+			self.update_basin_fractions()
+
+		if climate.Weather_sta_cli.select().count() > 0:
+			index = get_station_index('weather_sta_cli')
+			for table_name in ['rout_unit_con', 'chandeg_con', 'aquifer_con', 'hru_con']:
+				update_closest_lat_lon(table_name, 'wst_id', 'weather_sta_cli', index=index, only_missing=True)
+
+	def load_id_maps(self):
+		"""
+		Editor ids of the objects imported last time, from the gis_id of their connection rows.
+		"""
+		self.gis_to_rtu_ids = self.get_gis_ids(connect.Rout_unit_con)
+		self.gis_to_cha_ids = self.get_gis_ids(connect.Chandeg_con)
+		self.gis_to_res_ids = self.get_gis_ids(connect.Reservoir_con)
+		self.gis_to_hru_ids = self.get_gis_ids(connect.Hru_con)
+		self.gis_to_aqu_ids = {}
+		self.gis_to_deep_aqu_ids = {}
+		for gis_id, id, name in self.project_db.execute_sql('SELECT gis_id, id, name FROM aquifer_con WHERE gis_id IS NOT NULL'):
+			if name.startswith('aqu_deep'):
+				self.gis_to_deep_aqu_ids[gis_id] = id
+			else:
+				self.gis_to_aqu_ids[gis_id] = id
+
+	def get_gis_ids(self, con_table):
+		cursor = self.project_db.execute_sql('SELECT gis_id, id FROM "{}" WHERE gis_id IS NOT NULL'.format(con_table._meta.table_name))
+		return dict(cursor.fetchall())
+
+	def pop_ids(self, id_map, gis_ids):
+		return {g: id_map.pop(g) for g in gis_ids if g in id_map}
+
+	def get_related_ids(self, sql, con_ids):
+		"""
+		Columns of sql, a query whose first column is a connection id, as one list of non-null ids per column for the rows of con_ids.
+		"""
+		con_ids = set(con_ids)
+		rows = [row[1:] for row in self.project_db.execute_sql(sql) if row[0] in con_ids]
+		return [[id for id in column if id is not None] for column in zip(*rows)] if len(rows) > 0 else []
+
+	def remove_hrus(self, gis_ids):
+		con_ids = list(self.pop_ids(self.gis_to_hru_ids, gis_ids).values())
+		if len(con_ids) < 1:
+			return
+
+		hru_ids, topo_ids, hydro_ids, wet_ids, wet_hyd_ids = self.get_related_ids(
+			'SELECT c.id, h.id, h.topo_id, h.hydro_id, h.surf_stor_id, w.hyd_id FROM hru_con c '
+			'LEFT JOIN hru_data_hru h ON h.id = c.hru_id LEFT JOIN wetland_wet w ON w.id = h.surf_stor_id', con_ids)
+
+		db = self.project_db
+		db_lib.bulk_delete(db, hydrology.Topography_hyd, 'id', topo_ids)
+		db_lib.bulk_delete(db, hydrology.Hydrology_hyd, 'id', hydro_ids)
+		db_lib.bulk_delete(db, reservoir.Hydrology_wet, 'id', wet_hyd_ids)
+		db_lib.bulk_delete(db, reservoir.Wetland_wet, 'id', wet_ids)
+		db_lib.bulk_delete(db, hru.Hru_data_hru, 'id', hru_ids)
+		db_lib.bulk_delete(db, connect.Hru_con_out, 'hru_con_id', con_ids)
+		db_lib.bulk_delete(db, connect.Hru_con, 'id', con_ids)
+		db_lib.bulk_delete(db, connect.Rout_unit_ele, 'obj_id', con_ids, "obj_typ = 'hru'")
+		db_lib.bulk_delete(db, regions.Ls_unit_ele, 'obj_typ_no', con_ids, "obj_typ = 'hru'")
+
+	def remove_routing_units(self, changes):
+		"""
+		Remove changed and deleted routing units.
+		:return: old ids of the changed ones, by gis id
+		"""
+		old_ids = self.pop_ids(self.gis_to_rtu_ids, changes.updated)
+		deleted_ids = list(self.pop_ids(self.gis_to_rtu_ids, changes.deleted).values())
+		con_ids = list(old_ids.values()) + deleted_ids
+		if len(con_ids) < 1:
+			return old_ids
+
+		rtu_ids, topo_ids, field_ids = self.get_related_ids(
+			'SELECT c.id, r.id, r.topo_id, r.field_id FROM rout_unit_con c LEFT JOIN rout_unit_rtu r ON r.id = c.rtu_id', con_ids)
+
+		db = self.project_db
+		db_lib.bulk_delete(db, hydrology.Topography_hyd, 'id', topo_ids)
+		db_lib.bulk_delete(db, hydrology.Field_fld, 'id', field_ids)
+		db_lib.bulk_delete(db, routing_unit.Rout_unit_rtu, 'id', rtu_ids)
+		db_lib.bulk_delete(db, connect.Rout_unit_con_out, 'rtu_con_id', con_ids)
+		db_lib.bulk_delete(db, connect.Rout_unit_con, 'id', con_ids)
+
+		db_lib.bulk_delete(db, connect.Rout_unit_ele, 'rtu_id', deleted_ids)
+		db_lib.bulk_delete(db, regions.Ls_unit_ele, 'ls_unit_def_id', deleted_ids)
+		db_lib.bulk_delete(db, regions.Ls_unit_def, 'id', deleted_ids)
+		self.remove_con_outs_to('ru', deleted_ids)
+		return old_ids
+
+	def remove_channels(self, changes):
+		"""
+		Remove changed and deleted channels.
+		:return: old ids of the changed ones, by gis id
+		"""
+		old_ids = self.pop_ids(self.gis_to_cha_ids, changes.updated)
+		deleted_ids = list(self.pop_ids(self.gis_to_cha_ids, changes.deleted).values())
+		con_ids = list(old_ids.values()) + deleted_ids
+		if len(con_ids) < 1:
+			return old_ids
+
+		cha_ids, hyd_ids = self.get_related_ids(
+			'SELECT c.id, l.id, l.hyd_id FROM chandeg_con c LEFT JOIN channel_lte_cha l ON l.id = c.lcha_id', con_ids)
+
+		db = self.project_db
+		db_lib.bulk_delete(db, channel.Hyd_sed_lte_cha, 'id', hyd_ids)
+		db_lib.bulk_delete(db, channel.Channel_lte_cha, 'id', cha_ids)
+		db_lib.bulk_delete(db, connect.Chandeg_con_out, 'chandeg_con_id', con_ids)
+		db_lib.bulk_delete(db, connect.Chandeg_con, 'id', con_ids)
+		self.remove_con_outs_to('sdc', deleted_ids)
+		return old_ids
+
+	def remove_aquifers(self, changes, id_map):
+		"""
+		Remove changed and deleted shallow or deep aquifers.
+		:return: old ids of the changed ones, by (gis table, gis id)
+		"""
+		table_name = 'gis_deep_aquifers' if id_map is self.gis_to_deep_aqu_ids else 'gis_aquifers'
+		old_ids = self.pop_ids(id_map, changes.updated)
+		deleted_ids = list(self.pop_ids(id_map, changes.deleted).values())
+		con_ids = list(old_ids.values()) + deleted_ids
+		if len(con_ids) > 0:
+			aqu_ids, = self.get_related_ids('SELECT id, aqu_id FROM aquifer_con', con_ids)
+
+			db = self.project_db
+			db_lib.bulk_delete(db, aquifer.Aquifer_aqu, 'id', aqu_ids)
+			db_lib.bulk_delete(db, connect.Aquifer_con_out, 'aquifer_con_id', con_ids)
+			db_lib.bulk_delete(db, connect.Aquifer_con, 'id', con_ids)
+			self.remove_con_outs_to('aqu', deleted_ids)
+
+		return {(table_name, g): id for g, id in old_ids.items()}
+
+	def remove_con_outs_to(self, obj_typ, ids):
+		for table in CON_OUT_TABLES:
+			db_lib.bulk_delete(self.project_db, table, 'obj_id', ids, "obj_typ = '{}'".format(obj_typ))
+
+	def remap_con_outs(self, obj_typ, pairs):
+		for table in CON_OUT_TABLES:
+			db_lib.bulk_replace(self.project_db, table, 'obj_id', pairs, "obj_typ = '{}'".format(obj_typ))
+
+	def update_connections(self, changes):
+		"""
+		Rebuild the connections of objects that are new or changed, or whose routing changed,
+		including routing through points that changed.
+		"""
+		routing = self.get_routing()
+		points = set().union(*changes.get('gis_routing_{}'.format(RouteCat.PT), NO_CHANGES))
+		through_points = self.get_sources_through(routing, points)
+
+		connections = [
+			([RouteCat.LSU], 'rtu_con', self.gis_to_rtu_ids, connect.Rout_unit_con_out, 'gis_lsus'),
+			([RouteCat.CH], 'chandeg_con', self.gis_to_cha_ids, connect.Chandeg_con_out, 'gis_channels'),
+			([RouteCat.AQU], 'aquifer_con', self.gis_to_aqu_ids, connect.Aquifer_con_out, 'gis_aquifers'),
+			([RouteCat.WTR, RouteCat.PND, RouteCat.RES], 'reservoir_con', self.gis_to_res_ids, connect.Reservoir_con_out, None)
+		]
+		for sourcecats, attach_key, id_list, con_out_table, gis_table in connections:
+			sources = set()
+			for cat in sourcecats:
+				sources.update(*changes.get('gis_routing_{}'.format(cat), NO_CHANGES))
+				sources.update(through_points.get(cat, []))
+			if gis_table is not None:
+				object_changes = changes.get(gis_table, NO_CHANGES)
+				sources.update(object_changes.inserted | object_changes.updated)
+
+			sources = set(g for g in sources if g in id_list)
+			if len(sources) > 0:
+				db_lib.bulk_delete(self.project_db, con_out_table, '{}_id'.format(attach_key), [id_list[g] for g in sources])
+				db_lib.bulk_insert(self.project_db, con_out_table, self.get_connections(sourcecats, attach_key, id_list, source_ids=sources))
+
+	def get_sources_through(self, routing, points):
+		"""
+		Gis ids of the objects whose route passes through any of points, by routing category.
+		"""
+		sources = {}
+		if len(points) < 1:
+			return sources
+
+		passes = {}
+		for route in routing.routes:
+			if route.sourcecat == RouteCat.PT or route.sinkcat != RouteCat.PT:
+				continue
+
+			path = []
+			pid = route.sinkid
+			found = False
+			while pid is not None and pid not in passes and pid not in path:
+				if pid in points:
+					found = True
+					break
+				path.append(pid)
+				next_route = routing.first_route(RouteCat.PT, pid)
+				pid = next_route.sinkid if next_route is not None and next_route.sinkcat == RouteCat.PT else None
+
+			found = found or passes.get(pid, False)
+			for p in path:
+				passes[p] = found
+			if found:
+				sources.setdefault(route.sourcecat, set()).add(route.sourceid)
+		return sources
+
+	def update_lsu_definitions(self, new_rtu_ids):
+		"""
+		Keep one landscape unit definition for each routing unit that has elements, refreshing those of new routing units.
+		"""
+		with_elements = ElementRuns.load(connect.Rout_unit_ele, 'rtu_id', 'obj_id').def_ids()
+		defined = set(r[0] for r in regions.Ls_unit_def.select(regions.Ls_unit_def.id).tuples())
+
+		stale = defined - with_elements
+		db_lib.bulk_delete(self.project_db, regions.Ls_unit_ele, 'ls_unit_def_id', stale)
+		db_lib.bulk_delete(self.project_db, regions.Ls_unit_def, 'id', stale | (defined & new_rtu_ids))
+
+		missing = with_elements - (defined - new_rtu_ids)
+		lsu_defs = []
+		for row in connect.Rout_unit_con.select().order_by(connect.Rout_unit_con.id):
+			if row.id in missing and row.rtu_id is not None:
+				lsu_defs.append({
+					'id': row.rtu_id,
+					'name': row.name,
+					'area': row.area
+				})
+		db_lib.bulk_insert(self.project_db, regions.Ls_unit_def, lsu_defs)
+
+	def update_basin_fractions(self):
+		bsn_area = gis.Gis_subbasins.select(fn.Sum(gis.Gis_subbasins.area)).scalar()
+		self.project_db.execute_sql("update ls_unit_ele set bsn_frac = (select area from hru_con where hru_con.hru_id = ls_unit_ele.obj_typ_no) / ? where obj_typ = 'hru'", (bsn_area,))
+
+
+if __name__ == '__main__':
+	sys.stdout = Unbuffered(sys.stdout)
+	parser = argparse.ArgumentParser(description="Re-import only the GIS data that changed since the last import")
+	parser.add_argument("project_db_file", type=str, help="full path of project SQLite database file")
+	args = parser.parse_args()
+
+	api = GisChangesImport(args.project_db_file)
+	api.reimport()
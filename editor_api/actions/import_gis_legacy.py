@@ -8,6 +8,8 @@ from database.datasets.setup import SetupDatasetsDatabase
 from database.datasets import init as ds_init, lum as ds_lum, base as ds_base, hru_parm_db as ds_hru_parm_db
 from database.datasets import definitions
 from helpers import utils
+from helpers.routing import RoutingGraph
+from helpers.element_runs import ElementRuns
 from .import_weather import WeatherImport
 
 from peewee import *
@@ -87,6 +89,8 @@ class GisImport(ExecutableApi):
 		self.aqu_id_to_sub = {}
 		self.sub_to_flood_aqu_id = {}
 		self.sub_to_upland_aqu_id = {}
+		self.routing = None
+		self.point_con_outs = {}
 
 		if delete_existing and not self.config.imported_gis:
 			self.delete_existing()
@@ -1763,7 +1767,8 @@ class GisImport(ExecutableApi):
 	def get_connections(self, sourcecats, attach_key, id_list, is_lte=False, override_frac=False, is_lte_cha_type=False):
 		con_outs = []
 		used = dict()
-		for row in gis.Gis_routing.select(gis.Gis_routing.sourceid, gis.Gis_routing.sourcecat, gis.Gis_routing.sinkid, gis.Gis_routing.sinkcat, gis.Gis_routing.percent).where((gis.Gis_routing.sourcecat << sourcecats) & (gis.Gis_routing.percent > 0)).order_by(gis.Gis_routing.sourceid):
+		routing = self.get_routing()
+		for row in routing.routes_by_source(sourcecats):
 			if row.sinkcat != RouteCat.OUTLET:
 				id = id_list[row.sourceid]
 				if id in used:
@@ -1776,7 +1781,7 @@ class GisImport(ExecutableApi):
 					floodplain_lsu = gis.Gis_lsus.get_or_none(gis.Gis_lsus.id == row.sinkid)
 					if upland_lsu is not None and floodplain_lsu is not None:
 						upland_frac = upland_lsu.area / (upland_lsu.area + floodplain_lsu.area)
-						floodplain_route = gis.Gis_routing.get_or_none((gis.Gis_routing.sourceid == row.sinkid) & (gis.Gis_routing.sourcecat == RouteCat.LSU))
+						floodplain_route = routing.first_route(RouteCat.LSU, row.sinkid)
 
 						if floodplain_route is not None:
 							ru_id = self.gis_to_rtu_ids[row.sinkid]
@@ -1936,17 +1941,43 @@ class GisImport(ExecutableApi):
 				return [con_out]
 
 		if sinkcat == RouteCat.PT:
+			return [{
+				attach_key: attach_id,
+				'order': order + c['order'],
+				'obj_typ': c['obj_typ'],
+				'obj_id': c['obj_id'],
+				'hyd_typ': c['hyd_typ'],
+				'frac': c['frac']
+			} for c in self.get_point_con_outs(sinkid, is_lte, is_lte_cha_type)]
+
+		return None
+
+	def get_point_con_outs(self, point_id, is_lte, is_lte_cha_type):
+		"""
+		Connections reached through a point, with orders counted from 0. Points are shared by many sources,
+		so each point is only expanded once.
+		"""
+		key = (point_id, is_lte, is_lte_cha_type)
+		if key not in self.point_con_outs:
 			con_outs = []
-			for row in gis.Gis_routing.select(gis.Gis_routing.sourceid, gis.Gis_routing.sourcecat, gis.Gis_routing.sinkid, gis.Gis_routing.sinkcat, gis.Gis_routing.percent).where(
-				(gis.Gis_routing.sourcecat == RouteCat.PT) & (gis.Gis_routing.sourceid == sinkid)):
-				con_out = self.get_con_out(row.sinkid, row.sinkcat, row.percent, order, attach_key, attach_id, is_lte, is_lte_cha_type=is_lte_cha_type)
+			order = 0
+			for row in self.get_routing().routes_from(RouteCat.PT, point_id):
+				con_out = self.get_con_out(row.sinkid, row.sinkcat, row.percent, order, 'point', point_id, is_lte, is_lte_cha_type=is_lte_cha_type)
 				if con_out is not None:
 					con_outs.extend(con_out)
 					order += 1
+			self.point_con_outs[key] = con_outs
 
-			return con_outs
+		return self.point_con_outs[key]
 
-		return None
+	def get_routing(self):
+		"""
+		gis_routing loaded once for all connection tables.
+		"""
+		if self.routing is None:
+			self.routing = RoutingGraph.load(gis.Gis_routing, RouteCat.PT)
+			self.routing.check_point_cycles()
+		return self.routing
 
 	def insert_lsus(self):
 		if connect.Hru_con.select().count() > 0:
@@ -1957,10 +1988,11 @@ class GisImport(ExecutableApi):
 			if bsn_area <= 0:
 				raise ValueError('Project watershed area cannot be zero. Error summing HRU areas.')
 
+			with_elements = ElementRuns.load(connect.Rout_unit_ele, 'rtu_id', 'obj_id').def_ids()
 			for row in connect.Rout_unit_con.select().order_by(connect.Rout_unit_con.id):
-				if connect.Rout_unit_ele.select().where(connect.Rout_unit_ele.rtu_id == row.rtu.id).count() > 0:
+				if row.rtu_id in with_elements:
 					lsu_def = {
-						'id': row.rtu.id,
+						'id': row.rtu_id,
 						'name': row.name,
 						'area': row.area
 					}
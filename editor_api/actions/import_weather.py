@@ -7,6 +7,8 @@ from database.project.connect import Aquifer_con, Channel_con, Rout_unit_con, Re
 from database.project.simulation import Time_sim
 from database import lib as db_lib
 from helpers import utils
+from helpers.nearest import NearestIndex
+from helpers import weather_store
 from fileio import base as fileio
 
 import sys
@@ -15,6 +17,7 @@ import math
 import argparse
 import time, datetime
 import sqlite3
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from peewee import *
 
 
@@ -34,6 +37,9 @@ SLR_CLI = "slr.cli"
 TMP_CLI = "tmp.cli"
 WND_CLI = "wnd.cli"
 
+WEATHER_SCAN_THREADS = 8
+WEATHER_TAIL_BLOCK = 4096
+
 WEATHER_DESC = {
 	"hmd": "Relative humidity",
 	"pcp": "Precipitation",
@@ -49,26 +55,179 @@ def weather_sta_name(lat, lon, prefix = 's', mult = 1000):
 	return name
 
 
-def update_closest_lat_lon(update_table, update_field, select_table, select_field="id", wtype=None):
-	where = ""
-	if wtype is not None:
-		where = "where t2.type = ?"
-
-	sql = """with r as
-		(
-			select t1.id as con_id, t2.{select_field} as wid, ((t1.lat - t2.lat) * (t1.lat - t2.lat) + (t1.lon - t2.lon) * (t1.lon - t2.lon)) as ord
-			from {update_table} t1, {select_table} t2 {where}
-			group by con_id
-			having min(ord) or ord = 0
-			order by con_id, ord
-		)
-		update {update_table} set {update_field} = (select wid from r where con_id = {update_table}.id)""".format(
-			update_table=update_table, update_field=update_field, select_table=select_table, select_field=select_field, where=where)
-	
-	if wtype is not None:
-		project_base.db.execute_sql(sql, (wtype,))
+def get_station_files(dir, output_dir, station_obj, weather_type):
+	source_file = os.path.join(dir, "{s}.txt".format(s=station_obj[1]))
+	dest_file = os.path.join(output_dir, "{s}.{ext}".format(s=station_obj[1].replace("-", ""), ext=weather_type))
+	return source_file, dest_file
+
+
+def format_weather_value(val):
+	try:
+		return "{:10.5f}  ".format(float(val))
+	except ValueError:
+		return utils.num_pad(val, default_pad=10)
+
+
+def write_station_file(source_file, dest_file, station_obj, weather_type):
+	"""
+	Convert a SWAT2012 station file to a SWAT+ station file. The file is read and written in one go,
+	so stations can be converted in parallel processes.
+	"""
+	if not os.path.exists(source_file):
+		return "Skipping {type} import. Station file does not exist: {file}".format(type=weather_type, file=source_file)
+
+	with open(source_file, "r") as station_file:
+		lines = station_file.read().splitlines(True)
+
+	total_days = len(lines) - 2 if len(lines) > 0 else 0
+	text = [
+		"{file}: {desc} data - file written by SWAT+ editor {today}\n".format(file=os.path.basename(dest_file), desc=WEATHER_DESC[weather_type], today=datetime.datetime.now()),
+		"nbyr".rjust(4), "tstep".rjust(10), "lat".rjust(10), "lon".rjust(10), "elev".rjust(10), "\n"
+	]
+
+	if len(lines) > 0:
+		ts = time.strptime(lines[0].strip(), "%Y%m%d")
+		start_date = datetime.date(ts.tm_year, ts.tm_mon, ts.tm_mday)
+		end_date = start_date + datetime.timedelta(days=total_days)
+		nbyr = end_date.year - start_date.year + 1
+
+		text.append(str(nbyr).rjust(4) + "0".rjust(10))
+		for val in station_obj[2:5]:
+			text.append("{0:.3f}".format(float(val)).rjust(10))
+		text.append("\n")
+
+		dates = weather_store.get_date_columns(start_date, max(total_days, 0))
+		if weather_type == "tmp":
+			for date, line in zip(dates, lines[1:]):
+				tmp = [x.strip() for x in line.split(',')]
+				text.append(date + format_weather_value(tmp[0]) + format_weather_value(tmp[1]) + "\n")
+		else:
+			for date, line in zip(dates, lines[1:]):
+				text.append(date + format_weather_value(line) + "\n")
+
+	with open(dest_file, 'w+') as new_file:
+		new_file.write("".join(text))
+	return None
+
+
+def compress_station_file(source_file, dest_file, station_obj, weather_type):
+	"""
+	Read a SWAT2012 station file into compressed weather store columns.
+	:return: arguments of WeatherStore.add_compressed, or None if the file does not exist
+	"""
+	if not os.path.exists(source_file):
+		return None
+
+	with open(source_file, "r") as station_file:
+		lines = station_file.read().splitlines()
+	while len(lines) > 1 and lines[-1].strip() == "":
+		lines.pop()
+
+	ts = time.strptime(lines[0].strip(), "%Y%m%d")
+	start_date = datetime.date(ts.tm_year, ts.tm_mon, ts.tm_mday)
+	if weather_type == "tmp":
+		values = [line.split(',') for line in lines[1:]]
+		columns = [[weather_store.to_float(v[0]) for v in values], [weather_store.to_float(v[1]) for v in values]]
 	else:
-		project_base.db.execute_sql(sql)
+		columns = [[weather_store.to_float(line) for line in lines[1:]]]
+
+	# coordinates as precise as in the text files, so stations are named and matched the same way
+	lat, lon, elev = [float("{0:.3f}".format(float(v))) for v in station_obj[2:5]]
+	blocks = [weather_store.compress_column(c) for c in columns]
+	return weather_type, os.path.basename(dest_file), lat, lon, elev, start_date, len(lines) - 1, blocks
+
+
+def scan_store_station(store, station_name, weather_type):
+	entry = store.station(weather_type, station_name)
+	start_date, end_date = store.get_period(weather_type, station_name)
+	file = {
+		"filename": station_name,
+		"type": weather_type,
+		"lat": entry["lat"],
+		"lon": entry["lon"]
+	}
+	return file, datetime.datetime.combine(start_date, datetime.time()), datetime.datetime.combine(end_date, datetime.time())
+
+
+def get_existing_weather_files():
+	return set((f.filename, f.type) for f in Weather_file.select(Weather_file.filename, Weather_file.type))
+
+
+def read_last_line(file_path):
+	"""
+	Last non-empty line of a text file, read backwards from the end so long files cost no more than short ones.
+	"""
+	with open(file_path, "rb") as f:
+		pos = f.seek(0, os.SEEK_END)
+		data = b""
+		while pos > 0:
+			size = min(WEATHER_TAIL_BLOCK, pos)
+			pos -= size
+			f.seek(pos)
+			data = f.read(size) + data
+			stripped = data.rstrip()
+			if b"\n" in stripped or pos == 0:
+				return stripped.rsplit(b"\n", 1)[-1].decode()
+	return ""
+
+
+def get_weather_date(values, ln, file_path):
+	if len(values) < 3:
+		raise ValueError("Invalid value at line {ln} of {file}. Expecting year, julian day, and weather value separated by a space.".format(ln=ln, file=file_path))
+	return datetime.datetime(int(values[0]), 1, 1) + datetime.timedelta(days=int(values[1])-1)
+
+
+def scan_weather_file(station_file, station_name, weather_type):
+	"""
+	Coordinates and first and last dates of a SWAT+ station file, from its header and last line only.
+	:return: Weather_file row values, start date, end date
+	"""
+	with open(station_file, "r") as station_data:
+		header = [station_data.readline() for j in range(4)]
+
+	station_info = header[2].strip().split()
+	if len(station_info) < 4:
+		raise ValueError("Invalid value at line 3 of {file}. Expecting nbyr, tstep, lat, long, elev values separated by a space.".format(file=station_file))
+
+	file = {
+		"filename": station_name,
+		"type": weather_type,
+		"lat": float(station_info[2]),
+		"lon": float(station_info[3])
+	}
+	start_date = get_weather_date(header[3].strip().split(), 4, station_file)
+	end_date = get_weather_date(read_last_line(station_file).strip().split(), "last", station_file)
+	return file, start_date, end_date
+
+
+def get_station_index(select_table, select_field="id", wtype=None):
+	"""
+	Nearest-neighbour index of the rows of a station table, returning select_field for the closest row.
+	"""
+	where = "" if wtype is None else " where type = ?"
+	sql = "select {select_field}, lat, lon from {select_table}{where} order by id".format(select_table=select_table, select_field=select_field, where=where)
+	cursor = project_base.db.execute_sql(sql, () if wtype is None else (wtype,))
+	rows = cursor.fetchall()
+	return NearestIndex([r[0] for r in rows], [r[1] for r in rows], [r[2] for r in rows])
+
+
+def update_closest_lat_lon(update_table, update_field, select_table, select_field="id", wtype=None, index=None, only_missing=False):
+	"""
+	Set update_field of every row of update_table with coordinates to the closest row of select_table, and to
+	NULL for rows without coordinates. Pass an index from get_station_index to reuse it for several tables.
+	With only_missing, rows that already have a value are left as they are.
+	"""
+	if index is None:
+		index = get_station_index(select_table, select_field, wtype)
+
+	missing = " and {update_field} is null".format(update_field=update_field) if only_missing else ""
+	if not only_missing:
+		# their station may have been deleted or replaced
+		project_base.db.execute_sql("update {update_table} set {update_field} = null where lat is null or lon is null".format(update_table=update_table, update_field=update_field))
+	cursor = project_base.db.execute_sql("select id, lat, lon from {update_table} where lat is not null and lon is not null{missing}".format(update_table=update_table, missing=missing))
+	rows = cursor.fetchall()
+	values = index.nearest_many([(r[1], r[2]) for r in rows])
+	db_lib.bulk_update_column(project_base.db, update_table, update_field, zip([r[0] for r in rows], values))
 
 
 def closest_lat_lon(db, table_name, lat, lon, wtype=None):
@@ -98,12 +257,13 @@ def closest_lat_lon(db, table_name, lat, lon, wtype=None):
 
 
 class WeatherImport(ExecutableApi):
-	def __init__(self, project_db_file, delete_existing, create_stations):
+	def __init__(self, project_db_file, delete_existing, create_stations, build_store=False):
 		self.__abort = False
 		SetupProjectDatabase.init(project_db_file)
 		self.project_db_file = project_db_file
 		self.project_db = project_base.db
 		self.create_stations = create_stations
+		self.build_store = build_store
 		self.coords_to_stations = {}
 
 		if delete_existing:
@@ -117,6 +277,11 @@ class WeatherImport(ExecutableApi):
 			if not os.path.exists(weather_data_dir):
 				sys.exit('Weather data directory {dir} does not exist.'.format(dir=weather_data_dir))
 
+			if self.build_store:
+				skipped = weather_store.WeatherStore(weather_data_dir).import_text_files(weather_data_dir)
+				if len(skipped) > 0:
+					print('\t - {} weather files were not added to the weather store: {}'.format(len(skipped), ', '.join(skipped[:10])))
+
 			self.add_weather_files(weather_data_dir)
 
 			if self.create_stations:
@@ -135,15 +300,16 @@ class WeatherImport(ExecutableApi):
 		# self.emit_progress(start_prog, "Adding weather stations to spatial connection tables...")
 		wst_col = "wst_id"
 		wst_table = "weather_sta_cli"
-		update_closest_lat_lon("aquifer_con", wst_col, wst_table)
-		update_closest_lat_lon("channel_con", wst_col, wst_table)
-		update_closest_lat_lon("chandeg_con", wst_col, wst_table)
-		update_closest_lat_lon("rout_unit_con", wst_col, wst_table)
-		update_closest_lat_lon("reservoir_con", wst_col, wst_table)
-		update_closest_lat_lon("recall_con", wst_col, wst_table)
-		update_closest_lat_lon("exco_con", wst_col, wst_table)
-		update_closest_lat_lon("hru_con", wst_col, wst_table)
-		update_closest_lat_lon("hru_lte_con", wst_col, wst_table)
+		index = get_station_index(wst_table)
+		update_closest_lat_lon("aquifer_con", wst_col, wst_table, index=index)
+		update_closest_lat_lon("channel_con", wst_col, wst_table, index=index)
+		update_closest_lat_lon("chandeg_con", wst_col, wst_table, index=index)
+		update_closest_lat_lon("rout_unit_con", wst_col, wst_table, index=index)
+		update_closest_lat_lon("reservoir_con", wst_col, wst_table, index=index)
+		update_closest_lat_lon("recall_con", wst_col, wst_table, index=index)
+		update_closest_lat_lon("exco_con", wst_col, wst_table, index=index)
+		update_closest_lat_lon("hru_con", wst_col, wst_table, index=index)
+		update_closest_lat_lon("hru_lte_con", wst_col, wst_table, index=index)
 		update_closest_lat_lon("weather_sta_cli", "wgn_id", "weather_wgn_cli")
 
 		"""self.match_stations_table(Aquifer_con, "aquifer connections", start_prog)
@@ -247,15 +413,17 @@ class WeatherImport(ExecutableApi):
 
 	def add_weather_files(self, dir):
 		if self.__abort: return
-		hmd_start, hmd_end = self.add_weather_files_type(os.path.join(dir, HMD_CLI), "hmd", 0)
+		existing_files = get_existing_weather_files()
+		store = weather_store.WeatherStore(dir) if weather_store.has_store(dir) else None
+		hmd_start, hmd_end = self.add_weather_files_type(os.path.join(dir, HMD_CLI), "hmd", 0, existing_files, store)
 		if self.__abort: return
-		pcp_start, pcp_end = self.add_weather_files_type(os.path.join(dir, PCP_CLI), "pcp", 5)
+		pcp_start, pcp_end = self.add_weather_files_type(os.path.join(dir, PCP_CLI), "pcp", 5, existing_files, store)
 		if self.__abort: return
-		slr_start, slr_end = self.add_weather_files_type(os.path.join(dir, SLR_CLI), "slr", 10)
+		slr_start, slr_end = self.add_weather_files_type(os.path.join(dir, SLR_CLI), "slr", 10, existing_files, store)
 		if self.__abort: return
-		tmp_start, tmp_end = self.add_weather_files_type(os.path.join(dir, TMP_CLI), "tmp", 15)
+		tmp_start, tmp_end = self.add_weather_files_type(os.path.join(dir, TMP_CLI), "tmp", 15, existing_files, store)
 		if self.__abort: return
-		wnd_start, wnd_end = self.add_weather_files_type(os.path.join(dir, WND_CLI), "wnd", 20)
+		wnd_start, wnd_end = self.add_weather_files_type(os.path.join(dir, WND_CLI), "wnd", 20, existing_files, store)
 
 		starts = [hmd_start, pcp_start, slr_start, tmp_start, wnd_start]
 		ends = [hmd_end, pcp_end, slr_end, tmp_end, wnd_end]
@@ -295,15 +463,22 @@ class WeatherImport(ExecutableApi):
 						warning_file.write(w)
 						warning_file.write("\n")"""
 
-	def add_weather_files_type(self, source_file, weather_type, prog):
+	def add_weather_files_type(self, source_file, weather_type, prog, existing_files=None, store=None):
+		"""
+		Add the station files listed in a .cli file that are not in existing_files, a set of (filename, type) pairs.
+		Metadata of stations with current data in the weather store comes from its index; for other stations,
+		including those whose text file changed after it was stored, only the header and last line of each file
+		are read, by several threads at once. Without a .cli file, the stations of the weather store are added.
+		"""
 		start_date = None
 		end_date = None
-		starts = []
-		ends = []
+		if existing_files is None:
+			existing_files = get_existing_weather_files()
+
+		dir = os.path.dirname(source_file)
+		station_names = []
 		if os.path.exists(source_file):
 			# self.emit_progress(prog, "Inserting {type} files and coordinates...".format(type=weather_type))
-			weather_files = []
-			dir = os.path.dirname(source_file)
 			with open(source_file, "r") as source_data:
 				i = 0
 				for line in source_data:
@@ -311,70 +486,39 @@ class WeatherImport(ExecutableApi):
 						break
 
 					if i > 1:
-						station_name = line.strip('\n')
-						station_file = os.path.join(dir, station_name)
-						if not os.path.exists(station_file):
-							raise IOError("File {file} not found. Weather data import aborted.".format(file=station_file))
-
-						try:
-							existing = Weather_file.get((Weather_file.filename == station_name) & (Weather_file.type == weather_type))
-						except Weather_file.DoesNotExist:
-							with open(station_file, "r") as station_data:
-								j = 0
-								for sline in station_data:
-									if j == 2:
-										station_info = sline.strip().split()
-										if len(station_info) < 4:
-											raise ValueError("Invalid value at line {ln} of {file}. Expecting nbyr, tstep, lat, long, elev values separated by a space.".format(ln=str(j + 1), file=station_file))
-
-										lat = float(station_info[2])
-										lon = float(station_info[3])
-
-										file = {
-											"filename": station_name,
-											"type": weather_type,
-											"lat": lat,
-											"lon": lon
-										}
-										weather_files.append(file)
-									elif j == 3:
-										begin_data = sline.strip().split()
-										if len(begin_data) < 3:
-											raise ValueError("Invalid value at line {ln} of {file}. Expecting year, julian day, and weather value separated by a space.".format(ln=str(j + 1), file=station_file))
-
-										date = datetime.datetime(int(begin_data[0]), 1, 1)
-										current_start_date = date + datetime.timedelta(days=int(begin_data[1])-1)
-										#if start_date is not None and current_start_date != start_date:
-										#	raise ValueError("Start dates in weather files do not match. Make sure all weather files have the same starting and ending dates.")
-
-										#start_date = current_start_date
-										starts.append(current_start_date)
-									elif j > 3:
-										break
-
-									j += 1
-
-								non_empty_lines = [sline for sline in station_data if sline]
-								last_line = non_empty_lines[len(non_empty_lines)-1].strip().split()
-								date = datetime.datetime(int(last_line[0]), 1, 1)
-								current_end_date = date + datetime.timedelta(days=int(last_line[1])-1)
-								#if end_date is not None and current_end_date != end_date:
-								#	raise ValueError("Ending dates in weather files do not match. Make sure all weather files have the same starting and ending dates.")
-
-								#end_date = current_end_date
-								ends.append(current_end_date)
-
+						station_names.append(line.strip('\n'))
 					i += 1
-
-			db_lib.bulk_insert(project_base.db, Weather_file, weather_files)
-			if len(starts) > 0 and len(ends) > 0:
-				start_date = max(starts)
-				end_date = min(ends)
+		elif store is not None:
+			station_names = store.station_names(weather_type)
+
+		new_names = []
+		text_files = []
+		for station_name in station_names:
+			if (station_name, weather_type) in existing_files:
+				continue
+			existing_files.add((station_name, weather_type))
+			new_names.append(station_name)
+
+			if store is None or not store.is_current(weather_type, station_name):
+				station_file = os.path.join(dir, station_name)
+				if not os.path.exists(station_file):
+					raise IOError("File {file} not found. Weather data import aborted.".format(file=station_file))
+				text_files.append(station_name)
+
+		with ThreadPoolExecutor(max_workers=WEATHER_SCAN_THREADS) as executor:
+			from_text = dict(zip(text_files, executor.map(lambda name: scan_weather_file(os.path.join(dir, name), name, weather_type), text_files)))
+		scanned = [from_text[name] if name in from_text else scan_store_station(store, name, weather_type) for name in new_names]
+
+		weather_files = [file for file, start, end in scanned]
+		db_lib.bulk_insert(project_base.db, Weather_file, weather_files)
+		if len(scanned) > 0:
+			start_date = max(start for file, start, end in scanned)
+			end_date = min(end for file, start, end in scanned)
 		return start_date, end_date
 
 
 class Swat2012WeatherImport(ExecutableApi):
-	def __init__(self, project_db_file, delete_existing, create_stations, source_dir):
+	def __init__(self, project_db_file, delete_existing, create_stations, source_dir, workers=None, use_store=False):
 		self.__abort = False
 		SetupProjectDatabase.init(project_db_file)
 		config = Project_config.get()
@@ -389,6 +533,9 @@ class Swat2012WeatherImport(ExecutableApi):
 		self.source_dir = source_dir
 		self.delete_existing = delete_existing
 		self.create_stations = create_stations
+		self.workers = min(4, os.cpu_count() or 1) if workers is None else max(1, workers)
+		self.executor = None
+		self.store = weather_store.WeatherStore(weather_data_dir) if use_store else None
 
 	def import_data(self):
 		try:
@@ -399,13 +546,33 @@ class Swat2012WeatherImport(ExecutableApi):
 			sys.exit('Could not retrieve project configuration from database')
 
 	def write_to_swatplus(self, dir):
-		warnings = []
-
 		if not os.path.exists(self.output_dir):
 			os.makedirs(self.output_dir)
 
 		total_files = len(os.listdir(dir))
 
+		if self.workers > 1:
+			self.executor = ProcessPoolExecutor(max_workers=self.workers)
+		try:
+			warnings = self.write_all_weather(dir, total_files)
+		finally:
+			if self.executor is not None:
+				self.executor.shutdown()
+				self.executor = None
+			if self.store is not None:
+				self.store.save()
+
+		if warnings is None: return
+		has_warnings = any(x is not None for x in warnings)
+
+		if has_warnings:
+			with open(os.path.join(self.output_dir, "__warnings.txt"), 'w+') as warning_file:
+				for w in warnings:
+					if w is not None:
+						warning_file.write(w)
+						warning_file.write("\n")
+
+	def write_all_weather(self, dir, total_files):
 		if self.__abort: return
 		hmd_file = os.path.join(dir, HMD_TXT)
 		if not os.path.exists(hmd_file):
@@ -431,19 +598,7 @@ class Swat2012WeatherImport(ExecutableApi):
 		wnd_res = self.write_weather(wnd_file, os.path.join(self.output_dir, WND_CLI), "wnd", tmp_res[0], total_files)
 
 		if self.__abort: return
-		warnings.append(hmd_res[1])
-		warnings.append(pcp_res[1])
-		warnings.append(slr_res[1])
-		warnings.append(tmp_res[1])
-		warnings.append(wnd_res[1])
-		has_warnings = any(x is not None for x in warnings)
-
-		if has_warnings:
-			with open(os.path.join(self.output_dir, "__warnings.txt"), 'w+') as warning_file:
-				for w in warnings:
-					if w is not None:
-						warning_file.write(w)
-						warning_file.write("\n")
+		return [hmd_res[1], pcp_res[1], slr_res[1], tmp_res[1], wnd_res[1]]
 
 	def write_weather(self, source_file, dest_file, weather_type, starting_file_num, total_files):
 		if not os.path.exists(source_file):
@@ -453,6 +608,7 @@ class Swat2012WeatherImport(ExecutableApi):
 				new_file.write("{file}.cli: {desc} file names - file written by SWAT+ editor {today}\n".format(file=weather_type, desc=WEATHER_DESC[weather_type], today=datetime.datetime.now()))
 				new_file.write("filename\n")
 				new_file_names = []
+				jobs = []
 
 				with open(source_file, "r") as source_data:
 					i = 0
@@ -462,10 +618,12 @@ class Swat2012WeatherImport(ExecutableApi):
 							break
 
 						if i == 0 and not "ID,NAME,LAT,LONG,ELEVATION" in line:
+							self.write_stations(jobs)
 							return curr_file_num, "Skipping {type} import. Invalid file format in header: {file}. Expecting 'ID,NAME,LAT,LONG,ELEVATION'".format(type=weather_type, file=source_file)
 						if i > 0:
 							station_obj = [x.strip() for x in line.split(',')]
 							if len(station_obj) != 5:
+								self.write_stations(jobs)
 								return curr_file_num, "Skipping {type} import. Invalid file format in line {line_no}: {file}, {line}".format(type=weather_type, line_no=i+1, file=source_file, line=line)
 
 							new_file_name = "{s}.{ext}".format(s=station_obj[1].replace("-", ""), ext=weather_type)
@@ -473,13 +631,14 @@ class Swat2012WeatherImport(ExecutableApi):
 							#new_file.write(new_file_name)
 							#new_file.write("\n")
 
-							self.write_station(os.path.dirname(source_file), station_obj, weather_type)
+							jobs.append(get_station_files(os.path.dirname(source_file), self.output_dir, station_obj, weather_type) + (station_obj, weather_type))
 							prog = round(curr_file_num * 100 / total_files)
 							# self.emit_progress(prog, "Writing {type}, {file}...".format(type=weather_type, file=new_file_name))
 							curr_file_num += 1
 
 						i += 1
 
+				self.write_stations(jobs)
 				for fn in sorted(new_file_names, key=str.lower):
 					new_file.write(fn)
 					new_file.write("\n")
@@ -487,67 +646,26 @@ class Swat2012WeatherImport(ExecutableApi):
 			return curr_file_num, None
 
 	def write_station(self, dir, station_obj, weather_type):
-		source_file = os.path.join(dir, "{s}.txt".format(s=station_obj[1]))
-		if not os.path.exists(source_file):
-			return "Skipping {type} import. Station file does not exist: {file}".format(type=weather_type, file=source_file)
-
-		dest_file_name = "{s}.{ext}".format(s=station_obj[1].replace("-", ""), ext=weather_type)
-		dest_file = os.path.join(self.output_dir, dest_file_name)
-
-		with open(dest_file, 'w+') as new_file:
-			new_file.write("{file}: {desc} data - file written by SWAT+ editor {today}\n".format(file=dest_file_name, desc=WEATHER_DESC[weather_type], today=datetime.datetime.now()))
-			new_file.write("nbyr".rjust(4))
-			new_file.write("tstep".rjust(10))
-			new_file.write("lat".rjust(10))
-			new_file.write("lon".rjust(10))
-			new_file.write("elev".rjust(10))
-			new_file.write("\n")
-
-			linecount = self.file_len(source_file)
-			total_days = linecount - 2 if linecount > 0 else 0
-
-			with open(source_file, "r") as station_file:
-				i = 0
-				date = None
-				for line in station_file:
-					if i == 0:
-						ts = time.strptime(line.strip(), "%Y%m%d")
-						date = datetime.datetime(ts.tm_year, ts.tm_mon, ts.tm_mday)
-						start_date = date
-
-						end_date = start_date + datetime.timedelta(days=total_days)
-						nbyr = end_date.year - start_date.year + 1
-
-						new_file.write(str(nbyr).rjust(4))
-						new_file.write("0".rjust(10))
-						new_file.write("{0:.3f}".format(float(station_obj[2])).rjust(10))
-						new_file.write("{0:.3f}".format(float(station_obj[3])).rjust(10))
-						new_file.write("{0:.3f}".format(float(station_obj[4])).rjust(10))
-						new_file.write("\n")
-					else:
-						day_of_year = date.timetuple().tm_yday
-
-						new_file.write(str(date.year))
-						new_file.write(str(day_of_year).rjust(5))
-						new_file.write(' ')
-
-						if weather_type == "tmp":
-							tmp = [x.strip() for x in line.split(',')]
-							utils.write_num(new_file, tmp[0], default_pad=10)
-							utils.write_num(new_file, tmp[1], default_pad=10)
-						else:
-							utils.write_num(new_file, line, default_pad=10)
-						new_file.write("\n")
-
-						date = date + datetime.timedelta(days=1)
-
-					i += 1
+		source_file, dest_file = get_station_files(dir, self.output_dir, station_obj, weather_type)
+		return write_station_file(source_file, dest_file, station_obj, weather_type)
+
+	def write_stations(self, jobs):
+		"""
+		Convert station files, to SWAT+ text files or into the weather store.
+		"""
+		convert = write_station_file if self.store is None else compress_station_file
+		if self.executor is not None and len(jobs) > 1:
+			results = self.executor.map(convert, *zip(*jobs), chunksize=max(1, len(jobs) // (self.workers * 4)))
+		else:
+			results = [convert(*job) for job in jobs]
 
-	def file_len(self, fname):
-		with open(fname) as f:
-			for i, l in enumerate(f):
-				pass
-		return i + 1
+		for res in results:
+			if self.store is not None and res is not None:
+				self.store.add_compressed(*res)
+				# a text file left by an earlier conversion would take precedence over the new data in the store
+				text_file = os.path.join(self.output_dir, res[1])
+				if os.path.exists(text_file):
+					os.remove(text_file)
 
 
 class WgnImport(ExecutableApi):
@@ -630,174 +748,70 @@ class WgnImport(ExecutableApi):
 			raise ValueError(
 				"Table {table} does not exist in {file}.".format(table=monthly_table, file=self.wgn_database))
 
-		if Rout_unit_con.select().count() > 0:
-			coords = Rout_unit_con.select(fn.Min(Rout_unit_con.lat).alias("min_lat"),
-										  fn.Max(Rout_unit_con.lat).alias("max_lat"),
-										  fn.Min(Rout_unit_con.lon).alias("min_lon"),
-										  fn.Max(Rout_unit_con.lon).alias("max_lon")
-										  ).get()
-
-			query = "select * from {table_name} where lat between ? and ? and lon between ? and ? order by name".format(table_name=self.wgn_table)
-			tol = 0.5
-			cursor = conn.cursor().execute(query, (coords.min_lat - tol, coords.max_lat + tol, coords.min_lon - tol, coords.max_lon + tol))
-		elif Chandeg_con.select().count() > 0:
-			coords = Chandeg_con.select(fn.Min(Chandeg_con.lat).alias("min_lat"),
-										  fn.Max(Chandeg_con.lat).alias("max_lat"),
-										  fn.Min(Chandeg_con.lon).alias("min_lon"),
-										  fn.Max(Chandeg_con.lon).alias("max_lon")
+		conn.close()
+
+		where = ""
+		params = ()
+		tol = 0.5
+		for con_table in [Rout_unit_con, Chandeg_con]:
+			if con_table.select().count() > 0:
+				coords = con_table.select(fn.Min(con_table.lat).alias("min_lat"),
+										  fn.Max(con_table.lat).alias("max_lat"),
+										  fn.Min(con_table.lon).alias("min_lon"),
+										  fn.Max(con_table.lon).alias("max_lon")
 										  ).get()
+				where = "and w.lat between ? and ? and w.lon between ? and ?"
+				params = (coords.min_lat - tol, coords.max_lat + tol, coords.min_lon - tol, coords.max_lon + tol)
+				break
 
-			query = "select * from {table_name} where lat between ? and ? and lon between ? and ? order by name".format(table_name=self.wgn_table)
-			tol = 0.5
-			cursor = conn.cursor().execute(query, (coords.min_lat - tol, coords.max_lat + tol, coords.min_lon - tol, coords.max_lon + tol))
-		else:
-			query = "select * from {table_name} order by name".format(table_name=self.wgn_table)
-			cursor = conn.cursor().execute(query)
-
-		wgns = []
-		ids = []
-
-		data = cursor.fetchall()
-		records = len(data)
-		#print(records)
+		mon_cols = [f.column_name for f in Weather_wgn_cli_mon._meta.sorted_fields if f.name not in ["id", "weather_wgn_cli"]]
+		wgn_fk = Weather_wgn_cli_mon.weather_wgn_cli.column_name
 
-		i = 1
 		print('\t - Preparing weather generator')
-		for row in data:
-			if self.__abort: return
-
-			try:
-				existing = Weather_wgn_cli.get(Weather_wgn_cli.name == row['name'])
-			except Weather_wgn_cli.DoesNotExist:
-				prog = round(i * (total_prog / 2) / records) + start_prog
-				# self.emit_progress(prog, "Preparing weather generator {name}...".format(name=row['name']))
-				i += 1
-
-				ids.append(row['id'])
-				wgn = {
-					"id": row['id'],
-					"name": row['name'],
-					"lat": row['lat'],
-					"lon": row['lon'],
-					"elev": row['elev'],
-					"rain_yrs": row['rain_yrs']
-				}
-				wgns.append(wgn)
-
-		prog = start_prog if records < 1 else round(i * (total_prog / 2) / records) + start_prog
-		# self.emit_progress(prog, "Inserting {total} weather generators...".format(total=len(ids)))
-		db_lib.bulk_insert(project_base.db, Weather_wgn_cli, wgns)
-
-		# Chunk the id array so we don't hit the SQLite parameter limit!
-		max_length = 999
-		id_chunks = [ids[i:i + max_length] for i in range(0, len(ids), max_length)]
-
-		i = 1
-		start_prog = start_prog + (total_prog / 2)
-
-		mon_count_query = "select count(*) from {table_name}".format(table_name=monthly_table)
-		total_mon_rows = conn.cursor().execute(mon_count_query).fetchone()[0]
-		current_total = 0
-
-		for chunk in id_chunks:
-			monthly_values = []
-			mon_query = "select * from {table_name} where wgn_id in ({ids})".format(table_name=monthly_table, ids=",".join('?'*len(chunk)))
-			mon_cursor = conn.cursor().execute(mon_query, chunk)
-			mon_data = mon_cursor.fetchall()
-			mon_records = len(mon_data)
-			i = 1
-
-			for row in mon_data:
-				if self.__abort: return
-
-				if i == 1 or (i % 12 == 0):
-					prog = round(i * (total_prog / 2) / mon_records) + start_prog
-					# self.emit_progress(prog, "Preparing monthly values {i}/{total}...".format(i=i, total=mon_records))
-				i += 1
-
-				mon = {
-					"weather_wgn_cli": row['wgn_id'],
-					"month": row['month'],
-					"tmp_max_ave": row['tmp_max_ave'],
-					"tmp_min_ave": row['tmp_min_ave'],
-					"tmp_max_sd": row['tmp_max_sd'],
-					"tmp_min_sd": row['tmp_min_sd'],
-					"pcp_ave": row['pcp_ave'],
-					"pcp_sd": row['pcp_sd'],
-					"pcp_skew": row['pcp_skew'],
-					"wet_dry": row['wet_dry'],
-					"wet_wet": row['wet_wet'],
-					"pcp_days": row['pcp_days'],
-					"pcp_hhr": row['pcp_hhr'],
-					"slr_ave": row['slr_ave'],
-					"dew_ave": row['dew_ave'],
-					"wnd_ave": row['wnd_ave']
-				}
-				monthly_values.append(mon)
-
-			prog = round(i * (total_prog / 2) / mon_records) + start_prog
-			current_total = current_total + mon_records
-			# self.emit_progress(prog, "Inserting monthly values {rec}/{total}...".format(rec=current_total, total=total_mon_rows))
-			db_lib.bulk_insert(project_base.db, Weather_wgn_cli_mon, monthly_values)
+		# self.emit_progress(start_prog, "Inserting weather generators...")
+		db = project_base.db
+		db.execute_sql("attach database ? as wgn", (self.wgn_database,))
+		try:
+			with db.atomic():
+				db.execute_sql("drop table if exists temp.wgn_import")
+				db.execute_sql("""create temp table wgn_import as
+					select w.id from wgn.{table} w
+					where not exists (select 1 from main.weather_wgn_cli e where e.name = w.name) {where}
+					order by w.name""".format(table=self.wgn_table, where=where), params)
+				db.execute_sql("""insert into main.weather_wgn_cli (id, name, lat, lon, elev, rain_yrs)
+					select w.id, w.name, w.lat, w.lon, w.elev, w.rain_yrs
+					from temp.wgn_import i join wgn.{table} w on w.id = i.id
+					order by i.rowid""".format(table=self.wgn_table))
+
+				# self.emit_progress(start_prog + total_prog / 2, "Inserting monthly values...")
+				db.execute_sql("""insert into main.weather_wgn_cli_mon ({fk}, {cols})
+					select m.wgn_id, {src_cols}
+					from wgn.{table} m
+					where m.wgn_id in (select id from temp.wgn_import)""".format(
+						fk=wgn_fk, cols=", ".join(mon_cols), src_cols=", ".join("m.{}".format(c) for c in mon_cols), table=monthly_table))
+				db.execute_sql("drop table temp.wgn_import")
+		finally:
+			db.execute_sql("detach database wgn")
 
 	def create_weather_stations(self, start_prog, total_prog):  # total_prog is the total progress percentage available for this method
 		if self.__abort: return
 
-		stations = []
-		query = Weather_wgn_cli.select()
-		records = query.count()
-		i = 1
-		for row in query:
-			if self.__abort: return
-
-			lat = row.lat
-			lon = row.lon
-			#name = "w{lat}{lon}".format(lat=abs(round(lat*1000)), lon=abs(round(lon*1000)))
-			name = weather_sta_name(lat, lon)
-
-			prog = round(i * total_prog / records) + start_prog
-			# self.emit_progress(prog, "Creating weather station {name}...".format(name=name))
-
-			try:
-				existing = Weather_sta_cli.get(Weather_sta_cli.name == name)
-			except Weather_sta_cli.DoesNotExist:
-				station = {
-					"name": name,
-					"hmd": None,
-					"pcp": None,
-					"slr": None,
-					"tmp": None,
-					"wnd": None,
-					"wnd_dir": None,
-					"atmo_dep": None,
-					"lat": lat,
-					"lon": lon,
-					"wgn": row.id
-				}
-
-				stations.append(station)
-			i += 1
-
-		db_lib.bulk_insert(project_base.db, Weather_sta_cli, stations)
+		# self.emit_progress(start_prog, "Creating weather stations...")
+		# Station names are made by weather_sta_name so they match stations created from observed weather files.
+		# Where several generators round to the same name, the first one is used.
+		project_base.db.register_function(weather_sta_name, "weather_sta_name", 2)
+		with project_base.db.atomic():
+			project_base.db.execute_sql("""insert into weather_sta_cli (name, lat, lon, wgn_id)
+				select w.name, w.lat, w.lon, min(w.id)
+				from (select weather_sta_name(lat, lon) as name, lat, lon, id from weather_wgn_cli) w
+				where not exists (select 1 from weather_sta_cli s where s.name = w.name)
+				group by w.name
+				order by min(w.id)""")
 
 	def match_to_weather_stations(self, start_prog, total_prog):
 		if Weather_wgn_cli.select().count() > 0:
-			with project_base.db.atomic():
-				query = Weather_sta_cli.select()
-				records = query.count()
-				i = 1
-				for row in query:
-					if self.__abort: return
-
-					prog = round(i * total_prog / records) + start_prog
-					i += 1
-
-					if row.lat is not None and row.lon is not None:
-						id = closest_lat_lon(project_base.db, "weather_wgn_cli", row.lat, row.lon)
-
-						# self.emit_progress(prog, "Updating weather station with generator {i}/{total}...".format(i=i, total=records))
-						row.wgn_id = id
-						row.save()
+			if self.__abort: return
+			update_closest_lat_lon("weather_sta_cli", "wgn_id", "weather_wgn_cli")
 
 
 if __name__ == '__main__':
@@ -808,16 +822,18 @@ if __name__ == '__main__':
 	parser.add_argument("delete_existing", type=str, help="y/n delete existing data first")
 	parser.add_argument("create_stations", type=str, help="y/n create stations for wgn")
 	parser.add_argument("source_dir", type=str, help="full path of SWAT2012 weather files", nargs="?")
+	parser.add_argument("--workers", type=int, help="number of processes converting SWAT2012 station files (default up to 4)", nargs="?")
+	parser.add_argument("--weather_store", action="store_true", help="keep observed weather in the compressed weather store instead of (SWAT2012) or as well as (SWAT+) text files")
 	args = parser.parse_args()
 
 	del_ex = True if args.delete_existing == "y" else False
 	cre_sta = True if args.create_stations == "y" else False
 
 	if args.import_type == "observed":
-		api = WeatherImport(args.project_db_file, del_ex, cre_sta)
+		api = WeatherImport(args.project_db_file, del_ex, cre_sta, args.weather_store)
 		api.import_data()
 	elif args.import_type == "observed2012":
-		api = Swat2012WeatherImport(args.project_db_file, del_ex, cre_sta, args.source_dir)
+		api = Swat2012WeatherImport(args.project_db_file, del_ex, cre_sta, args.source_dir, args.workers, args.weather_store)
 		api.import_data()
 	elif args.import_type == "wgn":
 		api = WgnImport(args.project_db_file, del_ex, cre_sta)
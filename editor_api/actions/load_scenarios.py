@@ -1,38 +1,50 @@
 from helpers.executable_api import ExecutableApi, Unbuffered
 from helpers import utils
+from helpers.scenario_store import ScenarioStore
+from database import lib
 
 import sys
 import argparse
 import os, os.path
-from shutil import copyfile, copytree, rmtree
+from shutil import copyfile
 import time
 
 class LoadScenarios(ExecutableApi):
 	def load(self, project_db, name):
 		try:
-			self.emit_progress(10, 'Removing default scenario files...')
 			project_path = os.path.dirname(project_db)
 			scenarios_path = os.path.join(project_path, 'Scenarios')
 			new_scenario_path = os.path.join(scenarios_path, name)
-			
+			project_db_file = os.path.relpath(project_db, project_path).replace('\\', '/')
+			store = ScenarioStore(project_path)
+			store.clean(scenarios_path)
+
+			if not store.has_manifest(name):
+				# Scenario saved before the scenario store existed: add its files to the store first.
+				self.emit_progress(10, 'Adding scenario files to the scenario store...')
+				if not os.path.exists(os.path.join(new_scenario_path, project_db_file)):
+					raise IOError('Could not locate scenario database file. Your scenario might not be properly saved.')
+				files = {}
+				store.add_dir(new_scenario_path, '', files)
+				store.save_manifest(name, {'project_db': project_db_file, 'files': files})
+
+			manifest = store.get_manifest(name)
+			db_key = manifest['project_db']
+			if db_key not in manifest['files']:
+				raise IOError('Could not locate scenario database file. Your scenario might not be properly saved.')
+
 			default_scenario_path = os.path.join(scenarios_path, 'Default')
-			if not os.path.exists(default_scenario_path):
+			if not os.path.exists(default_scenario_path) and os.path.exists(os.path.join(scenarios_path, 'default')):
 				default_scenario_path = os.path.join(scenarios_path, 'default')
-			
-			if os.path.exists(default_scenario_path):
-				rmtree(default_scenario_path)
 
-			self.emit_progress(60, 'Copying scenario files...')
-			copytree(new_scenario_path, os.path.join(scenarios_path, 'Default'))
+			self.emit_progress(30, 'Updating changed scenario files...')
+			scenario_files = {k: v for k, v in manifest['files'].items() if k != db_key}
+			store.sync(scenario_files, default_scenario_path)
 
 			self.emit_progress(90, 'Copying project database...')
-			base_path = os.path.dirname(project_db)
-			project_db_file = os.path.relpath(project_db, base_path)
-			new_db_file = os.path.join(new_scenario_path, project_db_file)
-			if not os.path.exists(new_db_file):
-				raise IOError('Could not locate scenario database file. Your scenario might not be properly saved.')
-			os.remove(project_db)
-			copyfile(new_db_file, project_db)
+			lib.remove_db(project_db)
+			copyfile(store.object_path(manifest['files'][db_key]), project_db)
+			store.close()
 		except Exception as ex:
 			sys.exit(ex)
 
@@ -44,25 +56,28 @@ class LoadScenarios(ExecutableApi):
 			if not os.path.exists(scenarios_path):
 				os.makedirs(scenarios_path)
 			new_scenario_path = os.path.join(scenarios_path, new_name)
-			if os.path.exists(new_scenario_path):
+			store = ScenarioStore(project_path)
+			store.clean(scenarios_path)
+			if os.path.exists(new_scenario_path) or store.has_manifest(new_name):
 				raise IOError('A scenario with this name already exists. Please enter a unique name and try again.')
-			os.makedirs(new_scenario_path)
 
-			new_txtinout_path = os.path.join(new_scenario_path, 'TxtInOut')
-			#os.makedirs(new_txtinout_path)
-			self.emit_progress(30, 'Copying input files...')
-			copytree(txtinout_path, new_txtinout_path)
+			files = {}
+			self.emit_progress(30, 'Storing input files...')
+			store.add_dir(txtinout_path, 'TxtInOut', files)
 
 			if txtinout_path != results_path:
-				new_results_path = os.path.join(new_scenario_path, 'Results')
-				#os.makedirs(new_results_path)
-				self.emit_progress(60, 'Copying result files...')
-				copytree(results_path, new_results_path)
+				self.emit_progress(60, 'Storing result files...')
+				store.add_dir(results_path, 'Results', files)
 
-			base_path = os.path.dirname(project_db)
-			project_db_file = os.path.relpath(project_db, base_path)
-			self.emit_progress(90, 'Copying project database...')
-			copyfile(project_db, os.path.join(new_scenario_path, project_db_file))
+			project_db_file = os.path.relpath(project_db, project_path).replace('\\', '/')
+			self.emit_progress(80, 'Storing project database...')
+			lib.checkpoint(project_db)
+			files[project_db_file] = store.add_file(project_db)
+
+			self.emit_progress(90, 'Linking scenario files...')
+			store.save_manifest(new_name, {'project_db': project_db_file, 'files': files})
+			store.materialise(files, new_scenario_path)
+			store.close()
 		except Exception as ex:
 			sys.exit(ex)
 
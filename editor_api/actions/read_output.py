@@ -14,6 +14,7 @@ from database.output import base, data
 from database import lib as db_lib
 from database.project.setup import SetupProjectDatabase
 from database.project.connect import Rout_unit_con
+from helpers import columnar_output
 
 from datetime import datetime
 import sys
@@ -21,6 +22,26 @@ import argparse
 import os, os.path
 import csv
 import re
+import io
+import time
+import fnmatch
+import multiprocessing
+import itertools
+from shutil import rmtree
+from concurrent.futures import ProcessPoolExecutor
+from queue import Empty
+
+try:
+	import pandas
+except ImportError:
+	pandas = None
+
+OUTPUT_FORMAT_SQLITE = 'sqlite'
+OUTPUT_FORMAT_PARQUET = 'parquet'
+OUTPUT_FORMAT_BOTH = 'both'
+
+# Seconds to wait for a worker message before checking whether workers ended without reporting
+WORKER_POLL_SECONDS = 5
 
 default_start_line = 4
 default_units_column_index = 7
@@ -139,12 +160,450 @@ time_series_labels = {
 	'aa': 'avg. annual'
 }
 
+index_column_sets = [
+	['unit', 'yr', 'mon', 'day'],
+	['gis_id', 'yr', 'mon', 'day']
+]
+
+summary_periods = {
+	'mon': ['yr', 'mon'],
+	'yr': ['yr']
+}
+
+# Columns with these units are totals over the time step and are summed into monthly and
+# yearly summaries; all other columns (rates, concentrations, states) are averaged.
+summed_units = [
+	'mm', 'mm h2o', 'ha-m', 'm^3', 'm3', 'tons', 'ton', 't', 'kg', 'kgs', 'kg/ha', 'kgn/ha', 'kgp/ha',
+	't/ha', 'tons/ha', 'mg', 'mg/ha', 'g', 'g/ha'
+]
+
+# State variables are amounts at a point in time, not totals over the time step, so they are averaged
+# even when their units are summed for other columns, e.g. soil water in mm or reservoir storage in m^3.
+# Columns ending in _stor (constituent storages) are states as well.
+state_columns = [
+	'sw_init', 'sw_final', 'sw_ave', 'sw_300', 'sno_init', 'sno_final', 'snopack', 'stor', 'stor_init',
+	'stor_final', 'stor_ave', 'no3_st', 'dep_wt', 'bioms', 'plant_bioms', 'residue', 'lai'
+]
+
+
+def get_column_descriptions(name, desc_key, file_fields, units):
+	ui = units_start_column_index.get(desc_key, default_units_column_index)
+	reverse_index = True if desc_key in reversed_unit_lines else False
+	col_descs = []
+	null_skip = 0
+	for x in range(0, len(units)):
+		try:
+			column_name_val = file_fields[x] if reverse_index else file_fields[ui + x]
+			if column_name_val == 'null':
+				units_val = ''
+				null_skip += 1
+			else:
+				units_val = units[ui + x - null_skip] if reverse_index else units[x - null_skip]
+
+			col_desc_text = None
+			table_cat = data.table_categories.get(desc_key, None)
+			if table_cat is not None:
+				cat_cols = data.category_descriptions.get(table_cat, None)
+				if cat_cols is not None:
+					col_desc_text = cat_cols.get(column_name_val, None)
+
+			col_desc = {
+				'table_name': name,
+				'column_name': column_name_val,
+				'units': units_val, 
+				'description': col_desc_text
+			}
+			col_descs.append(col_desc)
+		except IndexError:
+			pass
+	return col_descs
+
+
+def get_date_key(time_step, yr, mon, day):
+	"""
+	Comparable integer for a date at the resolution of a table's time step; works on columns too.
+	"""
+	if time_step == 'day':
+		return yr * 10000 + mon * 100 + day
+	elif time_step == 'mon':
+		return yr * 100 + mon
+	return yr
+
+
+class OutputFilter:
+	"""
+	Limits which output tables, units and dates are imported. Rows are dropped while files are parsed.
+	:param tables: table name patterns to import, e.g. ['channel_sd_*', 'hru_wb_yr'] (default all)
+	:param exclude_tables: table name patterns to skip
+	:param units: unit ids to import (default all)
+	:param start_date: first date to import as YYYY, YYYY-MM or YYYY-MM-DD
+	:param end_date: last date to import as YYYY, YYYY-MM or YYYY-MM-DD
+	"""
+	def __init__(self, tables=None, exclude_tables=None, units=None, start_date=None, end_date=None):
+		self.tables = tables if tables is not None and len(tables) > 0 else None
+		self.exclude_tables = exclude_tables if exclude_tables is not None else []
+		self.units = set(units) if units is not None and len(units) > 0 else None
+		self.start = self.parse_date(start_date, (1, 1)) if start_date else None
+		self.end = self.parse_date(end_date, (12, 31)) if end_date else None
+
+	@staticmethod
+	def parse_date(val, defaults):
+		try:
+			parts = [int(p) for p in str(val).split('-')]
+			if len(parts) < 1 or len(parts) > 3:
+				raise ValueError
+		except ValueError:
+			raise ValueError('Invalid date {}; use YYYY, YYYY-MM or YYYY-MM-DD'.format(val))
+		parts.extend(defaults[len(parts) - 1:])
+		return tuple(parts)
+
+	@staticmethod
+	def parse_units(val):
+		"""
+		Unit ids from text such as "1,4,10-20".
+		"""
+		if val is None or val.strip() == '':
+			return None
+		units = []
+		for part in val.split(','):
+			bounds = part.strip().split('-')
+			if len(bounds) == 2:
+				units.extend(range(int(bounds[0]), int(bounds[1]) + 1))
+			else:
+				units.append(int(part))
+		return units
+
+	@staticmethod
+	def parse_list(val):
+		return None if val is None else [v.strip() for v in val.split(',') if v.strip() != '']
+
+	def includes_table(self, name):
+		if self.tables is not None and not any(fnmatch.fnmatch(name, p) for p in self.tables):
+			return False
+		return not any(fnmatch.fnmatch(name, p) for p in self.exclude_tables)
+
+	def get_time_step(self, name):
+		"""
+		Date resolution used to compare rows of a table to the date window, or None to keep every row.
+		"""
+		for key in ['day', 'mon', 'yr']:
+			if name.endswith('_{}'.format(key)):
+				return key
+		return None
+
+	def get_row_filter(self, name, columns):
+		"""
+		:return: a RowFilter for the table, or None if all its rows are kept
+		"""
+		time_step = self.get_time_step(name) if 'yr' in columns else None
+		unit_index = columns.index('unit') if self.units is not None and 'unit' in columns else None
+		start = get_date_key(time_step, *self.start) if self.start is not None and time_step is not None else None
+		end = get_date_key(time_step, *self.end) if self.end is not None and time_step is not None else None
+		if unit_index is None and start is None and end is None:
+			return None
+		return RowFilter(columns, time_step, self.units if unit_index is not None else None, start, end)
+
+
+class RowFilter:
+	"""
+	Unit and date tests for the rows of one table, on parsed data frames or raw split lines.
+	"""
+	def __init__(self, columns, time_step, units, start, end):
+		self.time_step = time_step
+		self.units = units
+		self.start = start
+		self.end = end
+		self.unit_index = columns.index('unit') if units is not None else None
+		self.date_indexes = [columns.index(c) for c in ['yr', 'mon', 'day'] if c in columns]
+
+	def frame_mask(self, df):
+		mask = pandas.Series(True, index=df.index)
+		if self.units is not None:
+			mask &= df['unit'].isin(self.units)
+		if self.start is not None or self.end is not None:
+			key = get_date_key(self.time_step, df['yr'], df['mon'] if 'mon' in df.columns else 0, df['day'] if 'day' in df.columns else 0)
+			if self.start is not None:
+				mask &= key >= self.start
+			if self.end is not None:
+				mask &= key <= self.end
+		return mask
+
+	def keep_line(self, val):
+		try:
+			if self.units is not None and int(val[self.unit_index]) not in self.units:
+				return False
+			if self.start is not None or self.end is not None:
+				date = [int(val[i]) for i in self.date_indexes] + [0, 0]
+				key = get_date_key(self.time_step, date[0], date[1], date[2])
+				if (self.start is not None and key < self.start) or (self.end is not None and key > self.end):
+					return False
+		except (ValueError, IndexError):
+			return False
+		return True
+
+
+def get_summary_function(column, units):
+	if column in state_columns or column.endswith('_stor'):
+		return 'AVG'
+	return 'SUM' if units is not None and units.strip().lower() in summed_units else 'AVG'
+
+
+def parse_output_file(file_name, name, columns, start_line, desc_key='', batch_size=10000, column_types=None, row_filter=None):
+	"""
+	Parse a SWAT+ output file into batches of row tuples matching columns.
+	Yields ('columns', column descriptions) once for files with a units line, then ('rows', batch) messages.
+	The header lines are read once; the data block is parsed with the pandas C tokenizer when pandas is
+	installed and column_types are given, otherwise line by line. Rows rejected by row_filter are dropped
+	as they are parsed. If the C tokenizer fails part way, ('reset', None) tells the reader to discard the rows
+	sent so far, and the whole file is sent again from the line parser.
+	"""
+	read_units = False if desc_key in ignore_units else True
+	file_fields = []
+	col_descs = None
+	with open(file_name, 'r') as file:
+		for i, line in enumerate(itertools.islice(file, start_line - 1), 1):
+			if read_units and i == start_line - 2:
+				file_fields = line.split()
+			elif read_units and i == start_line - 1:
+				col_descs = get_column_descriptions(name, desc_key, file_fields, line.split())
+	if col_descs is not None:
+		yield 'columns', col_descs
+
+	if pandas is not None and column_types is not None:
+		sent = False
+		try:
+			for num_read, rows in read_data_block(file_name, column_types, start_line, batch_size, row_filter):
+				if len(rows) > 0:
+					sent = True
+					yield 'rows', rows
+			return
+		except (ValueError, pandas.errors.ParserError):
+			# layout the C tokenizer cannot handle. Blank lines it skipped make its row count differ from the
+			# line count, so start over with the line parser rather than resume.
+			if sent:
+				yield 'reset', None
+				if col_descs is not None:
+					yield 'columns', col_descs
+
+	for rows in read_data_lines(file_name, columns, start_line, batch_size, row_filter):
+		yield 'rows', rows
+
+
+def read_data_block(file_name, column_types, start_line, batch_size, row_filter=None):
+	"""
+	Parse the data block of an output file with the pandas C tokenizer.
+	Fortran overflow values (****) become NULL, in text columns as well as numeric ones.
+	Yields the number of lines read and the rows kept for each chunk.
+	"""
+	with open(file_name, 'r') as file:
+		first = next(itertools.islice(file, start_line - 1, None), None)
+	if first is None:
+		return
+
+	yield from read_data_frames(file_name, column_types, len(first.split()), start_line - 1, batch_size, row_filter)
+
+
+def read_data_frames(source, column_types, num_line_cols, skip_lines, batch_size, row_filter=None):
+	columns = [c for c, t in column_types]
+	num_file_cols = min(len(columns), num_line_cols)
+	text_cols = {c: str for c, t in column_types[:num_file_cols] if t == 'str'}
+	# Only Fortran overflow values are missing, as in parse_data_lines; text such as NA or None is kept as written
+	reader = pandas.read_csv(source, sep=r'\s+', header=None, skiprows=skip_lines, usecols=range(num_file_cols),
+							 names=columns[:num_file_cols], dtype=text_cols, keep_default_na=False, na_values=['****'],
+							 engine='c', chunksize=batch_size)
+	for df in reader:
+		num_read = len(df)
+		for c, t in column_types[:num_file_cols]:
+			if t == 'str':
+				df[c] = df[c].where(~df[c].str.contains('*', regex=False, na=False))
+			elif not pandas.api.types.is_numeric_dtype(df[c]):
+				df[c] = pandas.to_numeric(df[c], errors='coerce')
+
+		if 'gis_id' in df.columns and 'name' in df.columns:
+			no_gis_id = df['gis_id'] == 0
+			if no_gis_id.any():
+				df.loc[no_gis_id, 'gis_id'] = df.loc[no_gis_id, 'name'].str.replace('[^0-9]', '', regex=True).astype(int)
+
+		if row_filter is not None:
+			df = df[row_filter.frame_mask(df)]
+			if len(df) < 1:
+				yield num_read, []
+				continue
+
+		for c in columns[num_file_cols:]:
+			df[c] = None
+
+		df = df.astype(object).where(df.notna(), None)
+		yield num_read, list(df.itertuples(index=False, name=None))
+
+
+def read_data_lines(file_name, columns, start_line, batch_size, row_filter=None):
+	with open(file_name, 'r') as file:
+		yield from parse_data_lines(itertools.islice(file, start_line - 1, None), columns, batch_size, row_filter)
+
+
+def parse_data_lines(lines, columns, batch_size, row_filter=None):
+	num_cols = len(columns)
+	gis_id_index = columns.index('gis_id') if 'gis_id' in columns else None
+	name_index = columns.index('name') if 'name' in columns else None
+
+	rows = []
+	for line in lines:
+		val = line.split()[:num_cols]
+		if len(val) < 1 or (row_filter is not None and not row_filter.keep_line(val)):
+			continue
+		row = [None if '*' in v else v for v in val]
+		if len(row) < num_cols:
+			row.extend([None] * (num_cols - len(row)))
+
+		if gis_id_index is not None and row[gis_id_index] is not None and int(row[gis_id_index]) == 0:
+			subbed = re.sub('[^0-9]','', row[name_index])
+			row[gis_id_index] = int(subbed)
+
+		rows.append(row)
+
+		if len(rows) == batch_size:
+			yield rows
+			rows = []
+
+	if len(rows) > 0:
+		yield rows
+
+
+def parse_data_text(text, column_types, batch_size, row_filter=None):
+	"""
+	Parse complete data lines of an output file held in memory, as read while following a running simulation.
+	"""
+	lines = text.splitlines()
+	first = next((line for line in lines if line.strip() != ''), None)
+	if first is None:
+		return
+
+	if pandas is not None:
+		try:
+			batches = []
+			for num_read, rows in read_data_frames(io.StringIO(text), column_types, len(first.split()), 0, batch_size, row_filter):
+				if len(rows) > 0:
+					batches.append(rows)
+			yield from batches
+			return
+		except (ValueError, pandas.errors.ParserError):
+			pass
+
+	yield from parse_data_lines(lines, [c for c, t in column_types], batch_size, row_filter)
+
+
+def parse_output_file_worker(queue, file, file_name, name, column_types, start_line, desc_key, batch_size, row_filter=None):
+	"""
+	Process pool entry point: parse one file and send its batches to the writer through the queue.
+	"""
+	try:
+		columns = [c for c, t in column_types]
+		for msg_type, value in parse_output_file(file_name, name, columns, start_line, desc_key, batch_size, column_types, row_filter):
+			queue.put((msg_type, file, value))
+		queue.put(('done', file, None))
+	except Exception as ex:
+		queue.put(('error', file, str(ex)))
+
+
+def get_dataset_dir(db_file):
+	return os.path.splitext(db_file)[0] + '_parquet'
+
+
+def replace_output(src_db_file, db_file):
+	"""
+	Move an output database, and the Parquet dataset next to it if any, over those of a previous import.
+	"""
+	db_lib.checkpoint(src_db_file)
+	db_lib.remove_db(db_file)
+	os.replace(src_db_file, db_file)
+	src_dataset_dir, dataset_dir = get_dataset_dir(src_db_file), get_dataset_dir(db_file)
+	if os.path.exists(src_dataset_dir):
+		if os.path.exists(dataset_dir):
+			rmtree(dataset_dir)
+		os.replace(src_dataset_dir, dataset_dir)
+
+
+def remove_output(db_file):
+	db_lib.remove_db(db_file)
+	if os.path.exists(get_dataset_dir(db_file)):
+		rmtree(get_dataset_dir(db_file))
+
+
+class OutputFileJob:
+	def __init__(self, file, file_name, name, table, desc_key, output_filter=None):
+		self.file = file
+		self.file_name = file_name
+		self.name = name
+		self.table = table
+		self.desc_key = desc_key
+		self.start_line = special_start_lines.get(desc_key, default_start_line)
+		self.column_types = columnar_output.get_column_types(table)
+		self.columns = [c for c, t in self.column_types]
+		self.row_filter = output_filter.get_row_filter(name, self.columns) if output_filter is not None else None
+		self.row_count = 0
+
+
+class OutputFileFollower:
+	"""
+	Reads the complete lines appended to an output file since the last read.
+	Files last modified before not_before (seconds since the epoch) are left by an earlier run and not read.
+	"""
+	def __init__(self, job, not_before=None):
+		self.job = job
+		self.not_before = not_before
+		self.offset = 0
+		self.header_lines = []
+		self.read_units = False if job.desc_key in ignore_units else True
+
+	def read(self, final=False, batch_size=10000):
+		"""
+		:param final: the file is no longer being written, so a last line without a line break is complete
+		:return: list of ('reset', None), ('columns', column descriptions) and ('rows', batch) messages;
+			'reset' means the file was rewritten and the rows read before must be discarded
+		"""
+		if not os.path.exists(self.job.file_name):
+			return []
+		if self.not_before is not None and os.path.getmtime(self.job.file_name) < self.not_before:
+			return []
+
+		messages = []
+		if os.path.getsize(self.job.file_name) < self.offset:
+			self.offset = 0
+			self.header_lines = []
+			messages.append(('reset', None))
+
+		with open(self.job.file_name, 'rb') as file:
+			file.seek(self.offset)
+			data = file.read()
+		if not final:
+			data = data[:data.rfind(b'\n') + 1]
+		if len(data) < 1:
+			return messages
+		self.offset += len(data)
+
+		text = data.decode()
+		num_header = self.job.start_line - 1
+		if len(self.header_lines) < num_header:
+			lines = text.splitlines(keepends=True)
+			needed = num_header - len(self.header_lines)
+			self.header_lines.extend(lines[:needed])
+			text = ''.join(lines[needed:])
+			if self.read_units and len(self.header_lines) == num_header:
+				file_fields = self.header_lines[num_header - 2].split()
+				units = self.header_lines[num_header - 1].split()
+				messages.append(('columns', get_column_descriptions(self.job.name, self.job.desc_key, file_fields, units)))
+
+		for rows in parse_data_text(text, self.job.column_types, batch_size, self.job.row_filter):
+			messages.append(('rows', rows))
+		return messages
+
 
 class ReadOutput(ExecutableApi):
-	def __init__(self, output_files_dir, db_file, swat_version, editor_version, project_name):
+	def __init__(self, output_files_dir, db_file, swat_version, editor_version, project_name, workers=None, output_format=OUTPUT_FORMAT_SQLITE, dataset_dir=None, summaries=False, output_filter=None):
 		self.__abort = False
 		try:
-			os.remove(db_file)
+			db_lib.remove_db(db_file)
 		except:
 			pass  # try to remove file, but don't report an error if it fails.
 
@@ -153,10 +612,104 @@ class ReadOutput(ExecutableApi):
 		self.swat_version = swat_version
 		self.editor_version = editor_version
 		self.project_name = project_name
+		self.workers = min(4, os.cpu_count() or 1) if workers is None else max(1, workers)
+		self.batch_size = 50000
+		self.summaries = summaries
+		self.output_filter = output_filter
+
+		self.write_sqlite = output_format != OUTPUT_FORMAT_PARQUET
+		self.columnar = None
+		if output_format in [OUTPUT_FORMAT_PARQUET, OUTPUT_FORMAT_BOTH]:
+			if dataset_dir is None:
+				dataset_dir = get_dataset_dir(db_file)
+			try:
+				self.columnar = columnar_output.ColumnarOutputWriter(dataset_dir.replace("\\","/"))
+			except ValueError as e:
+				sys.exit(e)
 
-	def read(self):		
+	@db_lib.timed('Importing output files')
+	def read(self):
+		self.setup_meta_tables()
+		try:
+			files = self.get_output_files()
+		except ValueError as ve:
+			sys.exit(ve)
+
+		jobs = []
+		for file in files:
+			job = self.create_job(file)
+			if job is not None:
+				jobs.append(job)
+
+		if self.workers > 1 and len(jobs) > 1:
+			self.read_parallel(jobs)
+		else:
+			self.read_serial(jobs)
+
+		self.finish(jobs)
+
+	@db_lib.timed('Following output files')
+	def follow(self, is_running, poll_interval=2.0, started=None):
+		"""
+		Import output files while the simulation writing them is still running. Complete lines appended to each
+		file since the last poll are committed to the output database, so the rows of finished time steps can be
+		queried during a long run. The remaining lines are read once is_running() returns False.
+		:param is_running: function returning True while the model is running
+		:param poll_interval: seconds between reads of the output files
+		:param started: time.time() when the model was started; older output files are left from an earlier run
+		"""
 		self.setup_meta_tables()
 		files_out_file = os.path.join(self.output_files_dir, 'files_out.out')
+		followers = {}
+		total_rows = 0
+		running = True
+		while running:
+			running = is_running()
+			try:
+				if started is not None and os.path.exists(files_out_file) and os.path.getmtime(files_out_file) < started:
+					files = []  # not yet written by this run
+				else:
+					files = self.get_output_files()
+			except ValueError:
+				files = []  # files_out.out is still being written; try again on the next poll
+
+			for file in files:
+				if file not in followers:
+					job = self.create_job(file)
+					followers[file] = OutputFileFollower(job, started) if job is not None else None
+
+			new_rows = 0
+			for follower in followers.values():
+				if follower is None:
+					continue
+				try:
+					messages = follower.read(final=not running, batch_size=self.batch_size)
+				except ValueError as e:
+					sys.exit('Error importing {file}: {e}'.format(file=follower.job.file, e=e))
+				if len(messages) > 0:
+					with base.db.atomic():
+						for msg_type, value in messages:
+							self.write_batch(follower.job, msg_type, value)
+					new_rows += sum(len(value) for msg_type, value in messages if msg_type == 'rows')
+
+			total_rows += new_rows
+			if new_rows > 0:
+				self.emit_progress(0, 'Imported {} rows from {} files during the simulation...'.format(total_rows, len(followers)))
+			if running:
+				time.sleep(poll_interval)
+
+		jobs = [f.job for f in followers.values() if f is not None]
+		for job in jobs:
+			self.close_job(job)
+
+		self.emit_progress(100, 'Imported {} rows from {} files'.format(total_rows, len(jobs)))
+		self.finish(jobs)
+
+	def get_output_files(self):
+		"""
+		Output files listed in files_out.out that can be imported.
+		"""
+		files_out_file = os.path.join(self.output_files_dir, 'files_out.out')
 		dot_out_files_to_read = [
 			'crop_yld_aa.out',
 			'flow_duration_curve.out'
@@ -180,117 +733,229 @@ class ReadOutput(ExecutableApi):
 					i += 1
 		except FileNotFoundError:
 			pass #sys.exit('Could not find file, {}'.format(files_out_file))
-		except ValueError as ve:
-			sys.exit(ve)
 
-		prog_step = 0 if len(files) < 1 else round(100 / len(files))
-		prog = 0
-		for file in files:
-			name = file[:-4].replace('hru-lte', 'hru_lte')
-			table_name = name[:1].upper() + name[1:]
-			try:
-				existing = base.Table_description.get_or_none(base.Table_description.table_name == name)
-				if existing is None:
-					self.emit_progress(prog, 'Importing {}...'.format(file))
-
-					desc_key = name
-					time_series_key = ''
-					for key in time_series_labels:
-						desc_key = desc_key.replace('_{}'.format(key), '')
-						if key in name:
-							time_series_key = key
-
-					description = '{ts} {n}'.format(ts=time_series_labels.get(time_series_key, ''), n=table_labels.get(desc_key, name))
-					base.Table_description.insert(table_name=name, description=description).execute()
+		return files
 
-					table_class = globals()[table_name]
-					base.db.create_tables([table_class])
-					table_class.delete().execute()
-
-					file_path = os.path.join(self.output_files_dir, file)
-					self.read_default_table(file_path, name, table_class, base.db, start_line=special_start_lines.get(desc_key, default_start_line), desc_key=desc_key)
-				prog += prog_step
-			except KeyError as e:
-				pass
-				#sys.exit('Table {table} does not exist: {e}'.format(table=table_name, e=e))
-			except ValueError as e:
-				sys.exit('Error importing {file}: {e}'.format(file=file, e=e))
+	def create_job(self, file):
+		"""
+		Create the output table for a file and return its import job, or None if the file is not imported.
+		"""
+		name = file[:-4].replace('hru-lte', 'hru_lte')
+		table_name = name[:1].upper() + name[1:]
+		if self.output_filter is not None and not self.output_filter.includes_table(name):
+			return None
+		try:
+			existing = base.Table_description.get_or_none(base.Table_description.table_name == name)
+			if existing is None:
+				desc_key = name
+				time_series_key = ''
+				for key in time_series_labels:
+					desc_key = desc_key.replace('_{}'.format(key), '')
+					if key in name:
+						time_series_key = key
+
+				description = '{ts} {n}'.format(ts=time_series_labels.get(time_series_key, ''), n=table_labels.get(desc_key, name))
+				base.Table_description.insert(table_name=name, description=description).execute()
+
+				table_class = globals()[table_name]
+				base.db.create_tables([table_class])
+				table_class.delete().execute()
+
+				job = OutputFileJob(file, os.path.join(self.output_files_dir, file), name, table_class, desc_key, self.output_filter)
+				if self.columnar is not None:
+					self.columnar.open_table(name, job.column_types)
+				return job
+		except KeyError as e:
+			pass
+			#sys.exit('Table {table} does not exist: {e}'.format(table=table_name, e=e))
+		return None
+
+	def finish(self, jobs):
+		if self.write_sqlite:
+			tables = [job.table for job in jobs]
+			if self.summaries:
+				tables.extend(self.create_summary_tables(jobs))
+			self.create_indexes(tables)
 
 		base.Project_config.create(project_name=self.project_name, editor_version=self.editor_version, swat_version=self.swat_version, output_import_time=datetime.now())
 
-	def read_default_table(self, file_name, name, table, db, start_line, ignore_id_col=True, desc_key=''):
-		file = open(file_name, 'r')
-		read_units = False if desc_key in ignore_units else True
-
-		i = 1
-		rows = []
-		fields = table._meta.sorted_fields
-		file_fields = []
-		for line in file:
-			if read_units and i == start_line - 2:
-				for h in line.strip().split():
-					file_fields.append(h.strip())
-			elif read_units and i == start_line - 1:
-				units = line.strip().split()
-				ui = units_start_column_index.get(desc_key, default_units_column_index)
-				reverse_index = True if desc_key in reversed_unit_lines else False
-				col_descs = []
-				null_skip = 0
-				for x in range(0, len(units)):					
-					try:
-						column_name_val = file_fields[x] if reverse_index else file_fields[ui + x]
-						if column_name_val == 'null':
-							units_val = ''
-							null_skip += 1
+	def read_serial(self, jobs):
+		prog_step = 0 if len(jobs) < 1 else 100 / len(jobs)
+		total_rows = 0
+		for i, job in enumerate(jobs):
+			self.emit_progress(round(i * prog_step), 'Importing {}...'.format(job.file))
+			try:
+				with db_lib.timed('Importing {}'.format(job.file)), base.db.atomic():
+					for msg_type, value in parse_output_file(job.file_name, job.name, job.columns, job.start_line, job.desc_key, self.batch_size, job.column_types, job.row_filter):
+						self.write_batch(job, msg_type, value)
+				self.close_job(job)
+			except ValueError as e:
+				sys.exit('Error importing {file}: {e}'.format(file=job.file, e=e))
+			total_rows += job.row_count
+
+		self.emit_progress(100, 'Imported {} rows from {} files'.format(total_rows, len(jobs)))
+
+	def read_parallel(self, jobs):
+		"""
+		Parse files concurrently in worker processes while this thread, the only writer,
+		streams their batches into the output database.
+		"""
+		jobs_by_file = {job.file: job for job in jobs}
+		pending = len(jobs)
+		total_rows = 0
+		errors = []
+
+		with db_lib.timed('Importing {} files with {} workers'.format(len(jobs), self.workers)), multiprocessing.Manager() as manager:
+			queue = manager.Queue(maxsize=self.workers * 4)
+			with ProcessPoolExecutor(max_workers=self.workers) as executor:
+				futures = {}
+				for job in jobs:
+					future = executor.submit(parse_output_file_worker, queue, job.file, job.file_name, job.name, job.column_types, job.start_line, job.desc_key, self.batch_size, job.row_filter)
+					futures[future] = job.file
+
+				self.emit_progress(0, 'Importing {} files...'.format(len(jobs)))
+				finished = set()
+
+				def handle(msg_type, file, value):
+					nonlocal pending, total_rows
+					if file in finished:
+						return  # reported as failed already; its rows were not kept
+					job = jobs_by_file[file]
+					if msg_type == 'done' or msg_type == 'error':
+						finished.add(file)
+						pending -= 1
+						if msg_type == 'error':
+							errors.append('Error importing {file}: {e}'.format(file=file, e=value))
 						else:
-							units_val = units[ui + x - null_skip] if reverse_index else units[x - null_skip]
-
-						col_desc_text = None
-						table_cat = data.table_categories.get(desc_key, None)
-						if table_cat is not None:
-							cat_cols = data.category_descriptions.get(table_cat, None)
-							if cat_cols is not None:
-								col_desc_text = cat_cols.get(column_name_val, None)
-
-						col_desc = {
-							'table_name': name,
-							'column_name': column_name_val,
-							'units': units_val, 
-							'description': col_desc_text
-						}
-						col_descs.append(col_desc)
-					except IndexError:
+							self.close_job(job)
+							total_rows += job.row_count
+						self.emit_progress(round(100 * (len(jobs) - pending) / len(jobs)), 'Imported {} ({} rows)'.format(file, job.row_count))
+					else:
+						with base.db.atomic():
+							self.write_batch(job, msg_type, value)
+
+				while pending > 0:
+					try:
+						handle(*queue.get(timeout=WORKER_POLL_SECONDS))
+						continue
+					except Empty:
 						pass
-				db_lib.bulk_insert(db, base.Column_description, col_descs)
-			elif i >= start_line:
-				val = line.strip().split()
-
-				row = {}
-				j = 0
-				for field in fields:
-					skip = False
-					if ignore_id_col and field.name == 'id':
-						skip = True
-
-					if not skip:
-						try:
-							row[field.name] = None if j >= len(val) or '*' in str(val[j]) else val[j]
-						except IndexError:
-							pass
-						j += 1
-
-				if 'gis_id' in row.keys() and int(row['gis_id']) == 0:
-					subbed = re.sub('[^0-9]','', row['name'])
-					row['gis_id'] = int(subbed)
 
-				rows.append(row)
+					# Messages are queued before a worker returns, so a finished worker whose messages are not in the
+					# queue died or could not start, e.g. killed or unable to receive its arguments
+					ended = [(future, file) for future, file in futures.items() if future.done() and file not in finished]
+					try:
+						while True:
+							handle(*queue.get_nowait())
+					except Empty:
+						pass
+					for future, file in ended:
+						if file not in finished:
+							finished.add(file)
+							pending -= 1
+							ex = future.exception()
+							errors.append('Error importing {file}: {e}'.format(file=file, e=ex if ex is not None else 'the worker process ended without reporting'))
+
+		if len(errors) > 0:
+			sys.exit('\n'.join(errors))
+
+		self.emit_progress(100, 'Imported {} rows from {} files'.format(total_rows, len(jobs)))
+
+	def write_batch(self, job, msg_type, value):
+		if msg_type == 'columns':
+			db_lib.bulk_insert(base.db, base.Column_description, value)
+		elif msg_type == 'rows':
+			if self.write_sqlite:
+				db_lib.bulk_load(base.db, job.table, job.columns, value)
+			if self.columnar is not None:
+				self.columnar.write(job.name, value)
+			job.row_count += len(value)
+		elif msg_type == 'reset':
+			if self.write_sqlite:
+				job.table.delete().execute()
+			base.Column_description.delete().where(base.Column_description.table_name == job.name).execute()
+			if self.columnar is not None:
+				self.columnar.open_table(job.name, job.column_types)
+			job.row_count = 0
+
+	def close_job(self, job):
+		if self.columnar is not None:
+			self.columnar.close_table(job.name)
+
+	@db_lib.timed('Indexing output tables')
+	def create_indexes(self, tables):
+		"""
+		Index output tables by unit and date once they are loaded, so queries filtering on a unit or
+		gis_id and a period do not scan the whole table. Building the index after the bulk load is
+		much faster than maintaining it during the inserts.
+		"""
+		self.emit_progress(100, 'Indexing output tables...')
+		for table in tables:
+			table_name = table._meta.table_name
+			table_cols = [f.column_name for f in table._meta.sorted_fields]
+			for cols in index_column_sets:
+				cols = [c for c in cols if c in table_cols]
+				if len(cols) < 2:
+					continue
+				base.db.execute_sql('CREATE INDEX IF NOT EXISTS "idx_{t}_{c}" ON "{t}" ({cols})'.format(
+					t=table_name, c=cols[0], cols=', '.join('"{}"'.format(c) for c in cols)))
+		base.db.execute_sql('ANALYZE')
+
+	@db_lib.timed('Creating monthly and annual summaries')
+	def create_summary_tables(self, jobs):
+		"""
+		Build monthly and yearly tables from imported daily output where SWAT+ did not print them and the output
+		filter does not exclude them. Totals (mm, kg/ha, tons, ...) are summed and other columns averaged; see
+		summed_units and state_columns.
+		:return: list of the tables created
+		"""
+		try:
+			printed = set(file[:-4].replace('hru-lte', 'hru_lte') for file in self.get_output_files())
+		except ValueError:
+			printed = set()
+		imported = set(job.name for job in jobs)
+		created = []
+		for job in jobs:
+			if not job.name.endswith('_day') or job.row_count < 1:
+				continue
+
+			units = {c.column_name: c.units for c in base.Column_description.select().where(base.Column_description.table_name == job.name)}
+			for period, group_cols in summary_periods.items():
+				name = '{}_{}'.format(job.name[:-4], period)
+				table_class = globals().get(name[:1].upper() + name[1:], None)
+				if name in imported or name in printed or table_class is None:
+					continue
+				if self.output_filter is not None and not self.output_filter.includes_table(name):
+					continue
+
+				self.emit_progress(100, 'Summarizing {} to {}...'.format(job.name, name))
+				select_cols = []
+				for c in job.columns:
+					if c in group_cols:
+						select_cols.append('"{}"'.format(c))
+					elif c in ['jday', 'mon', 'day', 'gis_id', 'name']:
+						select_cols.append('MAX("{}")'.format(c))
+					elif c == 'unit':
+						select_cols.append('"unit"')
+					else:
+						select_cols.append('{f}("{c}")'.format(f=get_summary_function(c, units.get(c, None)), c=c))
+
+				base.db.create_tables([table_class])
+				with base.db.atomic():
+					table_class.delete().execute()
+					base.db.execute_sql('INSERT INTO "{t}" ({cols}) SELECT {sel} FROM "{src}" GROUP BY "unit", {grp}'.format(
+						t=name, cols=', '.join('"{}"'.format(c) for c in job.columns), sel=', '.join(select_cols),
+						src=job.name, grp=', '.join('"{}"'.format(c) for c in group_cols)))
 
-				if len(rows) == 1000:
-					db_lib.bulk_insert(db, table, rows)
-					rows = []
-			i += 1
+					day_desc = base.Table_description.get(base.Table_description.table_name == job.name).description
+					description = day_desc.replace(time_series_labels['day'], time_series_labels[period], 1) + ' (summarized from daily output)'
+					base.Table_description.insert(table_name=name, description=description).execute()
+					col_descs = [{'table_name': name, 'column_name': c, 'units': u, 'description': None} for c, u in units.items()]
+					db_lib.bulk_insert(base.db, base.Column_description, col_descs)
 
-		db_lib.bulk_insert(db, table, rows)
+				imported.add(name)
+				created.append(table_class)
+		return created
 
 	def setup_meta_tables(self):
 		base.db.create_tables([
@@ -310,7 +975,21 @@ if __name__ == '__main__':
 	parser.add_argument("--project_name", type=str, help="project name", nargs="?")
 	parser.add_argument("--editor_version", type=str, help="editor version", nargs="?")
 	parser.add_argument("--swat_version", type=str, help="editor version", nargs="?")
+	parser.add_argument("--workers", type=int, help="number of processes parsing output files (default up to 4)", nargs="?")
+	parser.add_argument("--output_format", type=str, help="sqlite, parquet or both (default sqlite)", nargs="?", default=OUTPUT_FORMAT_SQLITE)
+	parser.add_argument("--dataset_dir", type=str, help="full path of the parquet dataset directory (default next to the database)", nargs="?")
+	parser.add_argument("--summaries", action="store_true", help="build monthly and yearly tables from daily output that SWAT+ did not print")
+	parser.add_argument("--tables", type=str, help="comma separated table name patterns to import, e.g. channel_sd_*,hru_wb_yr (default all)", nargs="?")
+	parser.add_argument("--exclude_tables", type=str, help="comma separated table name patterns to skip", nargs="?")
+	parser.add_argument("--units", type=str, help="unit ids to import, e.g. 1,4,10-20 (default all)", nargs="?")
+	parser.add_argument("--start_date", type=str, help="first date to import as YYYY, YYYY-MM or YYYY-MM-DD", nargs="?")
+	parser.add_argument("--end_date", type=str, help="last date to import as YYYY, YYYY-MM or YYYY-MM-DD", nargs="?")
 	args = parser.parse_args()
 
-	api = ReadOutput(args.output_files_dir, args.db_file, args.swat_version, args.editor_version, args.project_name)
+	try:
+		output_filter = OutputFilter(OutputFilter.parse_list(args.tables), OutputFilter.parse_list(args.exclude_tables), OutputFilter.parse_units(args.units), args.start_date, args.end_date)
+	except ValueError as e:
+		sys.exit(e)
+
+	api = ReadOutput(args.output_files_dir, args.db_file, args.swat_version, args.editor_version, args.project_name, args.workers, args.output_format, args.dataset_dir, args.summaries, output_filter)
 	api.read()
@@ -7,6 +7,7 @@ from database.project.setup import SetupProjectDatabase
 from database.datasets.setup import SetupDatasetsDatabase
 from database.datasets.definitions import Version
 from .import_gis import GisImport
+from .import_gis_changes import GisChangesImport
 from . import update_project
 
 import sys
@@ -17,7 +18,7 @@ from shutil import copyfile
 import time
 
 class ReimportGis(ExecutableApi):
-	def __init__(self, project_db, editor_version, project_name=None, datasets_db=None, constant_ps=True, is_lte=False):
+	def __init__(self, project_db, editor_version, project_name=None, datasets_db=None, constant_ps=True, is_lte=False, incremental=False):
 		self.__abort = False
 
 		base_path = os.path.dirname(project_db)
@@ -53,12 +54,18 @@ class ReimportGis(ExecutableApi):
 			if not os.path.exists(bak_dir):
 				os.makedirs(bak_dir)
 			backup_db_file = os.path.join(bak_dir, bak_filename)
+			lib.checkpoint(project_db)
 			copyfile(project_db, backup_db_file)
 		except IOError as err:
 			sys.exit(err)
 
 		self.emit_progress(5, 'Updating project settings...')
 		config = Project_config.get() # Get again due to modification when updating
+		if incremental and config.is_lte == is_lte:
+			api = GisChangesImport(project_db, constant_ps, backup_db_file)
+			api.reimport()
+			return
+
 		config.imported_gis = False
 		config.is_lte = is_lte
 		config.save()
@@ -76,10 +83,12 @@ if __name__ == '__main__':
 	parser.add_argument("--datasets_db_file", type=str, help="full path of datasets SQLite database file", nargs="?")
 	parser.add_argument("--constant_ps", type=str, help="y/n constant point source values (default n)", nargs="?")
 	parser.add_argument("--is_lte", type=str, help="y/n use lte version of SWAT+ (default n)", nargs="?")
+	parser.add_argument("--incremental", type=str, help="y/n only re-import GIS data that changed since the last import (default n)", nargs="?")
 
 	args = parser.parse_args()
 
 	constant_ps = True if args.constant_ps == "y" else False
 	is_lte = True if args.is_lte == "y" else False
+	incremental = True if args.incremental == "y" else False
 
-	api = ReimportGis(args.project_db_file, args.editor_version, args.project_name, args.datasets_db_file, constant_ps, is_lte)
+	api = ReimportGis(args.project_db_file, args.editor_version, args.project_name, args.datasets_db_file, constant_ps, is_lte, incremental)
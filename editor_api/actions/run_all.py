@@ -1,15 +1,20 @@
 from helpers.executable_api import ExecutableApi, Unbuffered
 from helpers import utils
+from helpers.scenario_store import break_links
 from .setup_project import SetupProject
 from .import_weather import WeatherImport, Swat2012WeatherImport, WgnImport
 from .write_files import WriteFiles
-from .read_output import ReadOutput
+from .read_output import ReadOutput, OUTPUT_FORMAT_SQLITE, replace_output, remove_output
 from database.project.config import Project_config
 from database.project.simulation import Time_sim
+from database.output import base as output_base
+from database import lib as db_lib
 
 import sys
 import argparse
 import os, os.path
+import subprocess
+import time
 from datetime import datetime
 
 
@@ -18,7 +23,7 @@ class RunAll(ExecutableApi):
 		weather_dir, weather_save_dir='', weather_import_format='plus',
 		wgn_import_method='database', wgn_db='C:/SWAT/SWATPlus/Databases/swatplus_wgn.sqlite', wgn_table='wgn_cfsr_world', wgn_csv_sta_file=None, wgn_csv_mon_file=None,
 		year_start=None, day_start=None, year_end=None, day_end=None,
-		input_files_dir=None, swat_version=None):
+		input_files_dir=None, swat_version=None, follow_output=False, output_format=OUTPUT_FORMAT_SQLITE):
 		# Setup project databases and import GIS data
 		SetupProject(project_db, editor_version, project_db.replace('.sqlite', '.json', 1))
 
@@ -56,18 +61,38 @@ class RunAll(ExecutableApi):
 		write_api = WriteFiles(project_db, swat_version)
 		write_api.write()
 
+		output_db_file = os.path.join(input_files_path, '../', 'Results', 'swatplus_output.sqlite')
+		project_name = Project_config.get().project_name
+
 		# Run the model
-		cwd = os.getcwd()
-		os.chdir(input_files_path)
-		run_result = os.system(swat_exe)
-		print(run_result)
+		break_links(input_files_path)
+		if follow_output:
+			# Import output while the model runs; rows of completed time steps are in the database during the run.
+			# The rows go to a separate database, which replaces the previous import only if the run succeeds.
+			running_db_file = os.path.join(input_files_path, '../', 'Results', 'swatplus_output_running.sqlite')
+			started = time.time()
+			process = subprocess.Popen(swat_exe, shell=True, cwd=input_files_path)
+			output_api = ReadOutput(input_files_path, running_db_file, swat_version, editor_version, project_name, output_format=output_format)
+			output_api.follow(lambda: process.poll() is None, started=started)
+			run_result = process.returncode
+			print(run_result)
+			db_lib.close_db(output_base.db)
+			if run_result == 0:
+				replace_output(running_db_file, output_db_file)
+			else:
+				remove_output(running_db_file)
+		else:
+			cwd = os.getcwd()
+			os.chdir(input_files_path)
+			run_result = os.system(swat_exe)
+			print(run_result)
+			os.chdir(cwd)
 
 		# Import output files to db if successful run
 		if run_result == 0:
-			os.chdir(cwd)
-			output_db_file = os.path.join(input_files_path, '../', 'Results', 'swatplus_output.sqlite')
-			output_api = ReadOutput(input_files_path, output_db_file)
-			output_api.read()
+			if not follow_output:
+				output_api = ReadOutput(input_files_path, output_db_file, swat_version, editor_version, project_name, output_format=output_format)
+				output_api.read()
 
 			m = Project_config.get()
 			m.swat_last_run = datetime.now()
@@ -94,10 +119,12 @@ if __name__ == '__main__':
 	parser.add_argument("--day_end", type=str, help="ending day of simulation (omit to use weather files dates)", nargs="?")
 	parser.add_argument("--input_files_dir", type=str, help="full path of where to write input files, defaults to Scenarios/Default/TxtInOut", nargs="?")
 	parser.add_argument("--swat_version", type=str, help="SWAT+ revision number", nargs="?")
+	parser.add_argument("--follow_output", action="store_true", help="import output files while the model is running")
+	parser.add_argument("--output_format", type=str, help="output import format: sqlite, parquet or both (default sqlite)", nargs="?", default=OUTPUT_FORMAT_SQLITE)
 
 	args = parser.parse_args()
 	api = RunAll(args.project_db_file, args.editor_version, args.swat_exe_file,
 		args.weather_dir, args.weather_save_dir, args.weather_import_format,
 		args.wgn_import_method, args.wgn_db, args.wgn_table, args.wgn_csv_sta_file, args.wgn_csv_mon_file,
 		args.year_start, args.day_start, args.year_end, args.day_end,
-		args.input_files_dir, args.swat_version)
+		args.input_files_dir, args.swat_version, args.follow_output, args.output_format)
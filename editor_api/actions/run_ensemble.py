@@ -0,0 +1,220 @@
+from helpers.executable_api import ExecutableApi, Unbuffered
+from helpers import utils
+from .import_weather import WeatherImport, Swat2012WeatherImport
+from .write_files import WriteFiles
+from .read_output import ReadOutput, OUTPUT_FORMAT_SQLITE
+from database import lib as db_lib
+from database.project import base as project_base
+from database.project.setup import SetupProjectDatabase
+from database.project.config import Project_config
+from database.project.climate import Weather_file
+from database.project.simulation import Time_sim
+
+import sys
+import argparse
+import os, os.path
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from shutil import copyfile
+
+ENSEMBLE_DIR = 'Scenarios/Ensemble'
+RESULTS_DIR = 'Results'
+WEATHER_CLI_FILES = ['hmd.cli', 'pcp.cli', 'slr.cli', 'tmp.cli', 'wnd.cli']
+CONFIG_PATHS = ['reference_db', 'wgn_db', 'weather_data_dir', 'input_files_dir']
+
+
+def get_members(weather_sources):
+	"""
+	Ensemble members as (name, weather directory) pairs. weather_sources is a directory whose sub-directories
+	each hold the weather of one member, or a text file with one member per line as 'path' or 'name,path'.
+	"""
+	members = []
+	if os.path.isdir(weather_sources):
+		for name in sorted(os.listdir(weather_sources)):
+			path = os.path.join(weather_sources, name)
+			if os.path.isdir(path):
+				members.append((name, path))
+	else:
+		with open(weather_sources, 'r') as f:
+			for line in f:
+				line = line.strip()
+				if line == '' or line.startswith('#'):
+					continue
+				parts = [p.strip() for p in line.split(',', 1)]
+				path = utils.full_path(weather_sources, parts[-1])
+				name = parts[0] if len(parts) > 1 else os.path.basename(os.path.normpath(path))
+				members.append((name, path))
+
+	names = [utils.get_valid_filename(name) for name, path in members]
+	if len(set(names)) != len(names):
+		raise ValueError('Ensemble member names must be unique: {}'.format(', '.join(names)))
+	return list(zip(names, [path for name, path in members]))
+
+
+def link_file(src, dest):
+	"""
+	Hard link src to dest, copying instead where links are not supported.
+	"""
+	if os.path.exists(dest):
+		os.remove(dest)
+	try:
+		os.link(src, dest)
+	except OSError:
+		copyfile(src, dest)
+
+
+def run_model(swat_exe, input_files_path):
+	with open(os.path.join(input_files_path, 'swat_run.log'), 'w') as log:
+		return subprocess.call(swat_exe, shell=True, cwd=input_files_path, stdout=log, stderr=subprocess.STDOUT)
+
+
+class RunEnsemble(ExecutableApi):
+	"""
+	Runs a project against several weather sources, e.g. downscaled climate projections.
+
+	Each member gets a copy of the project database with its own weather imported, in
+	<ensemble dir>/<member>/. Only the weather, simulation, climate and connection files are written for each
+	member; the other input files are written once, for the first member, and linked into the other members'
+	TxtInOut folders. Members are run at most workers at a time, and the output of each member is imported into
+	<ensemble dir>/Results/member=<name>/ as soon as its run ends.
+	"""
+	def __init__(self, project_db, editor_version, swat_exe, weather_sources, weather_import_format='plus',
+		ensemble_dir=None, workers=None, year_start=None, day_start=None, year_end=None, day_end=None,
+		swat_version=None, output_format=OUTPUT_FORMAT_SQLITE):
+		self.__abort = False
+		self.project_db = project_db
+		self.editor_version = editor_version
+		self.swat_exe = swat_exe
+		self.members = get_members(weather_sources)
+		self.weather_import_format = weather_import_format
+		self.ensemble_dir = utils.full_path(project_db, ENSEMBLE_DIR) if ensemble_dir is None else ensemble_dir
+		self.results_dir = os.path.join(self.ensemble_dir, RESULTS_DIR)
+		self.workers = min(4, os.cpu_count() or 1) if workers is None else max(1, workers)
+		self.time_sim = None if year_start is None else (day_start, year_start, day_end, year_end)
+		self.swat_version = swat_version
+		self.output_format = output_format
+
+		if len(self.members) < 1:
+			sys.exit('No ensemble members found in {}'.format(weather_sources))
+
+		SetupProjectDatabase.init(project_db)
+		self.project_name = Project_config.get().project_name
+
+	def run(self):
+		failed = []
+		with db_lib.timed('Running {} ensemble members with {} workers'.format(len(self.members), self.workers)), ThreadPoolExecutor(max_workers=self.workers) as executor:
+			runs = {}
+			shared_files = None
+			for i, (name, weather_dir) in enumerate(self.members):
+				if self.__abort: return
+				self.emit_progress(round(i * 50 / len(self.members)), 'Preparing ensemble member {}...'.format(name))
+				member_db, input_files_path = self.prepare_member(name, weather_dir, shared_files)
+				if shared_files is None:
+					shared_files = self.get_shared_files(input_files_path)
+				runs[executor.submit(run_model, self.swat_exe, input_files_path)] = (name, member_db, input_files_path)
+
+			done = 0
+			for future in as_completed(runs):
+				name, member_db, input_files_path = runs[future]
+				done += 1
+				if future.result() != 0:
+					failed.append(name)
+					continue
+
+				self.emit_progress(50 + round(done * 50 / len(runs)), 'Importing output of ensemble member {}...'.format(name))
+				self.import_output(name, member_db, input_files_path)
+
+		if len(failed) > 0:
+			sys.exit('SWAT+ did not run successfully for ensemble members: {}. See swat_run.log in their TxtInOut folders.'.format(', '.join(failed)))
+
+	def prepare_member(self, name, weather_dir, shared_files):
+		"""
+		Copy the project database for a member, import its weather, and write its input files.
+		Without shared_files, all input files are written; otherwise only the weather dependent ones, and
+		shared_files ({file name: path}) are linked.
+		"""
+		member_dir = os.path.join(self.ensemble_dir, name)
+		input_files_path = os.path.join(member_dir, 'TxtInOut')
+		if not os.path.exists(input_files_path):
+			os.makedirs(input_files_path)
+
+		member_db = os.path.join(member_dir, os.path.basename(self.project_db))
+		SetupProjectDatabase.init(self.project_db)
+		config = Project_config.get()
+		paths = {p: utils.full_path(self.project_db, getattr(config, p)) for p in CONFIG_PATHS}
+		db_lib.close_db(project_base.db)
+		db_lib.checkpoint(self.project_db)
+		db_lib.remove_db(member_db)
+		copyfile(self.project_db, member_db)
+
+		SetupProjectDatabase.init(member_db)
+		paths['weather_data_dir'] = weather_dir if self.weather_import_format == 'plus' else input_files_path
+		paths['input_files_dir'] = input_files_path
+		Project_config.update(**paths).execute()
+
+		if self.weather_import_format == 'plus':
+			weather_api = WeatherImport(member_db, True, True)
+		else:
+			weather_api = Swat2012WeatherImport(member_db, True, True, weather_dir)
+		weather_api.import_data()
+
+		if self.time_sim is not None:
+			day_start, year_start, day_end, year_end = self.time_sim
+			Time_sim.update_and_exec(day_start, year_start, day_end, year_end, 0)
+
+		write_api = WriteFiles(member_db, self.swat_version)
+		if shared_files is None:
+			write_api.write()
+		else:
+			write_api.write_simulation(0, 0)
+			write_api.write_climate(0, 0)
+			write_api.copy_weather_files(0, 0)
+			write_api.write_connect(0, 0)
+			written = set(os.listdir(input_files_path))
+			for file_name, path in shared_files.items():
+				if file_name not in written:
+					link_file(path, os.path.join(input_files_path, file_name))
+		return member_db, input_files_path
+
+	def get_shared_files(self, input_files_path):
+		"""
+		Input files of a member that do not depend on its weather, which other members can link to.
+		"""
+		weather_files = set(WEATHER_CLI_FILES)
+		weather_files.update(f.filename for f in Weather_file.select(Weather_file.filename))
+		return {f: os.path.join(input_files_path, f) for f in os.listdir(input_files_path) if f not in weather_files}
+
+	def import_output(self, name, member_db, input_files_path):
+		partition_dir = os.path.join(self.results_dir, 'member={}'.format(name))
+		os.makedirs(partition_dir, exist_ok=True)
+		output_api = ReadOutput(input_files_path, os.path.join(partition_dir, 'swatplus_output.sqlite'), self.swat_version, self.editor_version,
+			'{} {}'.format(self.project_name, name), output_format=self.output_format, dataset_dir=partition_dir)
+		output_api.read()
+
+		SetupProjectDatabase.init(member_db)
+		Project_config.update(swat_last_run=datetime.now(), output_last_imported=datetime.now()).execute()
+
+
+if __name__ == '__main__':
+	sys.stdout = Unbuffered(sys.stdout)
+	parser = argparse.ArgumentParser(description="Run a SWAT+ project against an ensemble of weather sources, e.g. climate projections")
+	parser.add_argument("--project_db_file", type=str, help="full path of project SQLite database file, with GIS and WGN data imported")
+	parser.add_argument("--editor_version", type=str, help="editor version")
+	parser.add_argument("--swat_exe_file", type=str, help="full path of the SWAT+ executable file")
+	parser.add_argument("--weather_sources", type=str, help="folder with one weather folder per member, or a text file with one 'path' or 'name,path' per line")
+	parser.add_argument("--weather_import_format", type=str, help="weather files import format (plus or old)", nargs="?", default="plus")
+	parser.add_argument("--ensemble_dir", type=str, help="full path of the folder for member inputs and results, defaults to Scenarios/Ensemble", nargs="?")
+	parser.add_argument("--workers", type=int, help="number of members run at the same time (default up to 4)", nargs="?")
+	parser.add_argument("--year_start", type=str, help="starting year of simulation (omit to use weather files dates)", nargs="?")
+	parser.add_argument("--day_start", type=str, help="starting day of simulation (omit to use weather files dates)", nargs="?")
+	parser.add_argument("--year_end", type=str, help="ending year of simulation (omit to use weather files dates)", nargs="?")
+	parser.add_argument("--day_end", type=str, help="ending day of simulation (omit to use weather files dates)", nargs="?")
+	parser.add_argument("--swat_version", type=str, help="SWAT+ revision number", nargs="?")
+	parser.add_argument("--output_format", type=str, help="output import format: sqlite, parquet or both (default sqlite)", nargs="?", default=OUTPUT_FORMAT_SQLITE)
+
+	args = parser.parse_args()
+	api = RunEnsemble(args.project_db_file, args.editor_version, args.swat_exe_file, args.weather_sources, args.weather_import_format,
+		args.ensemble_dir, args.workers, args.year_start, args.day_start, args.year_end, args.day_end,
+		args.swat_version, args.output_format)
+	api.run()
@@ -59,6 +59,7 @@ class SetupProject(ExecutableApi):
 				if not os.path.exists(bak_dir):
 					os.makedirs(bak_dir)
 				backup_db_file = os.path.join(bak_dir, bak_filename)
+				lib.checkpoint(project_db)
 				copyfile(project_db, backup_db_file)
 			except IOError as err:
 				sys.exit(err)
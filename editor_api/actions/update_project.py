@@ -70,6 +70,7 @@ class UpdateProject(ExecutableApi):
 				if not os.path.exists(bak_dir):
 					os.makedirs(bak_dir)
 				backup_db_file = os.path.join(bak_dir, bak_filename)
+				lib.checkpoint(project_db)
 				copyfile(project_db, os.path.join(bak_dir, bak_filename))
 			except IOError as err:
 				sys.exit(err)
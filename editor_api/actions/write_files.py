@@ -4,15 +4,17 @@ from database.project import base as project_base
 from database.project.setup import SetupProjectDatabase
 from database.project.config import Project_config
 from database.project.config import File_cio as project_file_cio, File_cio_classification
-from database.project.climate import Weather_file
+from database.project.climate import Weather_file, Weather_sta_cli
+from database.project.simulation import Time_sim
 
 from fileio import connect, exco, dr, recall, climate, channel, aquifer, hydrology, reservoir, hru, lum, soils, init, routing_unit, regions, simulation, hru_parm_db, config, ops, structural, decision_table, basin, change
-from helpers import utils
+from helpers import utils, weather_store
+from helpers.scenario_store import break_links
 
 import sys
 import argparse
 import os.path
-from datetime import datetime
+from datetime import datetime, date
 from shutil import copyfile
 
 NULL_FILE = "null"
@@ -41,6 +43,7 @@ class WriteFiles(ExecutableApi):
 					sys.exit('Weather data directory {dir} does not exist.'.format(dir=weather_data_dir))
 
 			self.__dir = input_files_dir
+			break_links(input_files_dir)
 			self.__weather_dir = weather_data_dir
 			self.__version = config.editor_version
 			self.__swat_version = swat_version
@@ -49,6 +52,7 @@ class WriteFiles(ExecutableApi):
 		except Project_config.DoesNotExist:
 			sys.exit('Could not retrieve project configuration from database')
 
+	@db_lib.timed('Writing input files')
 	def write(self):
 		try:
 			step = 3
@@ -162,7 +166,9 @@ class WriteFiles(ExecutableApi):
 		return file_names
 
 	def copy_weather_files(self, start_prog, allocated_prog):
-		if self.__weather_dir is not None and self.__dir != self.__weather_dir:
+		if weather_store.has_store(self.__weather_dir):
+			self.write_weather_from_store(start_prog)
+		elif self.__weather_dir is not None and self.__dir != self.__weather_dir:
 			self.copy_weather_file("hmd.cli", start_prog)
 			self.copy_weather_file("pcp.cli", start_prog)
 			self.copy_weather_file("slr.cli", start_prog)
@@ -179,6 +185,34 @@ class WriteFiles(ExecutableApi):
 					self.copy_weather_file(wf.filename, prog)
 					prog += prog_step
 
+	def write_weather_from_store(self, prog):
+		"""
+		Write text files only for the weather files used by the project's stations, for the simulated years.
+		Files that are not in the weather store, or that changed since they were stored, are copied. When the input files are written in the weather
+		directory itself, only station files missing there are written, for their full period.
+		"""
+		# self.emit_progress(prog, "Writing weather files from the weather store...")
+		files = {}
+		for var in weather_store.VARIABLES:
+			col = getattr(Weather_sta_cli, var)
+			query = Weather_sta_cli.select(col).where(col.is_null(False) & (col != 'sim')).distinct()
+			files[var] = [row[0] for row in query.tuples()]
+
+		start_date = None
+		end_date = None
+		time_sim = Time_sim.get_or_none()
+		if time_sim is not None and time_sim.yrc_start > 0 and time_sim.yrc_end >= time_sim.yrc_start:
+			start_date = date(time_sim.yrc_start, 1, 1)
+			end_date = date(time_sim.yrc_end, 12, 31)
+
+		store = weather_store.WeatherStore(self.__weather_dir)
+		if self.__dir == self.__weather_dir:
+			store.materialise(self.__dir, files, overwrite=False)
+			return
+
+		for file_name in store.materialise(self.__dir, files, start_date, end_date):
+			self.copy_weather_file(file_name, prog)
+
 	def copy_weather_file(self, file_name, prog):
 		try:
 			# self.emit_progress(prog, "Copying weather file {}...".format(file_name))
@@ -23,7 +23,7 @@ def val_exists(val):
 class SetupDatasetsDatabase():
 	@staticmethod
 	def init(datasets_db: str = None):
-		base.db.init(datasets_db, pragmas={'journal_mode': 'off'})
+		db_lib.init_db(base.db, datasets_db, db_lib.REFERENCE_PROFILE)
 	
 	@staticmethod
 	def create_tables():
@@ -41,7 +41,7 @@ class SetupDatasetsDatabase():
 	def check_version(datasets_db, editor_version):
 		min_version = 1.1
 		
-		conn = db_lib.open_db(datasets_db)
+		conn = db_lib.open_db(datasets_db, db_lib.REFERENCE_PROFILE)
 		if db_lib.exists_table(conn, 'version'):
 			SetupDatasetsDatabase.init(datasets_db)
 			m = definitions.Version.get()
@@ -5,12 +5,279 @@ if platform.system() == 'Windows':
 	sys.path.insert(0, os.path.join(os.environ["swatplus_wf_dir"], "packages"))
 
 from peewee import *
+from playhouse.pool import PooledSqliteDatabase
+from collections import OrderedDict
+from contextlib import contextmanager
+import logging
 import sqlite3
+import threading
+import time
+
+logger = logging.getLogger('swatplus.editor.db')
+
+BULK_PROFILE = 'bulk'
+INTERACTIVE_PROFILE = 'interactive'
+REFERENCE_PROFILE = 'reference'
+
+# Connection pragmas applied every time a database is opened.
+# bulk: command line actions (import_gis, read_output, write_files, ...) that load or dump whole tables.
+#   WAL with synchronous=NORMAL only syncs at checkpoints, so large transactions are no longer fsync-bound.
+# interactive: the REST API. WAL lets the editor read while a write is in progress; every commit is synced.
+# reference: the shipped datasets, wgn and soils databases, which may live in a read-only install folder
+#   where WAL cannot create its -wal/-shm files, so the journal mode is not set and SQLite's default rollback
+#   journal keeps the updates made by setup and project updates atomic.
+connection_profiles = {
+	BULK_PROFILE: {
+		'journal_mode': 'wal',
+		'synchronous': 'normal',
+		'cache_size': -128000,  # negative values are KiB, i.e. 128MB
+		'mmap_size': 1073741824,
+		'temp_store': 'memory'
+	},
+	INTERACTIVE_PROFILE: {
+		'journal_mode': 'wal',
+		'synchronous': 'full',
+		'cache_size': -32000,
+		'mmap_size': 268435456,
+		'temp_store': 'memory'
+	},
+	REFERENCE_PROFILE: {
+		'cache_size': -64000,
+		'mmap_size': 268435456,
+		'temp_store': 'memory'
+	}
+}
+
+default_profile = BULK_PROFILE
+
+
+def set_default_profile(profile):
+	global default_profile
+	if profile not in connection_profiles:
+		raise ValueError('Unknown database connection profile {}'.format(profile))
+	default_profile = profile
+
+
+def get_pragmas(profile=None):
+	return dict(connection_profiles[default_profile if profile is None else profile])
+
+
+class RoutedDatabase(DatabaseProxy):
+	"""
+	The database a set of models is bound to. Each thread can be routed to its own database, so concurrent
+	REST requests for different projects do not change each other's models; threads that have not been
+	routed use the shared default database, as command line actions do.
+	"""
+	__slots__ = ('_local', '_default')
+
+	def __init__(self, default):
+		object.__setattr__(self, '_local', threading.local())
+		object.__setattr__(self, '_default', default)
+		super(RoutedDatabase, self).__init__()
+
+	def __setattr__(self, attr, value):
+		object.__setattr__(self, attr, value)
+
+	@property
+	def obj(self):
+		db = getattr(self._local, 'db', None)
+		return self._default if db is None else db
+
+	@obj.setter
+	def obj(self, value):
+		pass  # set by Proxy.__init__; the database is chosen by route()
+
+	@property
+	def default(self):
+		return self._default
+
+	def route(self, db):
+		self._local.db = db
+
+	def routed(self):
+		return getattr(self._local, 'db', None)
+
+
+class DatabaseRegistry:
+	"""
+	Pooled databases keyed by file and connection profile, so the REST API reuses connections across requests
+	instead of reopening the project database each time. Holds at most max_size databases; the least recently
+	used database with no connection in use is closed when another one is opened.
+	"""
+	def __init__(self, max_size=8, max_connections=8):
+		self.max_size = max_size
+		self.max_connections = max_connections
+		self.databases = OrderedDict()
+		self.lock = threading.Lock()
+		self.routes = threading.local()
+
+	def get(self, name, profile):
+		key = (os.path.abspath(name), profile)
+		with self.lock:
+			db = self.databases.get(key, None)
+			if db is None:
+				db = PooledSqliteDatabase(name, pragmas=get_pragmas(profile), max_connections=self.max_connections, timeout=30, check_same_thread=False)
+				self.databases[key] = db
+				self.evict()
+			else:
+				self.databases.move_to_end(key)
+			return db
+
+	def evict(self):
+		for key in list(self.databases.keys()):
+			if len(self.databases) <= self.max_size:
+				break
+			db = self.databases[key]
+			if len(db._in_use) == 0:
+				db.close_idle()
+				del self.databases[key]
+				logger.debug('Closed {} (least recently used)'.format(key[0]))
+
+	def route(self, routed_db, name, profile):
+		db = self.get(name, profile)
+		current = routed_db.routed()
+		if current is not None and current is not db:
+			current.close()
+		routed_db.route(db)
+		if not hasattr(self.routes, 'dbs'):
+			self.routes.dbs = set()
+		self.routes.dbs.add(routed_db)
+
+	def release(self):
+		"""
+		Return the calling thread's connections to their pools and clear its routes. Call when a request ends.
+		"""
+		for routed_db in getattr(self.routes, 'dbs', []):
+			db = routed_db.routed()
+			if db is not None:
+				db.close()
+			routed_db.route(None)
+		self.routes.dbs = set()
+
+	def discard(self, name):
+		"""
+		Close every connection to a database file, e.g. before the file is replaced.
+		"""
+		path = os.path.abspath(name)
+		with self.lock:
+			for key in [k for k in self.databases.keys() if k[0] == path]:
+				self.databases.pop(key).close_all()
+
+
+registry = None
+
+
+def use_registry(max_size=8, max_connections=8):
+	"""
+	Open databases through a pooled connection registry, with models routed per thread. Used by the REST API.
+	"""
+	global registry
+	registry = DatabaseRegistry(max_size, max_connections)
+	return registry
+
+
+def release_connections():
+	if registry is not None:
+		registry.release()
+
+
+def create_db():
+	"""
+	Create the deferred peewee database used by a set of models. Call init_db to open it.
+	"""
+	return RoutedDatabase(SqliteDatabase(None))
+
+
+def init_db(db, name, profile=None):
+	"""
+	Point a peewee database at a SQLite file using the pragmas of the given connection profile.
+	With a registry in use, only the calling thread's models are pointed at the file.
+	"""
+	profile = default_profile if profile is None else profile
+	if registry is not None and isinstance(db, RoutedDatabase):
+		registry.route(db, name, profile)
+	else:
+		db = db.default if isinstance(db, RoutedDatabase) else db
+		db.init(name, pragmas=get_pragmas(profile))
+	logger.debug('Opened {} with {} profile'.format(name, profile))
+	return db
+
+
+def close_db(db):
+	"""
+	Close a database's connection to its file, including pooled connections kept by the registry.
+	"""
+	name = db.database
+	db.close()
+	if registry is not None and name:
+		registry.discard(name)
+
+
+def checkpoint(name):
+	"""
+	Move any pages still in the write-ahead log into the main database file.
+	Call before copying a database file on disk, otherwise the copy may be missing recent changes.
+	"""
+	if not os.path.exists(name):
+		return
+
+	conn = sqlite3.connect(name)
+	try:
+		if conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal':
+			conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+	finally:
+		conn.close()
+
+
+def remove_db(name):
+	"""
+	Delete a database file along with any write-ahead log files next to it.
+	"""
+	for f in [name, name + '-wal', name + '-shm']:
+		if os.path.exists(f):
+			os.remove(f)
+
+
+def get_file_stamp(name):
+	"""
+	Modification time and size of a database file and its write-ahead log, which together change whenever the
+	database content does. Use as a cache key for values computed from the database.
+	"""
+	stamp = []
+	for f in [name, name + '-wal']:
+		if os.path.exists(f):
+			st = os.stat(f)
+			stamp.extend([st.st_mtime_ns, st.st_size])
+		else:
+			stamp.extend([0, 0])
+	return tuple(stamp)
+
+
+@contextmanager
+def timed(label):
+	start = time.perf_counter()
+	try:
+		yield
+	finally:
+		logger.info('{} took {:.2f}s'.format(label, time.perf_counter() - start))
+
+
+def get_max_variables(db):
+	"""
+	Maximum number of parameters allowed in one statement by the SQLite library in use.
+	SQLite 3.32 raised the compiled default from 999 to 32766.
+	"""
+	while isinstance(db, Proxy):
+		db = db.obj  # models are bound to a RoutedDatabase
+	conn = db.connection() if isinstance(db, Database) else db
+	if hasattr(conn, 'getlimit'):
+		return conn.getlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER)
+	return 32766 if sqlite3.sqlite_version_info >= (3, 32, 0) else 999
 
 
 def bulk_insert(db, table, data):
 	if len(data) > 0:
-		max_vars = 999  # SQLite limit to the number of parameters in a query
+		max_vars = get_max_variables(db)
 		total_params = len(data[0]) * len(data)
 		num_insert = max_vars if max_vars > total_params else int(max_vars / len(data[0]))
 
@@ -18,9 +285,40 @@ def bulk_insert(db, table, data):
 			for idx in range(0, len(data), num_insert):
 				table.insert_many(data[idx:idx + num_insert]).execute()
 
+
+def bulk_load(db, table, columns, rows=None, arrays=None, or_replace=False):
+	"""
+	Insert plain values with one prepared statement inside a single transaction.
+	Unlike bulk_insert, values are not converted by the peewee fields, so they must already be
+	in their database form (numbers, strings, None, ids rather than model instances).
+
+	:param table: peewee model class or table name
+	:param columns: column names, in the order of the values in each row
+	:param rows: iterable of row tuples; or
+	:param arrays: one sequence of values per column
+	:return: number of rows inserted
+	"""
+	if arrays is not None:
+		rows = zip(*arrays)
+	if rows is None:
+		return 0
+
+	table_name = table if isinstance(table, str) else table._meta.table_name
+	sql = 'INSERT {replace}INTO "{table}" ({cols}) VALUES ({params})'.format(
+		replace='OR REPLACE ' if or_replace else '',
+		table=table_name,
+		cols=', '.join('"{}"'.format(c) for c in columns),
+		params=', '.join(['?'] * len(columns)))
+
+	with db.atomic():
+		cursor = db.cursor()
+		cursor.executemany(sql, rows)
+		return cursor.rowcount
+
+
 def bulk_update_ids(db, table, param_dict, id_list):
 	if len(id_list) > 0:
-		max_vars = 999  # SQLite limit to the number of parameters in a query
+		max_vars = get_max_variables(db)
 		total_params = len(param_dict) + len(id_list)
 		num_update = max_vars if max_vars > total_params else int(max_vars - len(param_dict))
 
@@ -31,31 +329,144 @@ def bulk_update_ids(db, table, param_dict, id_list):
 	return 1
 
 
-def open_db(name):
+def bulk_update_column(db, table, column, rows):
+	"""
+	Set one column of many rows with a single prepared UPDATE inside one transaction.
+
+	:param table: peewee model class or table name
+	:param rows: iterable of (id, value) pairs
+	:return: number of rows updated
+	"""
+	table_name = table if isinstance(table, str) else table._meta.table_name
+	sql = 'UPDATE "{table}" SET "{column}" = ? WHERE id = ?'.format(table=table_name, column=column)
+
+	with db.atomic():
+		cursor = db.cursor()
+		cursor.executemany(sql, ((value, id) for id, value in rows))
+		return cursor.rowcount
+
+
+def bulk_delete(db, table, column, values, where=None, chunk_size=500):
+	"""
+	Delete the rows whose column holds any of values inside one transaction.
+	Values are matched chunk_size at a time with IN, so a column without an index is scanned once per chunk rather than once per value.
+
+	:param table: peewee model class or table name
+	:param where: optional extra condition on the rows, e.g. "obj_typ = 'hru'"
+	:return: number of rows deleted
+	"""
+	table_name = table if isinstance(table, str) else table._meta.table_name
+	values = list(values)
+	deleted = 0
+
+	with db.atomic():
+		for i in range(0, len(values), chunk_size):
+			chunk = values[i:i + chunk_size]
+			sql = 'DELETE FROM "{table}" WHERE "{column}" IN ({params}){where}'.format(
+				table=table_name, column=column, params=', '.join(['?'] * len(chunk)), where='' if where is None else ' AND ' + where)
+			deleted += db.execute_sql(sql, chunk).rowcount
+	return deleted
+
+
+def bulk_replace(db, table, column, pairs, where=None):
+	"""
+	Replace values of one column with a single prepared UPDATE inside one transaction.
+
+	:param table: peewee model class or table name
+	:param pairs: iterable of (old value, new value) pairs
+	:param where: optional extra condition on the rows, e.g. "obj_typ = 'ru'"
+	:return: number of rows updated
+	"""
+	table_name = table if isinstance(table, str) else table._meta.table_name
+	sql = 'UPDATE "{table}" SET "{column}" = ? WHERE "{column}" = ?{where}'.format(table=table_name, column=column, where='' if where is None else ' AND ' + where)
+
+	with db.atomic():
+		cursor = db.cursor()
+		cursor.executemany(sql, ((new, old) for old, new in pairs))
+		return cursor.rowcount
+
+
+def open_db(name, profile=None):
 	conn = sqlite3.connect(name)
+	for pragma, value in get_pragmas(profile).items():
+		conn.execute('PRAGMA {} = {}'.format(pragma, value))
 	# Let rows returned be of dict/tuple type
 	conn.row_factory = sqlite3.Row
 	return conn
 
 
-def copy_table(table, src, dest, include_id=False, where_stmt=''):
-	src_conn = open_db(src)
+def copy_table(table, src, dest, include_id=False, where_stmt='', column_map=None):
+	"""
+	Copy the rows of a table from the src database into the same table of the dest database.
+	The source is attached to the destination connection and copied with a single INSERT ... SELECT,
+	so rows never pass through Python. Only columns present in both tables are copied; the others are logged.
+	Raises ValueError if src or its table does not exist.
+
+	:param column_map: optional {source column: destination column} for columns that were renamed
+	:param where_stmt: optional where clause applied to the source table, e.g. "WHERE name = 'x'"
+	"""
+	if not os.path.isfile(src):
+		raise ValueError('Cannot copy table {}: database {} does not exist'.format(table, src))
+
+	column_map = {} if column_map is None else column_map
 	dest_conn = open_db(dest)
+	try:
+		try:
+			dest_conn.execute('ATTACH DATABASE ? AS copy_src', (src,))
+		except sqlite3.OperationalError:
+			# Cannot attach (e.g. src is the destination file itself); stream the rows instead.
+			stream_copy_table(table, src, dest_conn, include_id, where_stmt, column_map)
+			return
 
-	sc = src_conn.execute('SELECT * FROM %s %s' % (table, where_stmt))
-	ins = None
-	dc = dest_conn.cursor()
-	for row in sc.fetchall():
-		if not ins:
-			if include_id:
-				cols = tuple([k for k in row.keys()])
-			else:
-				cols = tuple([k for k in row.keys() if k != 'id'])
-			ins = 'INSERT OR REPLACE INTO %s %s VALUES (%s)' % (table, cols, ','.join(['?'] * len(cols)))
-		c = [row[c] for c in cols]
-		dc.execute(ins, c)
+		src_cols = [r['name'] for r in dest_conn.execute('PRAGMA copy_src.table_info("{}")'.format(table))]
+		dest_cols = [r['name'] for r in dest_conn.execute('PRAGMA main.table_info("{}")'.format(table))]
+		src_sel, dest_ins = get_copy_columns(table, src, src_cols, dest_cols, include_id, column_map)
+
+		if len(dest_ins) > 0:
+			with dest_conn:
+				dest_conn.execute('INSERT OR REPLACE INTO main."{t}" ({dc}) SELECT {sc} FROM copy_src."{t}" {w}'.format(
+					t=table, dc=', '.join(dest_ins), sc=', '.join(src_sel), w=where_stmt))
+		dest_conn.execute('DETACH DATABASE copy_src')
+	finally:
+		dest_conn.close()
+
+
+def get_copy_columns(table, src, src_cols, dest_cols, include_id, column_map):
+	if len(src_cols) < 1:
+		raise ValueError('Cannot copy table {}: it does not exist in {}'.format(table, src))
+
+	src_sel = []
+	dest_ins = []
+	skipped = []
+	for c in src_cols:
+		if c == 'id' and not include_id:
+			continue
+		d = column_map.get(c, c)
+		if d in dest_cols:
+			src_sel.append('"{}"'.format(c))
+			dest_ins.append('"{}"'.format(d))
+		else:
+			skipped.append(c)
+	if len(skipped) > 0:
+		logger.warning('Columns of %s in %s not copied, the destination table does not have them: %s', table, src, ', '.join(skipped))
+	return src_sel, dest_ins
+
+
+def stream_copy_table(table, src, dest_conn, include_id=False, where_stmt='', column_map=None):
+	src_conn = open_db(src, REFERENCE_PROFILE)
+	try:
+		src_cols = [r['name'] for r in src_conn.execute('PRAGMA table_info("{}")'.format(table))]
+		dest_cols = [r['name'] for r in dest_conn.execute('PRAGMA table_info("{}")'.format(table))]
+		src_sel, dest_ins = get_copy_columns(table, src, src_cols, dest_cols, include_id, {} if column_map is None else column_map)
+		if len(dest_ins) < 1:
+			return
 
-	dest_conn.commit()
+		sc = src_conn.execute('SELECT {sc} FROM "{t}" {w}'.format(sc=', '.join(src_sel), t=table, w=where_stmt))
+		ins = 'INSERT OR REPLACE INTO "{t}" ({dc}) VALUES ({p})'.format(t=table, dc=', '.join(dest_ins), p=','.join(['?'] * len(dest_ins)))
+		with dest_conn:
+			dest_conn.executemany(ins, (tuple(row) for row in sc))
+	finally:
+		src_conn.close()
 
 
 def exists_table(db_conn, name):
@@ -1,11 +1,12 @@
 from peewee import *
+from database import lib
 from . import base, aquifer, channel, hyd, losses, misc, nutbal, plantwx, reservoir, waterbal, pest
 
 
 class SetupOutputDatabase():
 	@staticmethod
 	def init(db:str):
-		base.db.init(db, pragmas={'journal_mode': 'off'})
+		lib.init_db(base.db, db)
 
 	@staticmethod
 	def create_tables():
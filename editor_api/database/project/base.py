@@ -1,6 +1,7 @@
 from peewee import *
+from database import lib
 
-db = SqliteDatabase(None)
+db = lib.create_db()
 
 
 class BaseModel(Model):
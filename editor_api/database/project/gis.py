@@ -2,6 +2,8 @@ from peewee import *
 from . import base
 from database import lib
 
+import hashlib
+
 
 class Gis_aquifers(base.BaseModel):
 	category = IntegerField()
@@ -123,3 +125,56 @@ class Gis_routing(base.BaseModel):
 	@classmethod
 	def all_from_source(cls, sourcecat, sourceid):
 		return cls.select().where((cls.sourcecat == sourcecat) & (cls.sourceid == sourceid))
+
+
+class Gis_fingerprint(base.BaseModel):
+	"""
+	Fingerprint of each gis_* row at the last GIS import, so a re-import can apply only what QSWAT+ changed.
+	Routing rows are fingerprinted together per source, under gis_routing_<sourcecat>.
+	"""
+	gis_table = CharField()
+	gis_id = IntegerField()
+	fingerprint = CharField()
+
+	tables = [Gis_subbasins, Gis_channels, Gis_lsus, Gis_hrus, Gis_aquifers, Gis_deep_aquifers, Gis_water, Gis_points]
+
+	@staticmethod
+	def get_fingerprint(values):
+		return hashlib.md5(repr(values).encode()).hexdigest()
+
+	@classmethod
+	def compute(cls):
+		"""
+		Fingerprints of the current gis_* rows, as {table name: {gis id: fingerprint}}.
+		"""
+		prints = {}
+		for table in cls.tables:
+			if table.table_exists():
+				cursor = base.db.execute_sql('SELECT * FROM "{}"'.format(table._meta.table_name))
+				prints[table._meta.table_name] = {row[0]: cls.get_fingerprint(row[1:]) for row in cursor}
+
+		routes = {}
+		for row in base.db.execute_sql('SELECT sourcecat, sourceid, hyd_typ, sinkid, sinkcat, percent FROM gis_routing'):
+			routes.setdefault(('gis_routing_{}'.format(row[0]), row[1]), []).append(row[2:])
+		for (table_name, id), values in routes.items():
+			prints.setdefault(table_name, {})[id] = cls.get_fingerprint(values)
+		return prints
+
+	@classmethod
+	def load(cls):
+		prints = {}
+		if cls.table_exists():
+			for table_name, id, fingerprint in base.db.execute_sql('SELECT gis_table, gis_id, fingerprint FROM gis_fingerprint'):
+				prints.setdefault(table_name, {})[id] = fingerprint
+		return prints
+
+	@classmethod
+	def save_all(cls, prints=None):
+		if prints is None:
+			prints = cls.compute()
+
+		cls.create_table(safe=True)
+		with base.db.atomic():
+			cls.delete().execute()
+			lib.bulk_load(base.db, cls, ['gis_table', 'gis_id', 'fingerprint'],
+				((table_name, id, fingerprint) for table_name, rows in prints.items() for id, fingerprint in rows.items()))
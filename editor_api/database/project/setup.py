@@ -11,9 +11,9 @@ import time
 class SetupProjectDatabase():
 	@staticmethod
 	def init(project_db:str, datasets_db:str = None):
-		base.db.init(project_db, pragmas={'journal_mode': 'off'})
+		lib.init_db(base.db, project_db)
 		if datasets_db:
-			datasets_base.db.init(datasets_db, pragmas={'journal_mode': 'off'})
+			lib.init_db(datasets_base.db, datasets_db, lib.REFERENCE_PROFILE)
 
 	@staticmethod
 	def rollback(project_db:str, rollback_db:str):
@@ -25,7 +25,10 @@ class SetupProjectDatabase():
 		if not os.path.exists(err_dir):
 			os.makedirs(err_dir)
 		
+		lib.close_db(base.db)
+		lib.checkpoint(project_db)
 		copyfile(project_db, os.path.join(err_dir, err_filename))
+		lib.remove_db(project_db)
 		copy(rollback_db, project_db)
 		SetupProjectDatabase.init(project_db)
 
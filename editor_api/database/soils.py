@@ -4,7 +4,7 @@ import sqlite3
 import database.lib
 db_lib = database.lib
 
-db = SqliteDatabase(None)
+db = db_lib.create_db()
 
 
 class BaseModel(Model):
@@ -1,7 +1,8 @@
 from peewee import *
+from database import lib
 import os
 
-db = SqliteDatabase(None)
+db = lib.create_db()
 
 
 class BaseModel(Model):
@@ -40,4 +41,4 @@ class Var_range_option(BaseModel):
 class SetupVardefsDatabase():
 	@staticmethod
 	def init(datasets_db: str = None):
-		db.init(datasets_db, pragmas={'journal_mode': 'off'})
+		lib.init_db(db, datasets_db, lib.REFERENCE_PROFILE)
@@ -3,7 +3,7 @@ import sqlite3
 #import pyodbc
 import database.lib as db_lib
 
-db = SqliteDatabase(None)
+db = db_lib.create_db()
 
 
 class BaseModel(Model):
@@ -3,6 +3,7 @@ from peewee import *
 from playhouse.shortcuts import model_to_dict
 import time
 import ntpath
+import itertools
 import csv
 from helpers import utils, table_mapper
 from database import lib as db_lib
@@ -38,146 +39,125 @@ def write_csv(file_name, table, ignore_id_col=False, ignored_cols=[], custom_que
 			csv_writer.writerow(values)
 
 
-def read_csv_file(file_name, table, db, expected_cols, ignore_id_col=False, convert_name_to_lower=False, overwrite=FileOverwrite.ignore, remove_spaces_cols=[]):
-	csv_file = open(file_name, "r")
+class ReadPlan:
+	"""
+	Column layout of a table for reading SWAT+ text and csv files, compiled once per table.
+	Each file value is converted to its database form here, so rows can be loaded as plain tuples.
+	"""
+	def __init__(self, table, ignore_id_col=False, convert_name_to_lower=False, remove_spaces_cols=[], strip_quotes=False):
+		fields = [f for f in table._meta.sorted_fields if not (ignore_id_col and f.name == "id")]
+		self.table = table
+		self.names = [f.name for f in fields]
+		self.columns = [f.column_name for f in fields]
+		self.num_cols = len(fields)
+		self.converters = [self.get_converter(f, convert_name_to_lower, remove_spaces_cols, strip_quotes) for f in fields]
+
+	@staticmethod
+	def get_converter(field, convert_name_to_lower, remove_spaces_cols, strip_quotes):
+		lower = convert_name_to_lower and field.name == "name"
+		remove_spaces = field.name in remove_spaces_cols
+		db_value = field.db_value
+
+		def convert(value):
+			if lower:
+				value = value.lower()
+			if strip_quotes:
+				value = value.replace('"', '')
+			if value == 'null':
+				return None
+			if remove_spaces:
+				value = utils.remove_space(value)
+			return db_value(value)
+
+		return convert
+
+	def parse(self, val):
+		row = [conv(v) for conv, v in zip(self.converters, val)]
+		if len(row) < self.num_cols:
+			row.extend([None] * (self.num_cols - len(row)))
+		return row
+
+	def as_dict(self, row):
+		return dict(zip(self.names, row))
+
+
+def get_name_ids(table):
+	return {name: id for id, name in table.select(table.id, table.name).tuples()}
+
+
+def load_rows(table, db, plan, rows, overwrite=FileOverwrite.ignore):
+	"""
+	Insert parsed rows, resolving name conflicts against the names already in the table.
+	FileOverwrite.replace updates the existing row of the same name; FileOverwrite.rename appends the
+	first free number to the name of the new row.
+	"""
+	if overwrite != FileOverwrite.ignore:
+		existing = get_name_ids(table)
+		name_index = plan.names.index("name")
+		to_insert = []
+		with db.atomic():
+			for row in rows:
+				id = existing.get(row[name_index], None)
+				if id is None:
+					to_insert.append(row)
+				elif overwrite == FileOverwrite.replace:
+					table.update(plan.as_dict(row)).where(table.id == id).execute()
+				elif overwrite == FileOverwrite.rename:
+					k = 1
+					while '{name}{num}'.format(name=row[name_index], num=k) in existing:
+						k += 1
 
-	dialect = csv.Sniffer().sniff(csv_file.readline())
-	csv_file.seek(0)
-	replace_commas = dialect is not None and dialect.delimiter != ','
-	hasHeader = csv.Sniffer().has_header(csv_file.readline())
-	csv_file.seek(0)
+					row[name_index] = '{name}{num}'.format(name=row[name_index], num=k)
+					to_insert.append(row)
+		rows = to_insert
 
-	csv_reader = csv.reader(csv_file, dialect)
+	db_lib.bulk_load(db, table, plan.columns, rows)
 
-	if hasHeader:
-		headerLine = next(csv_reader)
 
-	i = 1
-	rows = []
-	fields = table._meta.sorted_fields
-	for val in csv_reader:
-		if expected_cols > 0 and len(val) < expected_cols:
-			raise IndexError(
-				'Improperly formatted %s file. Expecting %s columns. Please refer to the SWAT+ IO documentation.' % (ntpath.basename(file_name), expected_cols))
-		
-		if replace_commas:
-			val = [item.replace(',', '.', 1) for item in val]
-
-		row = {}
-		j = 0
-		for field in fields:
-			skip = False
-			if ignore_id_col and field.name == "id":
-				skip = True
-
-			if not skip:
-				value = None
-				if len(val) > j:
-					if convert_name_to_lower and field.name == "name":
-						value = val[j].lower()
-					elif field.name == "description":
-						value = val[j] if val[j] != 'null' else None
-					else:
-						value = val[j]
-
-				if type(value) is str:
-					if value == 'null':
-						value = None
-				
-				row[field.name] = value if field.name not in remove_spaces_cols else utils.remove_space(value)
-
-				j += 1
-
-		add_row = True
-		if overwrite != FileOverwrite.ignore:
-			try:
-				m = table.get(table.name == row['name'])
-
-				if overwrite == FileOverwrite.replace:
-					query = table.update(row).where(table.id == m.id)
-					result = query.execute()
-					add_row = False
-				elif overwrite == FileOverwrite.rename:
-					k = 1
-					while table.select().where(table.name == '{name}{num}'.format(name=row['name'], num=k)).exists():
-						k += 1
+def read_csv_file(file_name, table, db, expected_cols, ignore_id_col=False, convert_name_to_lower=False, overwrite=FileOverwrite.ignore, remove_spaces_cols=[]):
+	with open(file_name, "r") as csv_file:
+		dialect = csv.Sniffer().sniff(csv_file.readline())
+		csv_file.seek(0)
+		replace_commas = dialect is not None and dialect.delimiter != ','
+		hasHeader = csv.Sniffer().has_header(csv_file.readline())
+		csv_file.seek(0)
 
-					row['name'] = '{name}{num}'.format(name=row['name'], num=k)
-			except table.DoesNotExist:
-				pass
+		csv_reader = csv.reader(csv_file, dialect)
+
+		if hasHeader:
+			headerLine = next(csv_reader)
+
+		plan = ReadPlan(table, ignore_id_col, convert_name_to_lower, remove_spaces_cols)
+		rows = []
+		for val in csv_reader:
+			if expected_cols > 0 and len(val) < expected_cols:
+				raise IndexError(
+					'Improperly formatted %s file. Expecting %s columns. Please refer to the SWAT+ IO documentation.' % (ntpath.basename(file_name), expected_cols))
+			
+			if replace_commas:
+				val = [item.replace(',', '.', 1) for item in val]
 
-		if add_row:
-			rows.append(row)
+			rows.append(plan.parse(val))
 
-	db_lib.bulk_insert(db, table, rows)
+	load_rows(table, db, plan, rows, overwrite)
 
 
 def read_file(file_name, table, db, expected_cols, ignore_id_col=False, start_line=3, csv=False, convert_name_to_lower=False, overwrite=FileOverwrite.ignore, remove_spaces_cols=[]):
-	file = open(file_name, "r")
-
 	if csv:
 		start_line = 2
 
-	i = 1
+	plan = ReadPlan(table, ignore_id_col, convert_name_to_lower, remove_spaces_cols, strip_quotes=True)
 	rows = []
-	fields = table._meta.sorted_fields
-	for line in file:
-		if i >= start_line:
+	with open(file_name, "r") as file:
+		for line in itertools.islice(file, start_line - 1, None):
 			val = line.split() if not csv else line.split(',')
 			if expected_cols > 0 and len(val) < expected_cols:
 				raise IndexError(
 					'Improperly formatted %s file. Expecting %s columns. Please refer to the SWAT+ IO documentation.' % (ntpath.basename(file_name), expected_cols))
 
-			row = {}
-			j = 0
-			for field in fields:
-				skip = False
-				if ignore_id_col and field.name == "id":
-					skip = True
-
-				if not skip:
-					value = None
-					if len(val) > j:
-						if convert_name_to_lower and field.name == "name":
-							value = val[j].lower()
-						elif field.name == "description":
-							value = val[j] if val[j] != 'null' else None
-						else:
-							value = val[j]
-
-					if type(value) is str:
-						value = value.replace('"', '')
-						if value == 'null':
-							value = None
-					
-					row[field.name] = value if field.name not in remove_spaces_cols else utils.remove_space(value)
-
-					j += 1
-
-			add_row = True
-			if overwrite != FileOverwrite.ignore:
-				try:
-					m = table.get(table.name == row['name'])
-
-					if overwrite == FileOverwrite.replace:
-						query = table.update(row).where(table.id == m.id)
-						result = query.execute()
-						add_row = False
-					elif overwrite == FileOverwrite.rename:
-						k = 1
-						while table.select().where(table.name == '{name}{num}'.format(name=row['name'], num=k)).exists():
-							k += 1
-
-						row['name'] = '{name}{num}'.format(name=row['name'], num=k)
-				except table.DoesNotExist:
-					pass
-
-			if add_row:
-				rows.append(row)
-			
-		i += 1
+			rows.append(plan.parse(val))
 
-	db_lib.bulk_insert(db, table, rows)
+	load_rows(table, db, plan, rows, overwrite)
 
 
 class BaseFileModel:
@@ -374,46 +354,13 @@ class BaseFileModel:
 		for w in ele_to_write:
 			file.write(w)
 
-	def write_ele_ids2(self, file, table, element_table, elements, elem_table, element_ids, use_obj_id=True):
+	def write_ele_runs(self, file, ele_ids):
 		"""
-		SWAT+ requires line numbers rather than designated ID numbers.
-		The following writes the number of the element based on what line it will be in the ls_unit.ele file.
-		The format of the element list uses a "-" to denote "through"
+		Write an element list built by helpers.element_runs.ElementRuns, where a negative number means "through".
 		"""
-		last_id = 0
-		last_appended_id = 0
-		just_wrote = False
-		ele_to_write = []
-		for ele in elements.order_by(element_table.id):
-			#elem_table = table_mapper.obj_typs.get(ele.obj_typ, None)
-			if elem_table is not None:
-				if use_obj_id:
-					obj_id_col = ele.obj_id
-				else:
-					obj_id_col = ele.obj_typ_no
-
-				#obj_id = elem_table.select().where(elem_table.id <= obj_id_col).count()
-				obj_id = element_ids.index(obj_id_col) + 1
-				if last_id == 0:
-					ele_to_write.append(utils.int_pad(obj_id))
-					just_wrote = True
-					last_appended_id = obj_id
-				elif obj_id > (last_id + 1):
-					if last_appended_id != last_id:
-						ele_to_write.append(utils.int_pad(last_id * -1))
-					ele_to_write.append(utils.int_pad(obj_id))
-					last_appended_id = obj_id
-					just_wrote = True
-				else:
-					just_wrote = False
-				last_id = obj_id
-
-		if not just_wrote and len(elements) > 0:
-			ele_to_write.append(utils.int_pad(last_id * -1))
-
-		file.write(utils.int_pad(len(ele_to_write)))
-		for w in ele_to_write:
-			file.write(w)
+		file.write(utils.int_pad(len(ele_ids)))
+		for id in ele_ids:
+			file.write(utils.int_pad(id))
 
 
 class FileColumn:
@@ -1,5 +1,6 @@
 from .base import BaseFileModel
 from helpers import utils, table_mapper
+from helpers.element_runs import ElementRuns
 import database.project.regions as db
 from database.project import connect
 
@@ -20,12 +21,11 @@ class Ls_unit_def(BaseFileModel):
 		order_by = db.Ls_unit_def.id
 		count = table.select().count()
 
-		element_table = db.Ls_unit_ele
-		first_elem = element_table.get()
-		obj_table = table_mapper.obj_typs.get(first_elem.obj_typ, None)
-		obj_ids = [o.id for o in obj_table.select(obj_table.id).order_by(obj_table.id)]
-
 		if count > 0:
+			first_elem = db.Ls_unit_ele.get_or_none()
+			obj_table = None if first_elem is None else table_mapper.obj_typs.get(first_elem.obj_typ, None)
+			element_runs = ElementRuns([]) if obj_table is None else ElementRuns.load(db.Ls_unit_ele, 'ls_unit_def_id', 'obj_typ_no', ElementRuns.get_positions(obj_table))
+
 			with open(self.file_name, 'w') as file:
 				file.write(self.get_meta_line())
 				file.write(str(count))
@@ -44,7 +44,7 @@ class Ls_unit_def(BaseFileModel):
 					file.write(utils.string_pad(row.name))
 					file.write(utils.num_pad(row.area))
 
-					self.write_ele_ids2(file, table, element_table, row.elements, obj_table, obj_ids, use_obj_id=False)
+					self.write_ele_runs(file, element_runs.ele_ids(row.id))
 					file.write("\n")
 
 
@@ -1,5 +1,6 @@
 from .base import BaseFileModel
 from helpers import utils, table_mapper
+from helpers.element_runs import ElementRuns
 from database.project import connect
 import database.project.routing_unit as db
 
@@ -106,11 +107,10 @@ class Rout_unit_def(BaseFileModel):
 		count = table.select().count()
 
 		if count > 0:
-			element_table = connect.Rout_unit_ele
-			first_elem = element_table.get()
-			obj_table = table_mapper.obj_typs.get(first_elem.obj_typ, None)
-			obj_ids = [o.id for o in obj_table.select(obj_table.id).order_by(obj_table.id)]
-			
+			first_elem = connect.Rout_unit_ele.get_or_none()
+			obj_table = None if first_elem is None else table_mapper.obj_typs.get(first_elem.obj_typ, None)
+			element_runs = ElementRuns([]) if obj_table is None else ElementRuns.load(connect.Rout_unit_ele, 'rtu_id', 'obj_id', ElementRuns.get_positions(obj_table))
+
 			with open(self.file_name, 'w') as file:
 				file.write(self.get_meta_line())
 				file.write(utils.int_pad("id"))
@@ -125,5 +125,5 @@ class Rout_unit_def(BaseFileModel):
 					i += 1
 					file.write(utils.string_pad(row.name))
 
-					self.write_ele_ids2(file, table, element_table, row.elements, obj_table, obj_ids)
+					self.write_ele_runs(file, element_runs.ele_ids(row.id))
 					file.write("\n")
@@ -0,0 +1,188 @@
+"""
+Columnar (Parquet) copies of SWAT+ output tables.
+
+Each output table is written to <dataset dir>/<table name>/, partitioned by year (yr=<year>/part-<n>.parquet)
+and sorted by unit and date inside each file, so a single column for a few units can be read without
+scanning the whole table. Requires the optional pyarrow package.
+"""
+import os, os.path
+from shutil import rmtree
+
+PARTITION_COLUMNS = ['yr', 'year']
+SORT_COLUMNS = ['unit', 'gis_id', 'hru', 'yr', 'year', 'mon', 'day', 'jday']
+DEFAULT_COMPRESSION = 'zstd'
+ROW_GROUP_SIZE = 65536
+
+
+def import_pyarrow():
+	try:
+		import pyarrow
+		import pyarrow.dataset
+		import pyarrow.parquet
+		return pyarrow
+	except ImportError:
+		raise ValueError('Columnar output requires the pyarrow package. Install it with: pip install pyarrow')
+
+
+def get_column_types(table):
+	"""
+	Column names and value types ('int', 'float' or 'str') of an output model, without the id column.
+	"""
+	from peewee import IntegerField, FloatField
+	cols = []
+	for f in table._meta.sorted_fields:
+		if f.name == 'id':
+			continue
+		if isinstance(f, IntegerField):
+			cols.append((f.column_name, 'int'))
+		elif isinstance(f, FloatField):
+			cols.append((f.column_name, 'float'))
+		else:
+			cols.append((f.column_name, 'str'))
+	return cols
+
+
+class ColumnarTableWriter:
+	"""
+	Collects the rows of one output table and writes a partition each time the year changes.
+	SWAT+ writes output in time order, so only one year of rows is held in memory.
+	"""
+	def __init__(self, path, column_types, compression=DEFAULT_COMPRESSION):
+		self.pa = import_pyarrow()
+		self.path = path
+		self.columns = [c for c, t in column_types]
+		self.types = dict(column_types)
+		self.compression = compression
+		self.partition_column = next((c for c in PARTITION_COLUMNS if c in self.columns), None)
+		self.partition_index = self.columns.index(self.partition_column) if self.partition_column is not None else None
+		self.sort_columns = [c for c in SORT_COLUMNS if c in self.columns and c != self.partition_column]
+		self.current_key = None
+		self.rows = []
+		self.part_counts = {}
+		self.row_count = 0
+
+		if not os.path.exists(path):
+			os.makedirs(path)
+
+	def write(self, rows):
+		if self.partition_index is None:
+			self.rows.extend(rows)
+			return
+
+		for row in rows:
+			key = row[self.partition_index]
+			if key != self.current_key:
+				self.flush()
+				self.current_key = key
+			self.rows.append(row)
+
+	def flush(self):
+		if len(self.rows) < 1:
+			return
+
+		pa = self.pa
+		arrays = []
+		names = []
+		for i, col in enumerate(self.columns):
+			if col == self.partition_column:
+				continue
+			values = [r[i] for r in self.rows]
+			t = self.types[col]
+			if t == 'str':
+				arrays.append(pa.array(values, type=pa.string()))
+			else:
+				arrays.append(self.to_numeric_array(values, pa.int64() if t == 'int' else pa.float64()))
+			names.append(col)
+
+		table = pa.Table.from_arrays(arrays, names=names)
+		if len(self.sort_columns) > 0:
+			table = table.sort_by([(c, 'ascending') for c in self.sort_columns])
+
+		part_dir = self.path
+		if self.partition_column is not None and self.current_key is not None:
+			part_dir = os.path.join(self.path, '{}={}'.format(self.partition_column, int(self.current_key)))
+			if not os.path.exists(part_dir):
+				os.makedirs(part_dir)
+
+		n = self.part_counts.get(part_dir, 0)
+		self.part_counts[part_dir] = n + 1
+		pa.parquet.write_table(table, os.path.join(part_dir, 'part-{}.parquet'.format(n)), compression=self.compression, row_group_size=ROW_GROUP_SIZE)
+		self.row_count += len(self.rows)
+		self.rows = []
+
+	def to_numeric_array(self, values, pa_type):
+		pa = self.pa
+		try:
+			return pa.array(values, type=pa_type, from_pandas=True)
+		except (pa.ArrowInvalid, pa.ArrowTypeError):
+			# values read as text by the line parser
+			arr = pa.array([None if v is None else str(v) for v in values], type=pa.string())
+			return arr.cast(pa.float64()).cast(pa_type, safe=False)
+
+	def close(self):
+		self.flush()
+
+
+class ColumnarOutputWriter:
+	def __init__(self, dataset_dir, compression=DEFAULT_COMPRESSION):
+		import_pyarrow()
+		self.dataset_dir = dataset_dir
+		self.compression = compression
+		self.tables = {}
+
+	def remove_table(self, name):
+		path = os.path.join(self.dataset_dir, name)
+		if os.path.exists(path):
+			rmtree(path)
+
+	def open_table(self, name, column_types):
+		self.remove_table(name)
+		writer = ColumnarTableWriter(os.path.join(self.dataset_dir, name), column_types, self.compression)
+		self.tables[name] = writer
+		return writer
+
+	def write(self, name, rows):
+		self.tables[name].write(rows)
+
+	def close_table(self, name):
+		writer = self.tables.pop(name, None)
+		if writer is not None:
+			writer.close()
+
+
+def read_table(dataset_dir, name, columns=None, units=None, years=None, unit_column='unit', as_pandas=True):
+	"""
+	Read an output table written by ColumnarOutputWriter.
+
+	:param columns: column names to read (default all)
+	:param units: optional list of unit ids to keep
+	:param years: optional list of years to keep; only those partitions are opened
+	:param unit_column: column holding the unit id, e.g. 'gis_id'
+	:return: pandas DataFrame, or pyarrow Table if as_pandas is False
+	"""
+	pa = import_pyarrow()
+	ds = pa.dataset
+	path = os.path.join(dataset_dir, name)
+	if not os.path.exists(path):
+		raise ValueError('Table {} has not been written to {}'.format(name, dataset_dir))
+
+	partition_column = None
+	for entry in os.listdir(path):
+		for c in PARTITION_COLUMNS:
+			if entry.startswith(c + '='):
+				partition_column = c
+
+	partitioning = None
+	if partition_column is not None:
+		partitioning = ds.partitioning(pa.schema([(partition_column, pa.int64())]), flavor='hive')
+	dataset = ds.dataset(path, format='parquet', partitioning=partitioning)
+
+	expr = None
+	if units is not None:
+		expr = ds.field(unit_column).isin(list(units))
+	if years is not None and partition_column is not None:
+		year_expr = ds.field(partition_column).isin(list(years))
+		expr = year_expr if expr is None else expr & year_expr
+
+	table = dataset.to_table(columns=columns, filter=expr)
+	return table.to_pandas() if as_pandas else table
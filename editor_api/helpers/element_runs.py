@@ -0,0 +1,73 @@
+"""
+Element membership of definition tables (landscape units, routing units) as sorted start/stop runs,
+loaded with one query for all definitions instead of one query per definition.
+"""
+from itertools import groupby
+
+
+def to_runs(positions):
+	"""
+	Sorted, distinct positions as (start, stop) runs, e.g. [1, 2, 3, 7] -> [(1, 3), (7, 7)].
+	"""
+	runs = []
+	for pos in sorted(set(positions)):
+		if len(runs) > 0 and pos == runs[-1][1] + 1:
+			runs[-1] = (runs[-1][0], pos)
+		else:
+			runs.append((pos, pos))
+	return runs
+
+
+def runs_to_ele_ids(runs):
+	"""
+	Runs in the SWAT+ element list format, where a negative number means 'through', e.g. [(1, 3), (7, 7)] -> [1, -3, 7].
+	"""
+	ele_ids = []
+	for start, stop in runs:
+		ele_ids.append(start)
+		if stop > start:
+			ele_ids.append(-stop)
+	return ele_ids
+
+
+class ElementRuns:
+	"""
+	Runs of element positions per definition id. Positions are the element ids themselves, or their
+	line numbers in the written file when positions ({element id: position}) is given.
+	Raises ValueError for an element missing from positions.
+	"""
+	def __init__(self, rows, positions=None):
+		self.runs = {}
+		for def_id, items in groupby(rows, key=lambda r: r[0]):
+			ids = [r[1] for r in items]
+			if positions is not None:
+				missing = [id for id in ids if id not in positions]
+				if len(missing) > 0:
+					raise ValueError('Definition {} has element {}, which does not exist'.format(def_id, missing[0]))
+				ids = [positions[id] for id in ids]
+			self.runs[def_id] = to_runs(ids)
+
+	@classmethod
+	def load(cls, element_table, def_column, obj_column, positions=None):
+		"""
+		Runs of every definition with elements in element_table, e.g. ElementRuns.load(Ls_unit_ele, 'ls_unit_def_id', 'obj_typ_no').
+		"""
+		sql = 'SELECT "{d}", "{o}" FROM "{t}" WHERE "{d}" IS NOT NULL ORDER BY "{d}"'.format(d=def_column, o=obj_column, t=element_table._meta.table_name)
+		return cls(element_table._meta.database.execute_sql(sql), positions)
+
+	@staticmethod
+	def get_positions(obj_table):
+		"""
+		Line number of each row of obj_table in its written file, where rows are written in id order.
+		"""
+		sql = 'SELECT id FROM "{t}" ORDER BY id'.format(t=obj_table._meta.table_name)
+		return {id: i for i, (id,) in enumerate(obj_table._meta.database.execute_sql(sql), 1)}
+
+	def def_ids(self):
+		return set(self.runs.keys())
+
+	def get(self, def_id):
+		return self.runs.get(def_id, [])
+
+	def ele_ids(self, def_id):
+		return runs_to_ele_ids(self.get(def_id))
@@ -0,0 +1,186 @@
+import json
+import os, os.path
+import re
+import subprocess
+import sys
+import threading
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from helpers import utils
+
+JOB_ACTIONS = ['write_files', 'read_output', 'import_gis', 'import_weather']
+
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_COMPLETED = 'completed'
+STATUS_FAILED = 'failed'
+STATUS_CANCELLED = 'cancelled'
+
+MAX_FINISHED_JOBS = 100
+OUTPUT_TAIL_LINES = 20
+CANCEL_TIMEOUT = 10
+
+
+def get_api_command():
+	"""
+	Command that starts swatplus_api, whether running from source or as a frozen executable.
+	"""
+	if getattr(sys, 'frozen', False):
+		exe_dir = os.path.dirname(sys.executable)
+		exe = 'swatplus_api.exe' if sys.platform.startswith('win') else 'swatplus_api'
+		return [os.path.join(exe_dir, exe)]
+	return [sys.executable, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'swatplus_api.py')]
+
+
+def get_action_args(action, args):
+	"""
+	swatplus_api command line arguments from a dictionary of option names and values.
+	True adds a flag, False and None leave the option out.
+	"""
+	if action not in JOB_ACTIONS:
+		raise ValueError('Action {} cannot be run as a job. Use one of: {}'.format(action, ', '.join(JOB_ACTIONS)))
+
+	cmd = [action]
+	for key, value in (args or {}).items():
+		if not re.match('^[a-z][a-z0-9_]*$', key):
+			raise ValueError('Invalid argument name {}'.format(key))
+		if value is None or value is False:
+			continue
+		cmd.append('--{}'.format(key))
+		if value is not True:
+			cmd.append(str(value))
+	return cmd
+
+
+class Job:
+	def __init__(self, action, args):
+		self.id = uuid.uuid4().hex
+		self.action = action
+		self.command = get_api_command() + get_action_args(action, args)
+		self.project_db = (args or {}).get('project_db_file', None)
+		self.status = STATUS_QUEUED
+		self.percent = 0
+		self.message = ''
+		self.error = None
+		self.output = deque(maxlen=OUTPUT_TAIL_LINES)
+		self.created = datetime.now()
+		self.started = None
+		self.finished = None
+		self.process = None
+		self.future = None
+		self.cancel_requested = False
+
+	def to_dict(self):
+		return {
+			'id': self.id,
+			'action': self.action,
+			'project_db': self.project_db,
+			'status': self.status,
+			'percent': self.percent,
+			'message': self.message,
+			'error': self.error,
+			'created': utils.json_encode_datetime(self.created),
+			'started': utils.json_encode_datetime(self.started),
+			'finished': utils.json_encode_datetime(self.finished)
+		}
+
+
+class JobManager:
+	"""
+	Runs long editor actions as swatplus_api processes, at most max_jobs at a time. Progress is read from the
+	ExecutableApi.emit_progress messages each process prints, so actions run exactly as from the command line,
+	and a separate process per job keeps each action's database connections to itself.
+	"""
+	def __init__(self, max_jobs=None):
+		self.max_jobs = min(4, os.cpu_count() or 1) if max_jobs is None else max(1, max_jobs)
+		self.executor = ThreadPoolExecutor(max_workers=self.max_jobs)
+		self.jobs = OrderedDict()
+		self.lock = threading.Lock()
+
+	def submit(self, action, args):
+		job = Job(action, args)
+		with self.lock:
+			self.jobs[job.id] = job
+			self.remove_finished_jobs()
+		job.future = self.executor.submit(self.run, job)
+		return job
+
+	def get(self, id):
+		with self.lock:
+			return self.jobs.get(id, None)
+
+	def list(self):
+		with self.lock:
+			return list(self.jobs.values())
+
+	def cancel(self, job):
+		with self.lock:
+			if job.status not in [STATUS_QUEUED, STATUS_RUNNING]:
+				return False
+			job.cancel_requested = True
+			if job.status == STATUS_QUEUED and job.future.cancel():
+				self.finish(job, STATUS_CANCELLED)
+				return True
+			process = job.process
+
+		if process is not None:
+			process.terminate()
+			try:
+				process.wait(CANCEL_TIMEOUT)
+			except subprocess.TimeoutExpired:
+				process.kill()
+		return True
+
+	def run(self, job):
+		with self.lock:
+			if job.cancel_requested:
+				self.finish(job, STATUS_CANCELLED)
+				return
+			job.status = STATUS_RUNNING
+			job.started = datetime.now()
+			try:
+				job.process = subprocess.Popen(job.command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True, bufsize=1)
+			except (OSError, ValueError) as err:
+				job.error = 'Could not start {}: {}'.format(job.action, err)
+				self.finish(job, STATUS_FAILED)
+				return
+
+		for line in job.process.stdout:
+			line = line.strip()
+			if line == '':
+				continue
+			try:
+				progress = json.loads(line)
+				job.percent = progress.get('percent', job.percent)
+				job.message = progress.get('message', job.message)
+			except (ValueError, AttributeError):
+				job.output.append(line)
+		result = job.process.wait()
+
+		with self.lock:
+			if job.cancel_requested:
+				self.finish(job, STATUS_CANCELLED)
+			elif result == 0:
+				job.percent = 100
+				self.finish(job, STATUS_COMPLETED)
+			else:
+				job.error = '\n'.join(job.output) if len(job.output) > 0 else 'Process exited with code {}'.format(result)
+				self.finish(job, STATUS_FAILED)
+
+	def finish(self, job, status):
+		job.status = status
+		job.finished = datetime.now()
+		job.process = None
+
+	def remove_finished_jobs(self):
+		finished = [id for id, job in self.jobs.items() if job.finished is not None]
+		for id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+			del self.jobs[id]
+
+	def shutdown(self):
+		for job in self.list():
+			self.cancel(job)
+		self.executor.shutdown(wait=False)
@@ -0,0 +1,96 @@
+"""
+Nearest-neighbour lookup of points by latitude and longitude, used to match spatial objects to weather stations.
+"""
+import math
+
+
+def to_xyz(lat, lon):
+	"""
+	Position of a latitude and longitude on the unit sphere. The straight-line distance between two positions
+	increases with their great-circle distance, so the nearest position is also the nearest on the ground.
+	"""
+	rlat = math.radians(lat)
+	rlon = math.radians(lon)
+	c = math.cos(rlat)
+	return (c * math.cos(rlon), c * math.sin(rlon), math.sin(rlat))
+
+
+class NearestIndex:
+	"""
+	KD-tree of points on the unit sphere, built once for a set of stations and queried for any number of objects.
+	Points without coordinates are left out. When two points are equally close, the one given first is returned.
+	"""
+	def __init__(self, values, lats, lons):
+		self.values = []
+		self.points = []
+		for value, lat, lon in zip(values, lats, lons):
+			if lat is not None and lon is not None:
+				self.values.append(value)
+				self.points.append(to_xyz(lat, lon))
+
+		n = len(self.points)
+		self.left = [-1] * n
+		self.right = [-1] * n
+		self.axis = [0] * n
+		self.root = self.build(list(range(n)), 0)
+
+	def __len__(self):
+		return len(self.points)
+
+	def build(self, items, depth):
+		if len(items) == 0:
+			return -1
+
+		axis = depth % 3
+		items.sort(key=lambda i: self.points[i][axis])
+		mid = len(items) // 2
+		node = items[mid]
+		self.axis[node] = axis
+		self.left[node] = self.build(items[:mid], depth + 1)
+		self.right[node] = self.build(items[mid + 1:], depth + 1)
+		return node
+
+	def nearest_point(self, p):
+		points, left, right, axes = self.points, self.left, self.right, self.axis
+		best = -1
+		best_dist = float('inf')
+		stack = [self.root]
+		while stack:
+			node = stack.pop()
+			if node < 0:
+				continue
+
+			q = points[node]
+			dx, dy, dz = p[0] - q[0], p[1] - q[1], p[2] - q[2]
+			dist = dx * dx + dy * dy + dz * dz
+			if dist < best_dist or (dist == best_dist and node < best):
+				best = node
+				best_dist = dist
+
+			diff = p[axes[node]] - q[axes[node]]
+			near, far = (left[node], right[node]) if diff < 0 else (right[node], left[node])
+			if diff * diff <= best_dist:
+				stack.append(far)
+			stack.append(near)
+		return best
+
+	def nearest(self, lat, lon):
+		"""
+		Value of the point closest to lat, lon, or None if the index is empty or the coordinates are missing.
+		"""
+		if self.root < 0 or lat is None or lon is None:
+			return None
+		return self.values[self.nearest_point(to_xyz(lat, lon))]
+
+	def nearest_many(self, coords):
+		"""
+		Values of the closest points to a list of (lat, lon) pairs. Repeated coordinates are only looked up once.
+		"""
+		found = {}
+		result = []
+		for lat, lon in coords:
+			key = (lat, lon)
+			if key not in found:
+				found[key] = self.nearest(lat, lon)
+			result.append(found[key])
+		return result
@@ -0,0 +1,113 @@
+"""
+In-memory graph of the GIS routing table, so routes through points can be followed without a query per step.
+"""
+from collections import namedtuple
+
+Route = namedtuple('Route', ['sourceid', 'sourcecat', 'hyd_typ', 'sinkid', 'sinkcat', 'percent'])
+
+
+class RoutingGraph:
+	"""
+	Routes of gis_routing grouped by source, loaded once for a whole import.
+	Routes keep their table order, so the first route out of an object is the one a database lookup would return.
+	"""
+	def __init__(self, rows, point_cat='PT'):
+		self.point_cat = point_cat
+		self.routes = []
+		self.by_source = {}
+		self.by_cat = {}
+		for row in rows:
+			route = Route(*row)
+			self.by_source.setdefault((route.sourcecat, route.sourceid), []).append(route)
+			self.by_cat.setdefault(route.sourcecat, []).append(len(self.routes))
+			self.routes.append(route)
+
+		for items in self.by_cat.values():
+			items.sort(key=lambda i: self.routes[i].sourceid)
+
+		self.point_ends = {}
+
+	@classmethod
+	def load(cls, table, point_cat='PT'):
+		return cls(table.select(table.sourceid, table.sourcecat, table.hyd_typ, table.sinkid, table.sinkcat, table.percent).tuples(), point_cat)
+
+	def routes_from(self, sourcecat, sourceid):
+		return self.by_source.get((sourcecat, sourceid), [])
+
+	def first_route(self, sourcecat, sourceid):
+		routes = self.by_source.get((sourcecat, sourceid))
+		return None if not routes else routes[0]
+
+	def routes_by_source(self, sourcecats):
+		"""
+		Routes with a positive percent out of objects of the given categories, ordered by source id.
+		"""
+		items = []
+		for cat in sourcecats:
+			items.extend(self.by_cat.get(cat, []))
+		if len(sourcecats) > 1:
+			items.sort(key=lambda i: (self.routes[i].sourceid, i))
+		return [self.routes[i] for i in items if self.routes[i].percent > 0]
+
+	def end_of(self, route):
+		"""
+		Route that ends route's path when it goes through points, following the first route out of each point.
+		None if a point on the path has no route out.
+		"""
+		if route.sinkcat != self.point_cat:
+			return route
+		return self.point_end(route.sinkid)
+
+	def point_end(self, point_id):
+		"""
+		End of the path out of a point. Every point on the path is remembered with the same end,
+		so later paths joining it stop there.
+		"""
+		path = []
+		on_path = set()
+		end = None
+		pid = point_id
+		while True:
+			if pid in self.point_ends:
+				end = self.point_ends[pid]
+				break
+			if pid in on_path:
+				raise ValueError('Check gis_routing. Routing from point {} loops back through point {}.'.format(point_id, pid))
+
+			on_path.add(pid)
+			path.append(pid)
+			route = self.first_route(self.point_cat, pid)
+			if route is None or route.sinkcat != self.point_cat:
+				end = route
+				break
+			pid = route.sinkid
+
+		for p in path:
+			self.point_ends[p] = end
+		return end
+
+	def check_point_cycles(self):
+		"""
+		Raise a ValueError if any point can be reached again by following all routes out of it.
+		"""
+		done = set()
+		for (cat, start), routes in self.by_source.items():
+			if cat != self.point_cat or start in done:
+				continue
+
+			on_path = {start}
+			stack = [(start, iter(routes))]
+			while stack:
+				pid, children = stack[-1]
+				for route in children:
+					if route.sinkcat != self.point_cat or route.sinkid in done:
+						continue
+					if route.sinkid in on_path:
+						raise ValueError('Check gis_routing. Routing from point {} loops back through point {}.'.format(pid, route.sinkid))
+					on_path.add(route.sinkid)
+					stack.append((route.sinkid, iter(self.routes_from(self.point_cat, route.sinkid))))
+					break
+				else:
+					stack.pop()
+					on_path.discard(pid)
+					done.add(pid)
@@ -0,0 +1,221 @@
+import hashlib
+import json
+import os, os.path
+import stat
+from shutil import copyfile
+
+STORE_DIR = 'ScenarioStore'
+HASH_BLOCK_SIZE = 1024 * 1024
+READ_ONLY = stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH
+
+
+def is_linked(path, st=None):
+	"""
+	Whether path is a hard link to a read-only store object.
+	"""
+	st = os.stat(path) if st is None else st
+	return st.st_nlink > 1 and not st.st_mode & stat.S_IWUSR
+
+
+def break_link(path):
+	"""
+	Replace a hard link to a store object with a writable copy, so writing the file does not change the object.
+	"""
+	tmp = path + '.tmp'
+	copyfile(path, tmp)
+	try:
+		os.replace(tmp, path)
+	except PermissionError:
+		# Windows cannot replace a read-only file; the shared object is made read-only again by the next save
+		os.chmod(path, stat.S_IWRITE | stat.S_IREAD)
+		os.replace(tmp, path)
+
+
+def break_links(dir_path):
+	"""
+	Break the links to store objects of all files in dir_path. Call before writing files in a folder that may
+	be a saved scenario.
+	:return: number of links broken
+	"""
+	broken = 0
+	if not os.path.isdir(dir_path):
+		return broken
+	for root, dirs, names in os.walk(dir_path):
+		for n in names:
+			full = os.path.join(root, n)
+			if is_linked(full):
+				break_link(full)
+				broken += 1
+	return broken
+
+
+class ScenarioStore:
+	"""
+	Content-addressed storage for scenarios. Every file saved in a scenario is stored once under
+	ScenarioStore/objects, named by the hash of its content, and each scenario is a manifest of
+	{relative path: hash}. Objects are read-only and saved scenario folders hard link to them, so a scenario
+	takes no extra space. Editor actions call break_links before writing in a folder; other programs cannot
+	open the linked files for writing.
+	"""
+	def __init__(self, project_path):
+		self.path = os.path.join(project_path, STORE_DIR)
+		self.objects_path = os.path.join(self.path, 'objects')
+		self.manifests_path = os.path.join(self.path, 'manifests')
+		self.hashes_file = os.path.join(self.path, 'hashes.json')
+
+		for p in [self.objects_path, self.manifests_path]:
+			if not os.path.exists(p):
+				os.makedirs(p)
+
+		self.__hashes = {}
+		if os.path.exists(self.hashes_file):
+			try:
+				with open(self.hashes_file, 'r') as f:
+					self.__hashes = json.load(f)
+			except ValueError:
+				self.__hashes = {}
+
+	def close(self):
+		with open(self.hashes_file, 'w') as f:
+			json.dump(self.__hashes, f)
+
+	def hash_file(self, file_path):
+		"""
+		Hash of a file's content. Hashes are cached by path, size and modification time,
+		so unchanged files are not read again.
+		"""
+		st = os.stat(file_path)
+		key = os.path.abspath(file_path)
+		cached = self.__hashes.get(key, None)
+		if cached is not None and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+			return cached[2]
+
+		h = hashlib.sha256()
+		with open(file_path, 'rb') as f:
+			for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+				h.update(block)
+
+		digest = h.hexdigest()
+		self.__hashes[key] = [st.st_size, st.st_mtime_ns, digest]
+		return digest
+
+	def object_path(self, digest):
+		return os.path.join(self.objects_path, digest[:2], digest[2:])
+
+	def add_file(self, file_path):
+		digest = self.hash_file(file_path)
+		obj = self.object_path(digest)
+		if not os.path.exists(obj):
+			obj_dir = os.path.dirname(obj)
+			if not os.path.exists(obj_dir):
+				os.makedirs(obj_dir)
+			tmp = obj + '.tmp'
+			copyfile(file_path, tmp)
+			os.chmod(tmp, READ_ONLY)
+			os.replace(tmp, obj)
+		return digest
+
+	def add_dir(self, dir_path, rel_prefix, files):
+		for root, dirs, names in os.walk(dir_path):
+			for n in names:
+				full = os.path.join(root, n)
+				rel = os.path.join(rel_prefix, os.path.relpath(full, dir_path)).replace('\\', '/')
+				files[rel] = self.add_file(full)
+
+	def manifest_file(self, name):
+		return os.path.join(self.manifests_path, '{}.json'.format(name))
+
+	def has_manifest(self, name):
+		return os.path.exists(self.manifest_file(name))
+
+	def get_manifest(self, name):
+		with open(self.manifest_file(name), 'r') as f:
+			return json.load(f)
+
+	def save_manifest(self, name, manifest):
+		with open(self.manifest_file(name), 'w') as f:
+			json.dump(manifest, f, indent='\t')
+
+	def link(self, digest, dest):
+		"""
+		Hard link an object to dest, copying instead where links are not supported.
+		"""
+		dest_dir = os.path.dirname(dest)
+		if not os.path.exists(dest_dir):
+			os.makedirs(dest_dir)
+		tmp = dest + '.tmp'
+		try:
+			os.link(self.object_path(digest), tmp)
+		except OSError:
+			copyfile(self.object_path(digest), tmp)
+		os.replace(tmp, dest)
+
+	def materialise(self, files, dest_dir):
+		for rel, digest in files.items():
+			self.link(digest, os.path.join(dest_dir, rel))
+
+	def scenario_names(self):
+		return [os.path.splitext(f)[0] for f in os.listdir(self.manifests_path) if f.endswith('.json')]
+
+	def clean(self, scenarios_path):
+		"""
+		Drop the manifests of scenarios whose folder was deleted, link scenario files that are unchanged copies of
+		their objects, make objects read-only again, and delete objects no manifest refers to.
+		:return: number of objects deleted
+		"""
+		referenced = set()
+		for name in self.scenario_names():
+			scenario_path = os.path.join(scenarios_path, name)
+			if not os.path.isdir(scenario_path):
+				os.remove(self.manifest_file(name))
+				continue
+
+			files = self.get_manifest(name)['files']
+			referenced.update(files.values())
+			for rel, digest in files.items():
+				full = os.path.join(scenario_path, rel)
+				obj = self.object_path(digest)
+				if os.path.isfile(full) and os.path.exists(obj) and not os.path.samefile(full, obj) and self.hash_file(full) == digest:
+					self.link(digest, full)
+
+		deleted = 0
+		for root, dirs, names in os.walk(self.objects_path):
+			for n in names:
+				full = os.path.join(root, n)
+				if os.path.basename(root) + n not in referenced:
+					os.chmod(full, stat.S_IWRITE | stat.S_IREAD)
+					os.remove(full)
+					deleted += 1
+				elif os.stat(full).st_mode & stat.S_IWUSR:
+					os.chmod(full, READ_ONLY)
+
+		self.__hashes = {k: v for k, v in self.__hashes.items() if os.path.exists(k)}
+		return deleted
+
+	def sync(self, files, dest_dir):
+		"""
+		Make dest_dir hold exactly the given files, copying only those whose content differs
+		and removing files that are not in the list. Files are copied rather than linked so the
+		working folder can be edited without changing the stored objects.
+		:return: number of files copied
+		"""
+		wanted = {os.path.normpath(os.path.join(dest_dir, rel)): digest for rel, digest in files.items()}
+		if os.path.exists(dest_dir):
+			for root, dirs, names in os.walk(dest_dir):
+				for n in names:
+					full = os.path.normpath(os.path.join(root, n))
+					if full not in wanted:
+						os.remove(full)
+
+		copied = 0
+		for full, digest in wanted.items():
+			if os.path.exists(full) and self.hash_file(full) == digest:
+				continue
+			dest = os.path.dirname(full)
+			if not os.path.exists(dest):
+				os.makedirs(dest)
+			tmp = full + '.tmp'
+			copyfile(self.object_path(digest), tmp)
+			os.replace(tmp, full)
+			copied += 1
+		return copied
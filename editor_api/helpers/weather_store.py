@@ -0,0 +1,322 @@
+"""
+Project weather store: daily SWAT+ weather station data kept in one compressed columnar file per variable.
+
+<weather dir>/weather.store/index.json lists the stations of each variable with their coordinates, first date,
+number of days and the position of each value column in <variable>.dat. Each column is a zlib-compressed array
+of doubles, so one station can be read without reading the others, and station metadata never needs the data.
+SWAT+ text files are written from the store only for the stations and years a simulation uses.
+
+Stations stored from a text file keep its size and modification time. If a station's text file in the weather
+directory has changed since, or was written without the store, the text file is used instead of the store.
+"""
+import array
+import datetime
+import functools
+import json
+import os, os.path
+import zlib
+
+STORE_DIR = 'weather.store'
+INDEX_FILE = 'index.json'
+STORE_VERSION = 1
+VARIABLES = ['hmd', 'pcp', 'slr', 'tmp', 'wnd']
+MISSING_VALUE = -99.0
+COMPRESSION_LEVEL = 6
+DATE_FORMAT = '%Y-%m-%d'
+
+
+def get_store_path(weather_dir):
+	return os.path.join(weather_dir, STORE_DIR)
+
+
+def has_store(weather_dir):
+	return weather_dir is not None and os.path.exists(os.path.join(get_store_path(weather_dir), INDEX_FILE))
+
+
+def get_file_stamp(file_path):
+	st = os.stat(file_path)
+	return [st.st_size, st.st_mtime_ns]
+
+
+def compress_column(values):
+	return zlib.compress(array.array('d', values).tobytes(), COMPRESSION_LEVEL)
+
+
+def decompress_column(data):
+	values = array.array('d')
+	values.frombytes(zlib.decompress(data))
+	return values
+
+
+def to_float(val):
+	try:
+		return float(val)
+	except ValueError:
+		return MISSING_VALUE
+
+
+@functools.lru_cache(maxsize=8)
+def get_date_columns(start_date, total_days):
+	"""
+	Year and day of year text starting each line of a SWAT+ station file, for total_days + 1 days from start_date.
+	Stations usually cover the same dates, so the text is built once and shared by all of them.
+	"""
+	end_date = start_date + datetime.timedelta(days=total_days)
+	columns = []
+	date = start_date
+	while date <= end_date:
+		next_year = datetime.date(date.year + 1, 1, 1)
+		first_day = date.timetuple().tm_yday
+		last_day = first_day + (min(next_year, end_date + datetime.timedelta(days=1)) - date).days
+		year = str(date.year)
+		columns.extend([year + str(d).rjust(5) + " " for d in range(first_day, last_day)])
+		date = next_year
+	return columns
+
+
+def read_text_station(file_path):
+	"""
+	Coordinates, first date and value columns of a daily SWAT+ weather station file.
+	"""
+	with open(file_path, 'r') as f:
+		lines = f.read().splitlines()
+
+	if len(lines) < 4:
+		raise ValueError('No weather data in {file}'.format(file=file_path))
+
+	info = lines[2].split()
+	if len(info) < 5:
+		raise ValueError('Invalid value at line 3 of {file}. Expecting nbyr, tstep, lat, long, elev values separated by a space.'.format(file=file_path))
+	if int(info[1]) != 0:
+		raise ValueError('Only daily weather files can be stored: {file}'.format(file=file_path))
+
+	records = [line.split() for line in lines[3:] if line.strip() != '']
+	first = records[0]
+	last = records[-1]
+	start_date = datetime.date(int(first[0]), 1, 1) + datetime.timedelta(days=int(first[1]) - 1)
+	end_date = datetime.date(int(last[0]), 1, 1) + datetime.timedelta(days=int(last[1]) - 1)
+	if (end_date - start_date).days + 1 != len(records):
+		raise ValueError('Weather data in {file} is not one record per day'.format(file=file_path))
+
+	columns = [[to_float(r[i]) for r in records] for i in range(2, len(first))]
+	return float(info[2]), float(info[3]), float(info[4]), start_date, columns
+
+
+class WeatherStore:
+	def __init__(self, weather_dir):
+		self.weather_dir = weather_dir
+		self.path = get_store_path(weather_dir)
+		self.index_file = os.path.join(self.path, INDEX_FILE)
+		if not os.path.exists(self.path):
+			os.makedirs(self.path)
+
+		self.index = {'version': STORE_VERSION, 'variables': {}}
+		if os.path.exists(self.index_file):
+			with open(self.index_file, 'r') as f:
+				self.index = json.load(f)
+		self.replaced = set()
+
+	def save(self):
+		"""
+		Write the index, first compacting the data files of variables where stations were replaced.
+		"""
+		for var in sorted(self.replaced):
+			self.compact(var)
+		self.replaced = set()
+
+		tmp = self.index_file + '.tmp'
+		with open(tmp, 'w') as f:
+			json.dump(self.index, f)
+		os.replace(tmp, self.index_file)
+
+	def data_file(self, var):
+		return os.path.join(self.path, '{}.dat'.format(var))
+
+	def variables(self):
+		return [v for v in VARIABLES if len(self.index['variables'].get(v, {})) > 0]
+
+	def station_names(self, var):
+		return list(self.index['variables'].get(var, {}).keys())
+
+	def station(self, var, name):
+		return self.index['variables'].get(var, {}).get(name, None)
+
+	def is_current(self, var, name):
+		"""
+		Whether the store has the current data of a station: there is no text file for it in the weather
+		directory, or the file is the one it was stored from and has not changed since.
+		"""
+		entry = self.station(var, name)
+		if entry is None:
+			return False
+		file_path = os.path.join(self.weather_dir, name)
+		return not os.path.exists(file_path) or entry.get('source', None) == get_file_stamp(file_path)
+
+	def get_period(self, var, name):
+		"""
+		First and last date of a station's data.
+		"""
+		entry = self.station(var, name)
+		start_date = datetime.datetime.strptime(entry['start'], DATE_FORMAT).date()
+		return start_date, start_date + datetime.timedelta(days=entry['days'] - 1)
+
+	def add_station(self, var, name, lat, lon, elev, start_date, columns, source=None):
+		"""
+		Add or replace a station's data. columns is a list of value lists, e.g. [max, min] for temperature.
+		source is the get_file_stamp of the text file the data was read from.
+		"""
+		return self.add_compressed(var, name, lat, lon, elev, start_date, len(columns[0]), [compress_column(c) for c in columns], source)
+
+	def add_compressed(self, var, name, lat, lon, elev, start_date, days, blocks, source=None):
+		"""
+		Add a station whose columns were already compressed with compress_column, e.g. in another process.
+		Replaced stations leave their old columns in the data file until the store is saved.
+		"""
+		if name in self.index['variables'].get(var, {}):
+			self.replaced.add(var)
+
+		positions = []
+		with open(self.data_file(var), 'ab') as f:
+			pos = f.seek(0, os.SEEK_END)
+			for block in blocks:
+				f.write(block)
+				positions.append([pos, len(block)])
+				pos += len(block)
+
+		self.index['variables'].setdefault(var, {})[name] = {
+			'lat': lat,
+			'lon': lon,
+			'elev': elev,
+			'start': start_date.strftime(DATE_FORMAT),
+			'days': days,
+			'columns': positions,
+			'source': source
+		}
+
+	def compact(self, var):
+		"""
+		Rewrite a variable's data file with only the columns of its current stations.
+		"""
+		data_file = self.data_file(var)
+		stations = self.index['variables'].get(var, {})
+		if not os.path.exists(data_file):
+			return
+
+		tmp = data_file + '.tmp'
+		with open(data_file, 'rb') as src, open(tmp, 'wb') as dest:
+			pos = 0
+			for entry in stations.values():
+				positions = []
+				for old_pos, size in entry['columns']:
+					src.seek(old_pos)
+					dest.write(src.read(size))
+					positions.append([pos, size])
+					pos += size
+				entry['columns'] = positions
+		os.replace(tmp, data_file)
+
+	def import_text_files(self, weather_dir):
+		"""
+		Add the daily station files listed in the .cli files of a SWAT+ weather directory.
+		:return: names of the files that could not be stored, e.g. sub-daily data
+		"""
+		skipped = []
+		for var in VARIABLES:
+			cli_file = os.path.join(weather_dir, '{}.cli'.format(var))
+			if not os.path.exists(cli_file):
+				continue
+
+			with open(cli_file, 'r') as f:
+				names = [line.strip() for line in f.readlines()[2:] if line.strip() != '']
+
+			for name in names:
+				file_path = os.path.join(weather_dir, name)
+				try:
+					source = get_file_stamp(file_path)
+					lat, lon, elev, start_date, columns = read_text_station(file_path)
+				except (IOError, ValueError, IndexError):
+					skipped.append(name)
+					continue
+				self.add_station(var, name, lat, lon, elev, start_date, columns, source)
+		self.save()
+		return skipped
+
+	def read(self, var, name, start_date=None, end_date=None):
+		"""
+		Values of a station, limited to the days from start_date to end_date when given.
+		:return: date of the first value, list of value columns
+		"""
+		entry = self.station(var, name)
+		if entry is None:
+			raise ValueError('Station {name} is not in the {var} weather store'.format(name=name, var=var))
+
+		first_date, last_date = self.get_period(var, name)
+		i0 = 0 if start_date is None else min(entry['days'], max(0, (start_date - first_date).days))
+		i1 = entry['days'] if end_date is None else max(i0, min(entry['days'], (end_date - first_date).days + 1))
+
+		columns = []
+		with open(self.data_file(var), 'rb') as f:
+			for pos, size in entry['columns']:
+				f.seek(pos)
+				columns.append(decompress_column(f.read(size))[i0:i1])
+		return first_date + datetime.timedelta(days=i0), columns
+
+	def write_text_file(self, var, name, dest_dir, start_date=None, end_date=None):
+		"""
+		Write a station as a SWAT+ weather text file in dest_dir.
+		"""
+		entry = self.station(var, name)
+		first_date, columns = self.read(var, name, start_date, end_date)
+		days = len(columns[0])
+		last_date = first_date + datetime.timedelta(days=max(days - 1, 0))
+
+		text = [
+			"{file}: data - file written by SWAT+ editor from weather store {today}\n".format(file=name, today=datetime.datetime.now()),
+			"nbyr".rjust(4), "tstep".rjust(10), "lat".rjust(10), "lon".rjust(10), "elev".rjust(10), "\n",
+			str(last_date.year - first_date.year + 1).rjust(4), "0".rjust(10)
+		]
+		for val in [entry['lat'], entry['lon'], entry['elev']]:
+			text.append("{0:.3f}".format(val).rjust(10))
+		text.append("\n")
+
+		if days > 0:
+			dates = get_date_columns(first_date, days - 1)
+			for i in range(days):
+				text.append(dates[i] + "".join("{:10.5f}  ".format(c[i]) for c in columns) + "\n")
+
+		with open(os.path.join(dest_dir, name), 'w') as f:
+			f.write("".join(text))
+
+	def materialise(self, dest_dir, files=None, start_date=None, end_date=None, overwrite=True):
+		"""
+		Write SWAT+ text files, and the .cli file listing them, for the stations of each variable in
+		files ({variable: [station names]}, default all stations), limited to the given period.
+		Without overwrite, station and .cli files already in dest_dir are kept, e.g. when it is the weather directory itself.
+		:return: names of requested stations that are not in the store, or whose text file is newer (see is_current)
+		"""
+		if not os.path.exists(dest_dir):
+			os.makedirs(dest_dir)
+
+		missing = []
+		for var in VARIABLES:
+			names = self.station_names(var) if files is None else files.get(var, [])
+			if len(names) < 1:
+				continue
+
+			for name in names:
+				if not self.is_current(var, name):
+					missing.append(name)
+				elif overwrite or not os.path.exists(os.path.join(dest_dir, name)):
+					self.write_text_file(var, name, dest_dir, start_date, end_date)
+
+			cli_file = os.path.join(dest_dir, '{}.cli'.format(var))
+			if not overwrite and os.path.exists(cli_file):
+				continue
+
+			with open(cli_file, 'w') as f:
+				f.write("{var}.cli: file names - file written by SWAT+ editor from weather store {today}\n".format(var=var, today=datetime.datetime.now()))
+				f.write("filename\n")
+				for name in sorted(names, key=str.lower):
+					f.write(name)
+					f.write("\n")
+		return missing
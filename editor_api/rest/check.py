@@ -4,19 +4,134 @@ from peewee import *
 
 from .base import BaseRestModel
 from database.project.setup import SetupProjectDatabase
-from database.output.setup import SetupOutputDatabase
-from database.output import check, aquifer, channel, hyd, losses, misc, nutbal, plantwx, reservoir, waterbal, pest, base
+from database.output import check
 from database.project import connect, climate, gis, regions, simulation
 from database import lib
 
 import traceback
+import threading
+from collections import OrderedDict
+from types import SimpleNamespace
+
+# Check data of the most recently used projects, least recently used first
+CHECK_CACHE_SIZE = 4
+check_cache = OrderedDict()
+check_cache_lock = threading.Lock()
 
 
 def get_in_out_percent(value_in, value_out):
 	return 0 if value_in == 0 else (value_in - value_out) / value_in * 100
 
 
-def get_info(has_project_config):
+class CheckData:
+	"""
+	All output values used by SWAT+ Check, read with a fixed set of grouped queries on the project database
+	with the output database attached, so per HRU, channel and reservoir values are aggregated by SQLite.
+	"""
+	basin_tables = {
+		'wb': 'basin_wb_aa',
+		'aqu': 'basin_aqu_aa',
+		'nb': 'basin_nb_aa',
+		'pw': 'basin_pw_aa',
+		'ls': 'basin_ls_aa',
+		'basin_cha': 'basin_sd_cha_aa',
+		'basin_res': 'basin_res_aa'
+	}
+
+	def __init__(self, project_db, output_db):
+		conn = lib.open_db(project_db)
+		try:
+			conn.execute('ATTACH DATABASE ? AS out', (output_db,))
+			self.load(conn)
+		finally:
+			conn.close()
+
+	def exists(self, conn, table):
+		return conn.execute("SELECT 1 FROM out.sqlite_master WHERE type='table' AND name = ?", (table,)).fetchone() is not None
+
+	def get_row(self, conn, sql, params=()):
+		row = conn.execute(sql, params).fetchone()
+		return None if row is None else SimpleNamespace(**dict(row))
+
+	def get_rows(self, conn, sql, params=()):
+		return [SimpleNamespace(**dict(row)) for row in conn.execute(sql, params)]
+
+	def load(self, conn):
+		self.has_res = self.exists(conn, 'basin_res_aa')
+		self.has_yr_res = self.exists(conn, 'reservoir_yr')
+		self.swat_version = None
+		if self.exists(conn, 'project_config'):
+			self.swat_version = conn.execute('SELECT swat_version FROM out.project_config LIMIT 1').fetchone()
+			self.swat_version = None if self.swat_version is None else self.swat_version[0]
+
+		self.total_area = conn.execute('SELECT SUM(area) FROM rout_unit_con').fetchone()[0]
+
+		for key, table in self.basin_tables.items():
+			setattr(self, key, self.get_row(conn, 'SELECT * FROM out.{} LIMIT 1'.format(table)) if self.exists(conn, table) else None)
+
+		self.deep_recharge = conn.execute("SELECT SUM(rchrg) FROM out.aquifer_aa WHERE INSTR(LOWER(name), '_deep') > 0").fetchone()[0]
+		self.max_hru_sedyld = conn.execute('SELECT MAX(sedyld) FROM out.hru_ls_aa').fetchone()[0]
+
+		self.max_channel = self.get_row(conn, """SELECT flo_out, sed_out, orgn_out + no3_out + nh3_out + no2_out AS n_out, sedp_out + solp_out AS p_out
+			FROM out.channel_sd_aa ORDER BY flo_out DESC LIMIT 1""")
+		self.recall = self.get_row(conn, """SELECT COUNT(*) AS num, SUM(flo) AS flow_total, SUM(sed) AS sed_total,
+			SUM(orgn) + SUM(no3) + SUM(nh3) + SUM(no2) AS n_total, SUM(sedp) + SUM(solp) AS p_total FROM out.recall_aa""")
+
+		self.reaches = self.get_rows(conn, """SELECT name, sed_in, sed_out,
+			no3_in + nh3_in + no2_in + orgn_in AS n_in, no3_out + nh3_out + no2_out + orgn_out AS n_out,
+			solp_in + sedp_in AS p_in, solp_out + sedp_out AS p_out FROM out.channel_sd_aa""")
+
+		# crop_yld_aa may list several crops for an HRU; like the original dictionary lookup, use the last one
+		area = 'COALESCE(h.area, 0)'
+		self.landuse = [dict(row) for row in conn.execute("""SELECT TRIM(COALESCE(c.plantnm, 'NA')) AS landUse, SUM({a}) AS area,
+			SUM(wb.cn * {a}) AS cn, SUM(wb.irr * {a}) AS irr, SUM(wb.precip * {a}) AS prec, SUM(wb.surq_cont * {a}) AS surq, SUM(wb.et * {a}) AS et,
+			SUM(ls.sedyld * {a}) AS sed, SUM(ls.surqno3 * {a}) AS no3, SUM(ls.sedorgn * {a}) AS orgn,
+			SUM(pw.bioms * {a}) AS biom, SUM(pw.yld * {a}) AS yld
+			FROM out.hru_wb_aa wb
+			JOIN out.hru_ls_aa ls ON ls.unit = wb.unit
+			JOIN out.hru_pw_aa pw ON pw.unit = wb.unit
+			LEFT JOIN (SELECT unit, plantnm FROM out.crop_yld_aa WHERE id IN (SELECT MAX(id) FROM out.crop_yld_aa GROUP BY unit)) c ON c.unit = wb.unit
+			LEFT JOIN hru_con h ON h.name = wb.name
+			GROUP BY 1 ORDER BY MIN(wb.unit)""".format(a=area))]
+		self.high_cn_hrus = [r[0] for r in conn.execute('SELECT name FROM out.hru_wb_aa WHERE cn > 98')]
+		self.low_cn_hrus = [r[0] for r in conn.execute('SELECT name FROM out.hru_wb_aa WHERE cn < 35')]
+
+		self.reservoirs = []
+		self.reservoir_years = None
+		self.reservoir_yr_stats = {}
+		if self.has_res:
+			self.reservoirs = self.get_rows(conn, 'SELECT * FROM out.reservoir_aa') if self.exists(conn, 'reservoir_aa') else []
+			if self.has_yr_res:
+				self.reservoir_years = self.get_row(conn, 'SELECT MIN(yr) AS init_yr, MAX(yr) AS final_yr, COUNT(*) AS num_yrs FROM out.reservoir_yr WHERE unit = 1')
+				stats = conn.execute("""SELECT unit, MAX(CASE WHEN yr = ? THEN flo_stor END) AS init_vol, MAX(CASE WHEN yr = ? THEN flo_stor END) AS final_vol,
+					SUM(CASE WHEN flo_stor < 1 THEN 1 ELSE 0 END) AS empty_count FROM out.reservoir_yr GROUP BY unit""", (self.reservoir_years.init_yr, self.reservoir_years.final_yr))
+				self.reservoir_yr_stats = {row['unit']: SimpleNamespace(**dict(row)) for row in stats}
+
+
+def get_check_data(project_db, output_db):
+	"""
+	CheckData for a project, computed again only when the output or project database has changed since the last request.
+	Only the CHECK_CACHE_SIZE most recently used projects are kept.
+	"""
+	key = (project_db, output_db)
+	stamp = lib.get_file_stamp(output_db) + lib.get_file_stamp(project_db)
+	with check_cache_lock:
+		cached = check_cache.get(key, None)
+		if cached is not None:
+			check_cache.move_to_end(key)
+	if cached is not None and cached[0] == stamp:
+		return cached[1]
+
+	data = CheckData(project_db, output_db)
+	with check_cache_lock:
+		check_cache[key] = (stamp, data)
+		check_cache.move_to_end(key)
+		while len(check_cache) > CHECK_CACHE_SIZE:
+			check_cache.popitem(last=False)
+	return data
+
+
+def get_info(data):
 	info = check.CheckInfo()
 
 	time_sim = simulation.Time_sim.get_or_none()
@@ -33,15 +148,13 @@ def get_info(has_project_config):
 	info.weatherMethod = 'Observed' if climate.Weather_sta_cli.observed_count() > 0 else 'Simulated'
 	info.watershedArea = connect.Rout_unit_con.select(fn.Sum(connect.Rout_unit_con.area)).scalar()
 
-	if has_project_config:
-		pc = base.Project_config.get_or_none()
-		if pc is not None:
-			info.swatVersion = pc.swat_version
+	if data.swat_version is not None:
+		info.swatVersion = data.swat_version
 
 	return info
 
 
-def get_hyd(wb, aqu):
+def get_hyd(wb, aqu, deep_recharge):
 	hyd = check.CheckHydrology()
 	if wb is not None:
 		hyd.averageCn = wb.cn
@@ -59,9 +172,8 @@ def get_hyd(wb, aqu):
 		hyd.returnFlow = aqu.flo
 		hyd.revap = aqu.revap
 
-	deep_aqu = aquifer.Aquifer_aa.select(fn.SUM(aquifer.Aquifer_aa.rchrg).alias('rchrg_total')).where(aquifer.Aquifer_aa.name.contains('_deep')).get()
-	if deep_aqu is not None and deep_aqu.rchrg_total is not None:
-		hyd.recharge = deep_aqu.rchrg_total
+	if deep_recharge is not None:
+		hyd.recharge = deep_recharge
 
 	totalFlow = hyd.returnFlow + hyd.lateralFlow + hyd.surfaceRunoff
 	if totalFlow > 0:
@@ -349,168 +461,116 @@ def get_landscape(ls, ncycle, aqu):
 	return landscape
 
 
-def get_landuse():
-	#get plant name for each hru
-	hru_to_crop = { c.unit: c.plantnm for c in misc.Crop_yld_aa.select() }
-	hru_name_to_area = { h.name: h.area for h in connect.Hru_con.select() }
-	hru_wb = waterbal.Hru_wb_aa.select().order_by(waterbal.Hru_wb_aa.unit)
-	hru_ls = losses.Hru_ls_aa.select().order_by(losses.Hru_ls_aa.unit)
-	hru_pw = plantwx.Hru_pw_aa.select().order_by(plantwx.Hru_pw_aa.unit)
-
-	rows = {}
+def get_landuse(data):
+	rows = {r['landUse']: dict(r, awc='NA', usle_ls='NA', gwq='NA') for r in data.landuse}
 	warnings = []
-	if len(hru_wb) == len(hru_ls) and len(hru_wb) == len(hru_pw):
-		i = 0
-		for wb in hru_wb:
-			landuse = hru_to_crop.get(wb.unit, 'NA').strip()
-			area = hru_name_to_area.get(wb.name, 0)
-			match = rows.get(landuse, None)
-
-			if match is None:
-				rows[landuse] = {
-					'landUse': landuse,
-					'area': area,
-					'cn': wb.cn * area,
-					'awc': 'NA',
-					'usle_ls': 'NA',
-					'irr': wb.irr * area,
-					'prec': wb.precip * area,
-					'surq': wb.surq_cont * area,
-					'gwq': 'NA',
-					'et': wb.et * area,
-					'sed': hru_ls[i].sedyld * area,
-					'no3': hru_ls[i].surqno3 * area,
-					'orgn': hru_ls[i].sedorgn * area,
-					'biom': hru_pw[i].bioms * area,
-					'yld': hru_pw[i].yld * area,
-				}
-			else:
-				rows[landuse]['area'] += area
-				rows[landuse]['cn'] += wb.cn * area
-				rows[landuse]['irr'] += wb.irr * area
-				rows[landuse]['prec'] += wb.precip * area
-				rows[landuse]['surq'] += wb.surq_cont * area
-				rows[landuse]['et'] += wb.et * area
-				rows[landuse]['sed'] += hru_ls[i].sedyld * area
-				rows[landuse]['no3'] += hru_ls[i].surqno3 * area
-				rows[landuse]['orgn'] += hru_ls[i].sedorgn * area
-				rows[landuse]['biom'] += hru_pw[i].bioms * area
-				rows[landuse]['yld'] += hru_pw[i].yld * area
-
-			i += 1
-
-		lu_rows = []
-		for k in rows:
-			if rows[k]['area'] > 0:
-				rows[k]['cn'] /= rows[k]['area']
-				rows[k]['irr'] /= rows[k]['area']
-				rows[k]['prec'] /= rows[k]['area']
-				rows[k]['surq'] /= rows[k]['area']
-				rows[k]['et'] /= rows[k]['area']
-				rows[k]['sed'] /= rows[k]['area']
-				rows[k]['no3'] /= rows[k]['area']
-				rows[k]['orgn'] /= rows[k]['area']
-				rows[k]['biom'] /= rows[k]['area']
-				rows[k]['yld'] /= rows[k]['area']
-
-				rows[k]['biom'] /= 1000
-				rows[k]['yld'] /= 1000
-			lu_rows.append(rows[k])
-
-			if rows[k]['cn'] > 95:
-				warnings.append('{} curve number may be too high'.format(k))
-			elif rows[k]['cn'] < 35:
-				warnings.append('{} curve number may be too low'.format(k))
-
-			"""if rows[k]['awc'] > 606:
-				warnings.append('{} available water may be too high'.format(k))
-			elif rows[k]['awc'] < 41:
-				warnings.append('{} available water may be too low'.format(k))
-
-			if rows[k]['usle_ls'] > 16.4:
-				warnings.append('{} USLE LS factor may be too high'.format(k))
-			elif rows[k]['usle_ls'] < 0.02:
-				warnings.append('{} USLE LS factor may be too low'.format(k))"""
-
-			if rows[k]['prec'] != 0:
-				if rows[k]['et'] / rows[k]['prec'] < 0.31:
-					warnings.append('{} ET less than 31% of irrigation water + precipitation'.format(k))
-				elif rows[k]['et'] / (rows[k]['prec'] + rows[k]['irr']) > 0.98:
-					warnings.append('{} ET more than 98% of irrigation water + precipitation'.format(k))
-
-				if rows[k]['surq'] / rows[k]['prec'] > 0.5:
-					warnings.append('{} more than 1/2 precipitation is runoff'.format(k))
-				elif rows[k]['surq'] / rows[k]['prec'] < 0.01:
-					warnings.append('{} less than 1% of precipitation in runoff'.format(k))
-
-			ratio = 0.0129 * rows[k]['cn'] - 0.2857
-			eSurq = ratio * 0.26 * rows[k]['prec']
-
-			if eSurq != 0:
-				ratio = rows[k]['surq'] / eSurq
-				if ratio > 1.5:
-					warnings.append('{} surface runoff may be excessive'.format(k))
-				elif ratio < 0.5:
-					warnings.append('{} surface runoff may be too low'.format(k))
-
-			if rows[k]['no3'] > 80:
-				warnings.append('{} nitrate yield may be too high {:.2f} kg/ha'.format(k, rows[k]['no3']))
-
-			if rows[k]['biom'] > 50:
-				warnings.append('{} biomass may be too high {:.2f} t/ha'.format(k, rows[k]['biom']))
-			elif rows[k]['biom'] < 1:
-				warnings.append('{} biomass may be too low {:.2f} t/ha'.format(k, rows[k]['biom']))
-
-			"""if rows[k]['surq'] != 0 or rows[k]['gwq'] != 0:
-				if rows[k]['gwq'] / (rows[k]['surq'] + rows[k]['gwq']) > 0.69:
-					warnings.append('{} more than 69% of water yield is baseflow'.format(k))
-				elif rows[k]['gwq'] / (rows[k]['surq'] + rows[k]['gwq']) < 0.22:
-					warnings.append('{} less than 22% of water yield is baseflow'.format(k))"""
-
-			if rows[k]['area'] < 0.05:
-				warnings.append('{} HRU area is less than 5 hectares, is this necessary?'.format(k))
-
-			if rows[k]['prec'] > 3400:
-				warnings.append('{} precipitation greater than 3400mm/yr'.format(k))
-			elif rows[k]['prec'] < 65:
-				warnings.append('{} precipitation less than 65mm/yr'.format(k))
+	lu_rows = []
+	for k in rows:
+		if rows[k]['area'] > 0:
+			rows[k]['cn'] /= rows[k]['area']
+			rows[k]['irr'] /= rows[k]['area']
+			rows[k]['prec'] /= rows[k]['area']
+			rows[k]['surq'] /= rows[k]['area']
+			rows[k]['et'] /= rows[k]['area']
+			rows[k]['sed'] /= rows[k]['area']
+			rows[k]['no3'] /= rows[k]['area']
+			rows[k]['orgn'] /= rows[k]['area']
+			rows[k]['biom'] /= rows[k]['area']
+			rows[k]['yld'] /= rows[k]['area']
+
+			rows[k]['biom'] /= 1000
+			rows[k]['yld'] /= 1000
+		lu_rows.append(rows[k])
+
+		if rows[k]['cn'] > 95:
+			warnings.append('{} curve number may be too high'.format(k))
+		elif rows[k]['cn'] < 35:
+			warnings.append('{} curve number may be too low'.format(k))
+
+		"""if rows[k]['awc'] > 606:
+			warnings.append('{} available water may be too high'.format(k))
+		elif rows[k]['awc'] < 41:
+			warnings.append('{} available water may be too low'.format(k))
+
+		if rows[k]['usle_ls'] > 16.4:
+			warnings.append('{} USLE LS factor may be too high'.format(k))
+		elif rows[k]['usle_ls'] < 0.02:
+			warnings.append('{} USLE LS factor may be too low'.format(k))"""
+
+		if rows[k]['prec'] != 0:
+			if rows[k]['et'] / rows[k]['prec'] < 0.31:
+				warnings.append('{} ET less than 31% of irrigation water + precipitation'.format(k))
+			elif rows[k]['et'] / (rows[k]['prec'] + rows[k]['irr']) > 0.98:
+				warnings.append('{} ET more than 98% of irrigation water + precipitation'.format(k))
+
+			if rows[k]['surq'] / rows[k]['prec'] > 0.5:
+				warnings.append('{} more than 1/2 precipitation is runoff'.format(k))
+			elif rows[k]['surq'] / rows[k]['prec'] < 0.01:
+				warnings.append('{} less than 1% of precipitation in runoff'.format(k))
+
+		ratio = 0.0129 * rows[k]['cn'] - 0.2857
+		eSurq = ratio * 0.26 * rows[k]['prec']
+
+		if eSurq != 0:
+			ratio = rows[k]['surq'] / eSurq
+			if ratio > 1.5:
+				warnings.append('{} surface runoff may be excessive'.format(k))
+			elif ratio < 0.5:
+				warnings.append('{} surface runoff may be too low'.format(k))
+
+		if rows[k]['no3'] > 80:
+			warnings.append('{} nitrate yield may be too high {:.2f} kg/ha'.format(k, rows[k]['no3']))
+
+		if rows[k]['biom'] > 50:
+			warnings.append('{} biomass may be too high {:.2f} t/ha'.format(k, rows[k]['biom']))
+		elif rows[k]['biom'] < 1:
+			warnings.append('{} biomass may be too low {:.2f} t/ha'.format(k, rows[k]['biom']))
+
+		"""if rows[k]['surq'] != 0 or rows[k]['gwq'] != 0:
+			if rows[k]['gwq'] / (rows[k]['surq'] + rows[k]['gwq']) > 0.69:
+				warnings.append('{} more than 69% of water yield is baseflow'.format(k))
+			elif rows[k]['gwq'] / (rows[k]['surq'] + rows[k]['gwq']) < 0.22:
+				warnings.append('{} less than 22% of water yield is baseflow'.format(k))"""
+
+		if rows[k]['area'] < 0.05:
+			warnings.append('{} HRU area is less than 5 hectares, is this necessary?'.format(k))
+
+		if rows[k]['prec'] > 3400:
+			warnings.append('{} precipitation greater than 3400mm/yr'.format(k))
+		elif rows[k]['prec'] < 65:
+			warnings.append('{} precipitation less than 65mm/yr'.format(k))
 
 	landuse = check.CheckLandUseSummary()
 	landuse.landUseRows = lu_rows
 	landuse.warnings = warnings
 
-	too_high_cn = waterbal.Hru_wb_aa.select().where(waterbal.Hru_wb_aa.cn > 98)
-	if too_high_cn.count() > 0:
-		hrus = [h.name for h in too_high_cn]
-		landuse.hruLevelWarnings.append('Curve number may be too high (>98) for the following HRUs: {}'.format(', '.join(hrus)))
+	if len(data.high_cn_hrus) > 0:
+		landuse.hruLevelWarnings.append('Curve number may be too high (>98) for the following HRUs: {}'.format(', '.join(data.high_cn_hrus)))
 
-	too_low_cn = waterbal.Hru_wb_aa.select().where(waterbal.Hru_wb_aa.cn < 35)
-	if too_low_cn.count() > 0:
-		hrus = [h.name for h in too_low_cn]
-		landuse.hruLevelWarnings.append('Curve number may be too low (<35) for the following HRUs: {}'.format(', '.join(hrus)))
+	if len(data.low_cn_hrus) > 0:
+		landuse.hruLevelWarnings.append('Curve number may be too low (<35) for the following HRUs: {}'.format(', '.join(data.low_cn_hrus)))
 
 	return landuse
 
 
-def get_psrc(ls, total_area):
+def get_psrc(data):
 	subLoad = check.CheckPointSourcesLoad()
 	psLoad = check.CheckPointSourcesLoad()
 	fromLoad = check.CheckPointSourcesLoad()
 
-	if channel.Channel_sd_aa.select().count() > 0:
-		cha = channel.Channel_sd_aa.select().order_by(channel.Channel_sd_aa.flo_out.desc())[0]
+	cha = data.max_channel
+	if cha is not None:
 		subLoad.flow = cha.flo_out / 365
 		subLoad.sediment = cha.sed_out
-		subLoad.nitrogen = cha.orgn_out + cha.no3_out + cha.nh3_out + cha.no2_out
-		subLoad.phosphorus = cha.sedp_out + cha.solp_out
+		subLoad.nitrogen = cha.n_out
+		subLoad.phosphorus = cha.p_out
 
-	ptable = hyd.Recall_aa
-	if ptable.select().count() > 0:
-		pts = ptable.select(fn.SUM(ptable.flo).alias('flow_total'), fn.SUM(ptable.sed).alias('sed_total'), fn.SUM(ptable.orgn).alias('orgn_total'), fn.SUM(ptable.sedp).alias('sedp_total'), fn.SUM(ptable.no3).alias('no3_total'), fn.SUM(ptable.nh3).alias('nh3_total'), fn.SUM(ptable.no2).alias('no2_total'), fn.SUM(ptable.solp).alias('solp_total')).get()
+	pts = data.recall
+	if pts.num > 0:
 		psLoad.flow = pts.flow_total / 365
 		psLoad.sediment = pts.sed_total
-		psLoad.nitrogen = pts.orgn_total + pts.no3_total + pts.nh3_total + pts.no2_total
-		psLoad.phosphorus = pts.sedp_total + pts.solp_total
+		psLoad.nitrogen = pts.n_total
+		psLoad.phosphorus = pts.p_total
 
 	fromLoad.flow = 0 if subLoad.flow == 0 else psLoad.flow / (psLoad.flow + subLoad.flow) * 100
 	fromLoad.sediment = 0 if subLoad.sediment == 0 else psLoad.sediment / (psLoad.sediment + subLoad.sediment) * 100
@@ -558,7 +618,7 @@ def get_psrc(ls, total_area):
 	return psrc
 
 
-def get_res(has_res, has_yr_res):
+def get_res(data):
 	res = check.CheckReservoirs()
 	res.avgTrappingEfficiencies = check.CheckAvgTrappingEfficiency()
 	res.avgWaterLosses = check.CheckAvgWaterLoss()
@@ -567,10 +627,11 @@ def get_res(has_res, has_yr_res):
 	res.avgReservoirTrends.maxVolume = 'NA'
 	res.avgReservoirTrends.minVolume = 'NA'
 
-	if not has_res:
+	has_yr_res = data.has_yr_res
+	if not data.has_res:
 		res.warnings.append('No reservoir data available.')
 	else:
-		basin_res = reservoir.Basin_res_aa.get_or_none()
+		basin_res = data.basin_res
 		if basin_res is None:
 			res.warnings.append('No reservoir data available.')
 		else:
@@ -591,15 +652,10 @@ def get_res(has_res, has_yr_res):
 			init_yr = 0
 			final_yr = 0
 			if has_yr_res:
-				res_yrs = reservoir.Reservoir_yr.select().where(reservoir.Reservoir_yr.unit == 1).order_by(reservoir.Reservoir_yr.yr)
-				num_yrs = res_yrs.count()
-				if (num_yrs > 0):
-					init_yr = res_yrs[0].yr
-					final_yr = res_yrs[num_yrs - 1].yr
-
+				num_yrs = data.reservoir_years.num_yrs
 
-			res_list = reservoir.Reservoir_aa.select()
-			res.avgReservoirTrends.numberReservoirs = res_list.count()
+			res_list = data.reservoirs
+			res.avgReservoirTrends.numberReservoirs = len(res_list)
 
 			per_res_warns = [None] * 9
 			ratios = []
@@ -621,9 +677,10 @@ def get_res(has_res, has_yr_res):
 				row.volumeRatio = 'NA'
 				row.fractionEmpty = 'NA'
 				if has_yr_res:
-					init_vol = reservoir.Reservoir_yr.select().where((reservoir.Reservoir_yr.unit == r.unit) & (reservoir.Reservoir_yr.yr == init_yr)).get().flo_stor
-					final_vol = reservoir.Reservoir_yr.select().where((reservoir.Reservoir_yr.unit == r.unit) & (reservoir.Reservoir_yr.yr == final_yr)).get().flo_stor
-					empty_vol_count = reservoir.Reservoir_yr.select().where((reservoir.Reservoir_yr.unit == r.unit) & (reservoir.Reservoir_yr.flo_stor < 1)).count()
+					stats = data.reservoir_yr_stats.get(r.unit, None)
+					init_vol = 0 if stats is None or stats.init_vol is None else stats.init_vol
+					final_vol = 0 if stats is None or stats.final_vol is None else stats.final_vol
+					empty_vol_count = 0 if stats is None else stats.empty_count
 
 					ratio = 0 if init_vol == 0 else final_vol / init_vol
 					empty_frac = 0 if num_yrs == 0 else empty_vol_count / num_yrs
@@ -743,16 +800,11 @@ def get_instream(basin_cha, cha, wb, ls, total_area, psrc):
 
 		rch = []
 		for c in cha:
-			c_n_in = c.no3_in + c.nh3_in + c.no2_in + c.orgn_in
-			c_n_out = c.no3_out + c.nh3_out + c.no2_out + c.orgn_out
-			c_p_in = c.solp_in + c.sedp_in
-			c_p_out = c.solp_out + c.sedp_out
-
 			r = check.CheckReach()
 			r.id = c.name
 			r.sediment = 0 if c.sed_in == 0 else c.sed_out / c.sed_in * 100
-			r.nitrogen = 0 if c_n_in == 0 else c_n_out / c_n_in * 100
-			r.phosphorus = 0 if c_p_in == 0 else c_p_out / c_p_in * 100
+			r.nitrogen = 0 if c.n_in == 0 else c.n_out / c.n_in * 100
+			r.phosphorus = 0 if c.p_in == 0 else c.p_out / c.p_in * 100
 			rch.append(r)
 
 		instream.uplandSedimentYield = ls.sedyld
@@ -769,7 +821,7 @@ def get_instream(basin_cha, cha, wb, ls, total_area, psrc):
 	return instream
 
 
-def get_sed(instream, psrc, ls, wb):
+def get_sed(instream, psrc, ls, wb, max_hru_sedyld):
 	sed = check.CheckSediment()
 	sed.inStreamSedimentChange = instream.instreamSedimentChange
 	sed.inletSediment = psrc.pointSourceInletLoad.sediment
@@ -778,8 +830,8 @@ def get_sed(instream, psrc, ls, wb):
 	if ls is not None:
 		sed.avgUplandSedimentYield = ls.sedyld
 
-	if losses.Hru_ls_aa.select().count() > 0:
-		sed.maxUplandSedimentYield = losses.Hru_ls_aa.select(fn.Max(losses.Hru_ls_aa.sedyld)).scalar()
+	if max_hru_sedyld is not None:
+		sed.maxUplandSedimentYield = max_hru_sedyld
 
 	return sed
 
@@ -791,7 +843,6 @@ class SwatCheckApi(BaseRestModel):
 		parser.add_argument('output_db', type=str, required=True, location='json')
 		args = parser.parse_args(strict=False)
 
-		SetupOutputDatabase.init(args.output_db)
 		SetupProjectDatabase.init(args.project_db)
 
 		required_tables = [
@@ -802,36 +853,27 @@ class SwatCheckApi(BaseRestModel):
 		]
 
 		conn = lib.open_db(args.output_db)
-		for table in required_tables:
-			if not lib.exists_table(conn, table):
-				abort(500, message='Could not load SWAT+ Check because the table "{}" does not exist in your output database. Re-run your model and check all yearly and average annual files under the print options, and keep the analyze output box checked.'.format(table))
+		missing = [table for table in required_tables if not lib.exists_table(conn, table)]
+		conn.close()
+		if len(missing) > 0:
+			abort(500, message='Could not load SWAT+ Check because the table "{}" does not exist in your output database. Re-run your model and check all yearly and average annual files under the print options, and keep the analyze output box checked.'.format(missing[0]))
 
 		try:
-			has_res = lib.exists_table(conn, 'basin_res_aa')
-			has_yr_res = lib.exists_table(conn, 'reservoir_yr')
-			has_project_config = lib.exists_table(conn, 'project_config')
-
-			total_area = connect.Rout_unit_con.select(fn.Sum(connect.Rout_unit_con.area)).scalar()
-
-			wb = waterbal.Basin_wb_aa.get_or_none()
-			aqu = aquifer.Basin_aqu_aa.get_or_none()
-			nb = nutbal.Basin_nb_aa.get_or_none()
-			pw = plantwx.Basin_pw_aa.get_or_none()
-			ls = losses.Basin_ls_aa.get_or_none()
-			basin_cha = channel.Basin_sd_cha_aa.get_or_none()
-			cha = channel.Channel_sd_aa.select()
-
-			info = get_info(has_project_config)
-			hydrology = get_hyd(wb, aqu)
-			ncycle = get_ncycle(nb, pw, ls)
-			pcycle = get_pcycle(nb, pw, ls)
-			pg = get_pg(nb, pw)
-			landscape = get_landscape(ls, ncycle, aqu)
-			landuse = get_landuse()
-			psrc = get_psrc(ls, total_area)
-			res = get_res(has_res, has_yr_res)
-			instream = get_instream(basin_cha, cha, wb, ls, total_area, psrc)
-			sed = get_sed(instream, psrc, ls, wb)
+			data = get_check_data(args.project_db, args.output_db)
+			wb = data.wb
+			ls = data.ls
+
+			info = get_info(data)
+			hydrology = get_hyd(wb, data.aqu, data.deep_recharge)
+			ncycle = get_ncycle(data.nb, data.pw, ls)
+			pcycle = get_pcycle(data.nb, data.pw, ls)
+			pg = get_pg(data.nb, data.pw)
+			landscape = get_landscape(ls, ncycle, data.aqu)
+			landuse = get_landuse(data)
+			psrc = get_psrc(data)
+			res = get_res(data)
+			instream = get_instream(data.basin_cha, data.reaches, wb, ls, data.total_area, psrc)
+			sed = get_sed(instream, psrc, ls, wb, data.max_hru_sedyld)
 
 			return {
 				'setup': info.toJson(),
@@ -0,0 +1,40 @@
+from flask_restful import Resource, reqparse, abort
+
+from helpers.job_manager import JobManager, JOB_ACTIONS
+
+manager = JobManager()
+
+
+def get_job_or_abort(id):
+	job = manager.get(id)
+	if job is None:
+		abort(404, message='Job {id} does not exist'.format(id=id))
+	return job
+
+
+class JobListApi(Resource):
+	def get(self):
+		return [job.to_dict() for job in manager.list()]
+
+	def post(self):
+		parser = reqparse.RequestParser()
+		parser.add_argument('action', type=str, required=True, location='json', help='one of: {}'.format(', '.join(JOB_ACTIONS)))
+		parser.add_argument('args', type=dict, required=False, location='json')
+		args = parser.parse_args(strict=False)
+
+		try:
+			job = manager.submit(args['action'], args['args'])
+		except ValueError as e:
+			abort(400, message=str(e))
+		return job.to_dict(), 201
+
+
+class JobApi(Resource):
+	def get(self, id):
+		return get_job_or_abort(id).to_dict()
+
+	def delete(self, id):
+		job = get_job_or_abort(id)
+		if not manager.cancel(job):
+			abort(400, message='Job {id} has already finished with status {status}'.format(id=id, status=job.status))
+		return job.to_dict(), 202
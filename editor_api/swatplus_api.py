@@ -2,26 +2,29 @@ from helpers.executable_api import Unbuffered
 from actions.setup_project import SetupProject
 from actions.import_gis import GisImport
 from actions.import_weather import WeatherImport, Swat2012WeatherImport, WgnImport
-from actions.read_output import ReadOutput
+from actions.read_output import ReadOutput, OutputFilter
 from actions.write_files import WriteFiles
 from actions.create_databases import CreateDatasetsDb, CreateOutputDb, CreateProjectDb
 from actions.import_export_data import ImportExportData
 from actions.update_project import UpdateProject
 from actions.reimport_gis import ReimportGis
 from actions.run_all import RunAll
+from actions.run_ensemble import RunEnsemble
 from actions.load_scenarios import LoadScenarios
-from database import soils
+from database import soils, lib as db_lib
 
 import sys
 import argparse
+import logging
 
 if __name__ == '__main__':
 	sys.stdout = Unbuffered(sys.stdout)
 	parser = argparse.ArgumentParser(description="SWAT+ Editor API")
-	parser.add_argument("action", type=str, help="name of the API action: setup_project, import_gis, import_weather, read_output, write_files, import_csv, export_csv, update_project, reimport_gis, run")
+	parser.add_argument("action", type=str, help="name of the API action: setup_project, import_gis, import_weather, read_output, write_files, import_csv, export_csv, update_project, reimport_gis, run, run_ensemble")
 
 	parser.add_argument("--project_db_file", type=str, help="full path of project SQLite database file", nargs="?")
 	parser.add_argument("--delete_existing", type=str, help="y/n delete existing data first", nargs="?")
+	parser.add_argument("--log_file", type=str, help="full path of a log file for database timings (optional)", nargs="?")
 
 	# import weather
 	parser.add_argument("--import_type", type=str, help="type of weather to import: observed, observed2012, wgn", nargs="?")
@@ -30,10 +33,22 @@ if __name__ == '__main__':
 	parser.add_argument("--import_method", type=str, help="import method for wgn (database, two_file, one_file)", nargs="?")
 	parser.add_argument("--file1", type=str, help="full path of file", nargs="?")
 	parser.add_argument("--file2", type=str, help="full path of file", nargs="?")
+	parser.add_argument("--weather_workers", type=int, help="number of processes converting SWAT2012 station files (default up to 4)", nargs="?")
+	parser.add_argument("--weather_store", action="store_true", help="keep observed weather in the compressed weather store instead of (SWAT2012) or as well as (SWAT+) text files")
 
 	# read output
 	parser.add_argument("--output_files_dir", type=str, help="full path of output files directory", nargs="?")
 	parser.add_argument("--output_db_file", type=str, help="full path of output SQLite database file", nargs="?")
+	parser.add_argument("--output_workers", type=int, help="number of processes parsing output files (default up to 4)", nargs="?")
+	parser.add_argument("--output_format", type=str, help="output import format: sqlite, parquet or both (default sqlite)", nargs="?", default="sqlite")
+	parser.add_argument("--output_dataset_dir", type=str, help="full path of the parquet output dataset directory (default next to the output database)", nargs="?")
+	parser.add_argument("--output_tables", type=str, help="comma separated output table name patterns to import, e.g. channel_sd_*,hru_wb_yr (default all)", nargs="?")
+	parser.add_argument("--output_exclude_tables", type=str, help="comma separated output table name patterns to skip", nargs="?")
+	parser.add_argument("--output_units", type=str, help="output unit ids to import, e.g. 1,4,10-20 (default all)", nargs="?")
+	parser.add_argument("--output_start_date", type=str, help="first output date to import as YYYY, YYYY-MM or YYYY-MM-DD", nargs="?")
+	parser.add_argument("--output_end_date", type=str, help="last output date to import as YYYY, YYYY-MM or YYYY-MM-DD", nargs="?")
+	parser.add_argument("--follow_output", action="store_true", help="with the run action, import output files while the model is running")
+	parser.add_argument("--output_summaries", action="store_true", help="build monthly and yearly output tables from daily output that SWAT+ did not print")
 
 	# create databases
 	parser.add_argument("--db_type", type=str, help="which database: datasets, output, project", nargs="?")
@@ -56,6 +71,7 @@ if __name__ == '__main__':
 	parser.add_argument("--is_lte", type=str, help="y/n use lte version of SWAT+ (default n)", nargs="?")
 	parser.add_argument("--update_project_values", type=str, help="y/n update project values (default n)", nargs="?")
 	parser.add_argument("--reimport_gis", type=str, help="y/n re-import GIS data (default n)", nargs="?")
+	parser.add_argument("--incremental_gis", type=str, help="y/n with reimport_gis, only re-import GIS data that changed since the last import (default n)", nargs="?")
 
 	# run from command line
 	parser.add_argument("--swat_exe_file", type=str, help="full path of the SWAT+ executable file", nargs="?")
@@ -72,22 +88,29 @@ if __name__ == '__main__':
 	parser.add_argument("--year_end", type=str, help="ending year of simulation (omit to use weather files dates)", nargs="?")
 	parser.add_argument("--day_end", type=str, help="ending day of simulation (omit to use weather files dates)", nargs="?")
 	parser.add_argument("--input_files_dir", type=str, help="full path of where to write input files, defaults to Scenarios/Default/TxtInOut", nargs="?")
+	parser.add_argument("--weather_sources", type=str, help="with the run_ensemble action, folder with one weather folder per member, or a text file with one 'path' or 'name,path' per line", nargs="?")
+	parser.add_argument("--ensemble_dir", type=str, help="full path of the folder for ensemble member inputs and results, defaults to Scenarios/Ensemble", nargs="?")
+	parser.add_argument("--ensemble_workers", type=int, help="number of ensemble members run at the same time (default up to 4)", nargs="?")
 
 	args = parser.parse_args()
 
+	if args.log_file is not None:
+		logging.basicConfig(filename=args.log_file, filemode='w', level=logging.INFO, format='%(asctime)s %(message)s')
+
 	del_ex = True if args.delete_existing == "y" else False
 	cre_sta = True if args.create_stations == "y" else False
 	constant_ps = True if args.constant_ps == "y" else False
 	is_lte = True if args.is_lte == "y" else False
 	update_project_values = True if args.update_project_values == "y" else False
 	reimport_gis = True if args.reimport_gis == "y" else False
+	incremental_gis = True if args.incremental_gis == "y" else False
 
 	if args.action == "setup_project":
 		api = SetupProject(args.project_db_file, args.editor_version, args.project_name, args.datasets_db_file, constant_ps, is_lte, args.project_description)
 	elif args.action == "update_project":
 		api = UpdateProject(args.project_db_file, args.editor_version, args.datasets_db_file, update_project_values, reimport_gis)
 	elif args.action == "reimport_gis":
-		api = ReimportGis(args.project_db_file, args.editor_version, args.project_name, args.datasets_db_file, constant_ps, is_lte)
+		api = ReimportGis(args.project_db_file, args.editor_version, args.project_name, args.datasets_db_file, constant_ps, is_lte, incremental_gis)
 	elif args.action == "import_gis":
 		api = GisImport(args.project_db_file, del_ex)
 		api.insert_default()
@@ -95,16 +118,20 @@ if __name__ == '__main__':
 		cre_sta = True if args.create_stations == "y" else False
 
 		if args.import_type == "observed":
-			api = WeatherImport(args.project_db_file, del_ex, cre_sta)
+			api = WeatherImport(args.project_db_file, del_ex, cre_sta, args.weather_store)
 			api.import_data()
 		elif args.import_type == "observed2012":
-			api = Swat2012WeatherImport(args.project_db_file, del_ex, cre_sta, args.source_dir)
+			api = Swat2012WeatherImport(args.project_db_file, del_ex, cre_sta, args.source_dir, args.weather_workers, args.weather_store)
 			api.import_data()
 		elif args.import_type == "wgn":
 			api = WgnImport(args.project_db_file, del_ex, cre_sta, args.import_method, args.file1, args.file2)
 			api.import_data()
 	elif args.action == "read_output":
-		api = ReadOutput(args.output_files_dir, args.output_db_file, args.swat_version, args.editor_version, args.project_name)
+		try:
+			output_filter = OutputFilter(OutputFilter.parse_list(args.output_tables), OutputFilter.parse_list(args.output_exclude_tables), OutputFilter.parse_units(args.output_units), args.output_start_date, args.output_end_date)
+		except ValueError as e:
+			sys.exit(e)
+		api = ReadOutput(args.output_files_dir, args.output_db_file, args.swat_version, args.editor_version, args.project_name, args.output_workers, args.output_format, args.output_dataset_dir, args.output_summaries, output_filter)
 		api.read()
 	elif args.action == "write_files":
 		api = WriteFiles(args.project_db_file, args.swat_version)
@@ -126,7 +153,7 @@ if __name__ == '__main__':
 			api = CreateProjectDb(args.db_file, args.db_file2, project_name, editor_version)
 			api.create()
 		elif args.db_type == "ssurgo_soils":
-			soils.db.init(args.db_file)
+			db_lib.init_db(soils.db, args.db_file, db_lib.REFERENCE_PROFILE)
 			api = soils.ImportSoils()
 			api.ssurgo(args.db_file2)
 	elif args.action == "import_csv" or args.action == "export_csv" or args.action == "export_text":
@@ -151,7 +178,12 @@ if __name__ == '__main__':
 			args.weather_dir, args.weather_save_dir, args.weather_import_format,
 			args.wgn_import_method, args.wgn_db, args.wgn_table, args.wgn_csv_sta_file, args.wgn_csv_mon_file,
 			args.year_start, args.day_start, args.year_end, args.day_end,
-			args.input_files_dir)
+			args.input_files_dir, args.swat_version, args.follow_output, args.output_format)
+	elif args.action == "run_ensemble":
+		api = RunEnsemble(args.project_db_file, args.editor_version, args.swat_exe_file, args.weather_sources, args.weather_import_format,
+			args.ensemble_dir, args.ensemble_workers, args.year_start, args.day_start, args.year_end, args.day_end,
+			args.swat_version, args.output_format)
+		api.run()
 	elif args.action == "save_scenario":
 		api = LoadScenarios()
 		api.save(args.project_db_file, args.input_files_dir, args.output_files_dir, args.project_name)
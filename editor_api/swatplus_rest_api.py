@@ -2,9 +2,10 @@ from flask import Flask, request
 from flask_restful import Resource, Api
 from flask_cors import CORS
 
-from rest import setup, simulation, auto_complete, climate, routing_unit, hru_parm_db, channel, definitions, aquifer, reservoir, hydrology, hru, exco, dr, lum, init, ops, basin, soils, regions, change, recall, decision_table, structural, check
+from rest import setup, simulation, auto_complete, climate, routing_unit, hru_parm_db, channel, definitions, aquifer, reservoir, hydrology, hru, exco, dr, lum, init, ops, basin, soils, regions, change, recall, decision_table, structural, check, jobs
 
 from helpers.executable_api import Unbuffered
+from database import lib as db_lib
 import sys
 import argparse
 import platform
@@ -21,6 +22,10 @@ CORS(app)
 
 app.url_map.converters['everything'] = EverythingConverter
 
+@app.teardown_request
+def release_connections(exc):
+	db_lib.release_connections()
+
 def shutdown_server():
     func = request.environ.get('werkzeug.server.shutdown')
     if func is None:
@@ -38,6 +43,7 @@ class SwatPlusApi(Resource):
 
 class SwatPlusShutdownApi(Resource):
 	def get(self):
+		jobs.manager.shutdown()
 		shutdown_server()
 		return {'SWATPlusEditor': 'Server shutting down...'}
 
@@ -53,6 +59,9 @@ api.add_resource(SwatPlusShutdownApi, '/shutdown')
 
 api.add_resource(check.SwatCheckApi, '/output/check')
 
+api.add_resource(jobs.JobListApi, '/jobs')
+api.add_resource(jobs.JobApi, '/jobs/<id>')
+
 api.add_resource(setup.SetupApi, '/setup')
 api.add_resource(setup.ConfigApi, '/setup/config/<everything:project_db>')
 api.add_resource(setup.CheckImportConfigApi, '/setup/check-config/<everything:project_db>')
@@ -570,5 +579,11 @@ if __name__ == '__main__':
 	sys.stdout = Unbuffered(sys.stdout)
 	parser = argparse.ArgumentParser(description="SWAT+ Editor REST API")
 	parser.add_argument("port", type=str, help="port number to run API", default=5000, nargs="?")
+	parser.add_argument("--max_jobs", type=int, help="number of background jobs run at the same time (default up to 4)", nargs="?")
+	parser.add_argument("--max_databases", type=int, help="number of databases kept open between requests (default 8)", default=8, nargs="?")
 	args = parser.parse_args()
+	db_lib.set_default_profile(db_lib.INTERACTIVE_PROFILE)
+	db_lib.use_registry(max(1, args.max_databases))
+	if args.max_jobs is not None:
+		jobs.manager = jobs.JobManager(args.max_jobs)
 	app.run(port=int(args.port))
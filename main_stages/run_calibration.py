@@ -26,6 +26,7 @@ sys.argv[1] = sys.argv[1].replace("\\\\", "/")
 sys.argv[1] = sys.argv[1].replace("\\", "/")
 
 from helper_functions import read_from, write_to, copy_directory, clear_directory
+from output_cache import read_output
 import pandas
 import pystran as py
 import config
@@ -127,8 +128,9 @@ def run_parameter_set(parameter_set_list, core_number, chg_typ_dict, header, cal
 
         # extract flow for specified unit at specified timestep
 
-        sim_results = read_from("{working_dir}/{core}/channel_sd_day.csv".format(
-            working_dir=working_dir, core=core_number))[3:]
+        # rewritten by every run, so caching it would only add writes
+        sim_results = read_output("{working_dir}/{core}/channel_sd_day.csv".format(
+            working_dir=working_dir, core=core_number), use_cache=False)
 
         simulated_string = "Date,Simulated\n"
 
@@ -139,15 +141,16 @@ def run_parameter_set(parameter_set_list, core_number, chg_typ_dict, header, cal
             results_index = 9
 
         if not results_index is None:
-            for r_line in sim_results:
-                if r_line.split(",")[4] == str(unit_number):
-                    day_val = r_line.split(",")[2]
-                    simulated_string += "{dd}/{mm}/{yy},{val}\n".format(
-                        dd=day_val,
-                        mm=r_line.split(",")[1],
-                        yy=r_line.split(",")[3],
-                        val=r_line.split(",")[results_index],
-                    )
+            unit_rows = sim_results.rows(units=[unit_number])
+            for day_val, mon_val, yr_val, sim_val in zip(
+                    sim_results.column(2)[unit_rows], sim_results.column(1)[unit_rows],
+                    sim_results.column(3)[unit_rows], sim_results.column(results_index)[unit_rows]):
+                simulated_string += "{dd}/{mm}/{yy},{val}\n".format(
+                    dd=day_val,
+                    mm=mon_val,
+                    yy=yr_val,
+                    val=sim_val,
+                )
 
             simulated_fn = "{working_dir}/{core}/simulated.csv".format(
                 working_dir=working_dir, core=core_number)
@@ -13,25 +13,56 @@ import sys
 
 sys.path.insert(0, os.path.join(os.environ["swatplus_wf_dir"], "packages"))
 sys.path.insert(0, sys.argv[1])
+sys.path.append(os.path.join(os.environ["swatplus_wf_dir"], "editor_api"))
 
 import geopandas
 import config
 from logger import log
 from helper_functions import read_from, clear_directory, rasterise, show_progress
+from output_cache import read_output
 
 
 class wb_result:
-    def __init__(self, wb_parts):
-        self.unit = wb_parts[4]
-        self.precip = wb_parts[7]
-        self.surq_gen = wb_parts[10]
-        self.latq = wb_parts[11]
-        self.wateryld = wb_parts[12]
-        self.perc = wb_parts[13]
-        self.et = wb_parts[14]
-        self.cn = wb_parts[19]
-        self.pet = wb_parts[23]
-        self.irr = wb_parts[25]
+    def __init__(self, wb_table, row):
+        self.unit = wb_table["unit"][row]
+        self.precip = wb_table["precip"][row]
+        self.surq_gen = wb_table["surq_gen"][row]
+        self.latq = wb_table["latq"][row]
+        self.wateryld = wb_table["wateryld"][row]
+        self.perc = wb_table["perc"][row]
+        self.et = wb_table["et"][row]
+        self.cn = wb_table["cn"][row]
+        self.pet = wb_table["pet"][row]
+        self.irr = wb_table["irr"][row]
+
+
+class dataset_table:
+    def __init__(self, data_frame):
+        self.data_frame = data_frame.reset_index(drop=True)
+
+    def __getitem__(self, column):
+        return self.data_frame[column].to_numpy()
+
+    def first_by_unit(self, key_columns=["unit"]):
+        keys = self.data_frame[key_columns].astype("int64").drop_duplicates()
+        return {str(key[0]) if len(key_columns) == 1 else tuple(str(k) for k in key): i
+                for i, key in zip(keys.index, keys.itertuples(index=False))}
+
+
+def read_wb_output(filename):
+    '''
+    read a water balance output table from the parquet dataset imported by the editor
+    when it is newer than the text file, otherwise from the text file
+    '''
+    name = os.path.splitext(os.path.basename(filename))[0]
+    table_dir = os.path.join(output_dataset_dir, name)
+    if os.path.isdir(table_dir) and os.path.getmtime(table_dir) >= os.path.getmtime(filename):
+        try:
+            from helpers.columnar_output import read_table
+            return dataset_table(read_table(output_dataset_dir, name))
+        except ValueError as e:
+            log.info(" - could not read {0} from the parquet dataset: {1}".format(name, e), keep_log)
+    return read_output(filename)
 
 
 if config.Model_2_config:
@@ -66,6 +97,8 @@ aa_hru_wb_file = "{base}/{model_name}/Scenarios/Default/TxtInOut/hru_wb_aa.txt".
     base=base, model_name=config.Project_Name)
 yr_hru_wb_file = "{base}/{model_name}/Scenarios/Default/TxtInOut/hru_wb_yr.txt".format(
     base=base, model_name=config.Project_Name)
+output_dataset_dir = "{base}/{model_name}/Scenarios/Default/Results/swatplus_output_parquet".format(
+    base=base, model_name=config.Project_Name)
 
 # lsunit
 print("\t-> looking for LSUs shapefile")
@@ -94,13 +127,10 @@ if os.path.isfile(lsus_shapefile):
 
         # read output data into dictionary
         log.info("reading annual average LSU results", keep_log)
-        wb_aa_data_list = read_from(aa_lsu_wb_file)
+        wb_aa_table = read_wb_output(aa_lsu_wb_file)
         wb_aa_data_dict = {}
-        for wb_aa_line in wb_aa_data_list[3:]:
-            wb_aa_line_parts = wb_aa_line.split()
-            lsu_no = wb_aa_line_parts[4]
-            if not lsu_no in wb_aa_data_dict:
-                wb_aa_data_dict[lsu_no] = wb_result(wb_aa_line_parts)
+        for lsu_no, wb_aa_row in wb_aa_table.first_by_unit().items():
+            wb_aa_data_dict[lsu_no] = wb_result(wb_aa_table, wb_aa_row)
 
         # add output to shapefile
         log.info("mapping annual average LSU results", keep_log)
@@ -177,18 +207,12 @@ if os.path.isfile(lsus_shapefile):
 
         # read output data into dictionary
         log.info("reading yearly LSU results", keep_log)
-        wb_yr_data_list = read_from(yr_lsu_wb_file)
+        wb_yr_table = read_wb_output(yr_lsu_wb_file)
         wb_yr_data_dict = {}
-        for wb_yr_line in wb_yr_data_list[3:]:
-            wb_yr_line_parts = wb_yr_line.split()
-
-            year = wb_yr_line_parts[3]
+        for (year, lsu_no), wb_yr_row in wb_yr_table.first_by_unit(["yr", "unit"]).items():
             if not year in wb_yr_data_dict:
                 wb_yr_data_dict[year] = {}
-
-            lsu_no = wb_yr_line_parts[4]
-            if not lsu_no in wb_yr_data_dict[year]:
-                wb_yr_data_dict[year][lsu_no] = wb_result(wb_yr_line_parts)
+            wb_yr_data_dict[year][lsu_no] = wb_result(wb_yr_table, wb_yr_row)
 
         # add output to shapefile
         log.info("mapping LSU results for each year", keep_log)
@@ -287,13 +311,10 @@ if os.path.isfile(hrus_shapefile):
 
         # read output data into dictionary
         log.info("reading annual average HRU results", keep_log)
-        wb_aa_data_list = read_from(aa_hru_wb_file)
+        wb_aa_table = read_wb_output(aa_hru_wb_file)
         wb_aa_data_dict = {}
-        for wb_aa_line in wb_aa_data_list[3:]:
-            wb_aa_line_parts = wb_aa_line.split()
-            hru_no = wb_aa_line_parts[4]
-            if not hru_no in wb_aa_data_dict:
-                wb_aa_data_dict[hru_no] = wb_result(wb_aa_line_parts)
+        for hru_no, wb_aa_row in wb_aa_table.first_by_unit().items():
+            wb_aa_data_dict[hru_no] = wb_result(wb_aa_table, wb_aa_row)
 
         # add output to shapefile
         log.info("mapping annual average HRU results", keep_log)
@@ -371,18 +392,12 @@ if os.path.isfile(hrus_shapefile):
 
         # read output data into dictionary
         log.info("reading yearly HRU results", keep_log)
-        wb_yr_data_list = read_from(yr_hru_wb_file)
+        wb_yr_table = read_wb_output(yr_hru_wb_file)
         wb_yr_data_dict = {}
-        for wb_yr_line in wb_yr_data_list[3:]:
-            wb_yr_line_parts = wb_yr_line.split()
-
-            year = wb_yr_line_parts[3]
+        for (year, hru_no), wb_yr_row in wb_yr_table.first_by_unit(["yr", "unit"]).items():
             if not year in wb_yr_data_dict:
                 wb_yr_data_dict[year] = {}
-
-            hru_no = wb_yr_line_parts[4]
-            if not hru_no in wb_yr_data_dict[year]:
-                wb_yr_data_dict[year][hru_no] = wb_result(wb_yr_line_parts)
+            wb_yr_data_dict[year][hru_no] = wb_result(wb_yr_table, wb_yr_row)
 
         # add output to shapefile
         log.info("mapping HRU results for each year", keep_log)
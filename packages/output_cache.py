@@ -0,0 +1,221 @@
+'''
+date        : 19/10/2026
+description : this module reads SWAT+ output files through a binary cache
+              so they are parsed once for all post-processing steps
+
+licence     : MIT 2020
+'''
+
+import os
+import json
+import shutil
+import hashlib
+
+import numpy
+import pandas
+
+# outside the model folders, so caches are not copied with TxtInOut into scenarios or calibration runs
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "swatplus_output")
+CACHE_VERSION = 2
+
+
+class output_table:
+    '''
+    columns of one SWAT+ output file, memory-mapped from the cache.
+    values are read from disk only when a column is used. a table read
+    without the cache holds its arrays in memory instead
+    '''
+    def __init__(self, cache_path, meta, arrays=None):
+        self.cache_path = cache_path
+        self.columns = meta["columns"]
+        self.row_count = meta["rows"]
+        self.__arrays = arrays
+        self.__loaded = {}
+        self.__index = None
+
+    def __load(self, name, mmap_mode=None):
+        if self.__arrays is not None:
+            return self.__arrays[name]
+        return numpy.load(os.path.join(self.cache_path, "{0}.npy".format(name)), mmap_mode=mmap_mode)
+
+    def __has(self, name):
+        if self.__arrays is not None:
+            return name in self.__arrays
+        return os.path.isfile(os.path.join(self.cache_path, "{0}.npy".format(name)))
+
+    def __len__(self):
+        return self.row_count
+
+    def column(self, key):
+        '''
+        key: column name or position in the file
+        '''
+        index = key if isinstance(key, int) else self.columns.index(key)
+        if not index in self.__loaded:
+            self.__loaded[index] = self.__load("c{0}".format(index), mmap_mode="r")
+        return self.__loaded[index]
+
+    def __getitem__(self, key):
+        return self.column(key)
+
+    def unit_index(self):
+        if self.__index is None:
+            self.__index = (
+                self.__load("units"),
+                self.__load("unit_starts"),
+                self.__load("order", mmap_mode="r"),
+            )
+        return self.__index
+
+    def rows(self, units=None, start_date=None, end_date=None):
+        '''
+        positions of the rows for the given units and dates, in file order.
+        dates are integers as yyyymmdd
+        '''
+        if units is None:
+            selected = numpy.arange(self.row_count)
+        else:
+            unit_values, unit_starts, order = self.unit_index()
+            parts = []
+            for unit in units:
+                i = numpy.searchsorted(unit_values, int(unit))
+                if i < len(unit_values) and unit_values[i] == int(unit):
+                    end = unit_starts[i + 1] if i + 1 < len(unit_starts) else self.row_count
+                    parts.append(order[unit_starts[i]:end])
+            selected = numpy.sort(numpy.concatenate(parts)) if len(parts) > 0 else numpy.array([], dtype=numpy.int64)
+
+        if (start_date is not None or end_date is not None) and self.__has("date"):
+            dates = self.__load("date", mmap_mode="r")[selected]
+            mask = numpy.ones(len(selected), dtype=bool)
+            if start_date is not None:
+                mask &= dates >= start_date
+            if end_date is not None:
+                mask &= dates <= end_date
+            selected = selected[mask]
+        return selected
+
+    def first_by_unit(self, key_columns=["unit"]):
+        '''
+        dictionary of {key: row position} for the first row of each key, keys are strings
+        of the integer values of key_columns (a tuple when more than one column is used)
+        '''
+        keys = numpy.stack([numpy.asarray(self.column(c)).astype(numpy.int64) for c in key_columns], axis=1)
+        unique_keys, first_rows = numpy.unique(keys, axis=0, return_index=True)
+        result = {}
+        for key, i in sorted(zip(unique_keys.tolist(), first_rows.tolist()), key=lambda item: item[1]):
+            result[str(key[0]) if len(key_columns) == 1 else tuple(str(k) for k in key)] = i
+        return result
+
+
+def file_key(filename):
+    stats = os.stat(filename)
+    return {"path": os.path.abspath(filename), "size": stats.st_size, "mtime": stats.st_mtime_ns, "version": CACHE_VERSION}
+
+
+def get_cache_path(filename, cache_dir=None):
+    if cache_dir is None:
+        cache_dir = CACHE_DIR
+    path_hash = hashlib.sha1(os.path.abspath(filename).encode()).hexdigest()[:12]
+    return os.path.join(cache_dir, "{0}_{1}".format(os.path.basename(filename), path_hash))
+
+
+def parse_output_file(filename, start_line=4, header_line=2):
+    '''
+    read the data block of a SWAT+ output file (.txt or .csv) into a data frame.
+    Fortran overflow values (****) become NaN
+    '''
+    separator = "," if filename.lower().endswith(".csv") else r"\s+"
+    with open(filename, "r") as file_:
+        for i, line in enumerate(file_, 1):
+            if i == header_line:
+                names = [n.strip() for n in (line.split(",") if separator == "," else line.split())]
+                names = [n for n in names if n != ""]
+                break
+
+    data = pandas.read_csv(filename, sep=separator, header=None, skiprows=start_line - 1,
+                           skipinitialspace=True, engine="c", keep_default_na=False, na_values=["****"])
+    data = data.iloc[:, :len(names)]
+    data.columns = names[:data.shape[1]]
+
+    for column in data.columns:
+        if column != "name" and not pandas.api.types.is_numeric_dtype(data[column]):
+            numbers = pandas.to_numeric(data[column], errors="coerce")
+            if numbers.notna().any() or data[column].astype(str).str.contains("*", regex=False).all():
+                data[column] = numbers
+    return data
+
+
+def build_arrays(data):
+    '''
+    the arrays of a cached table by name: one per column, and the unit and date indexes
+    '''
+    arrays = {}
+    for i, column in enumerate(data.columns):
+        values = data.iloc[:, i]
+        if pandas.api.types.is_integer_dtype(values):
+            arrays["c{0}".format(i)] = values.to_numpy(dtype=numpy.int64)
+        elif pandas.api.types.is_numeric_dtype(values):
+            arrays["c{0}".format(i)] = values.to_numpy(dtype=numpy.float64)
+        else:
+            arrays["c{0}".format(i)] = values.fillna("").to_numpy(dtype=str)
+
+    columns = list(data.columns)
+    if "unit" in columns:
+        units = data["unit"].fillna(-1).to_numpy(dtype=numpy.int64)
+        order = numpy.argsort(units, kind="stable")
+        arrays["order"] = order
+        arrays["units"], arrays["unit_starts"] = numpy.unique(units[order], return_index=True)
+
+    if "yr" in columns:
+        dates = data["yr"].fillna(0).to_numpy(dtype=numpy.int64) * 10000
+        if "mon" in columns and "day" in columns:
+            dates += data["mon"].fillna(0).to_numpy(dtype=numpy.int64) * 100 + data["day"].fillna(0).to_numpy(dtype=numpy.int64)
+        arrays["date"] = dates
+    return arrays
+
+
+def build_cache(filename, cache_path, key, start_line=4, header_line=2):
+    data = parse_output_file(filename, start_line, header_line)
+
+    temp_path = "{0}.tmp{1}".format(cache_path, os.getpid())
+    if os.path.isdir(temp_path):
+        shutil.rmtree(temp_path)
+    os.makedirs(temp_path)
+
+    for name, array in build_arrays(data).items():
+        numpy.save(os.path.join(temp_path, "{0}.npy".format(name)), array)
+
+    meta = dict(key, columns=list(data.columns), rows=len(data))
+    with open(os.path.join(temp_path, "meta.json"), "w") as meta_file:
+        json.dump(meta, meta_file)
+
+    if os.path.isdir(cache_path):
+        shutil.rmtree(cache_path)
+    os.rename(temp_path, cache_path)
+    return meta
+
+
+def read_output(filename, start_line=4, header_line=2, cache_dir=None, use_cache=True):
+    '''
+    open a SWAT+ output file through the cache. the file is parsed again only when
+    its path, size or modification time has changed since it was cached.
+    use_cache=False parses the file into memory without writing a cache, for
+    files that are rewritten before every read
+    '''
+    if not use_cache:
+        data = parse_output_file(filename, start_line, header_line)
+        return output_table(None, {"columns": list(data.columns), "rows": len(data)}, build_arrays(data))
+
+    key = file_key(filename)
+    cache_path = get_cache_path(filename, cache_dir)
+    meta = None
+    meta_fn = os.path.join(cache_path, "meta.json")
+    if os.path.isfile(meta_fn):
+        with open(meta_fn, "r") as meta_file:
+            meta = json.load(meta_file)
+        if any(meta.get(k) != v for k, v in key.items()):
+            meta = None
+
+    if meta is None:
+        meta = build_cache(filename, cache_path, key, start_line, header_line)
+    return output_table(cache_path, meta)